@@ -0,0 +1,384 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from cryptography.exceptions import InvalidTag
+from protocol import (
+    MSG_COMMAND, MSG_METADATA, MSG_HELLO, MSG_HANDSHAKE, HEADER_SIZE, pack_header, unpack_header
+)
+from secure_channel import HandshakeError, StreamKeyring, load_identity, public_bytes, fingerprint, server_handshake
+from metadata import encode_metadata
+from frame_encoder import FrameEncoder, DEFAULT_PROFILE, resolve_profile
+from tile_codec import TileEncoder
+
+HANDSHAKE_TIMEOUT = 10.0
+
+class AsyncClientWriter:
+    """Latest-frame sender for one client, running as a task on the server loop"""
+
+    def __init__(self, writer, address, session_cipher, metrics=None):
+        self.writer = writer
+        self.address = address
+        self.session_cipher = session_cipher
+        self.metrics = metrics
+        self.is_running = True
+        self.logger = logging.getLogger(__name__)
+
+        self._pending = None
+        self._key_message = None
+        self._ready = asyncio.Event()
+
+        # Subscriptions, changed by the client with a 'subscribe' command
+        self.wants_video = True
+        self.wants_metadata = True
+        self.profile = DEFAULT_PROFILE
+        self.mode = 'full'  # 'full' frames or 'delta' tile updates
+        self.needs_resync = True
+
+        # Statistics
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self.last_sent_sequence = 0
+        self.behind_since = None
+
+    def offer(self, sequence, messages, resync=None, droppable=True):
+        """Queue a frame's (header, payload) messages, replacing any frame not picked up yet.
+
+        Same delta-stream contract as ClientWriter.offer in security_server.
+        """
+        if self._pending is not None:
+            self.frames_dropped += 1
+            if self.behind_since is None:
+                self.behind_since = time.monotonic()
+            if not self._pending[2]:
+                self.needs_resync = True
+        if self.mode == 'delta' and self.needs_resync:
+            if resync is None:
+                # No keyframe was encoded for this frame, wait for the next one
+                return
+            messages = resync()
+            if messages is None:
+                return
+            self.needs_resync = False
+            droppable = False
+        self._pending = (sequence, messages, droppable)
+        self._ready.set()
+
+    def set_stream_key(self, message):
+        """Queue a sealed MSG_KEY, sent ahead of any frame still pending"""
+        self._key_message = message
+        self._ready.set()
+
+    async def run(self):
+        """Write pending frames, waiting on drain() so a slow client only delays itself"""
+        try:
+            while self.is_running:
+                await self._ready.wait()
+                self._ready.clear()
+                if self._key_message is not None:
+                    self.writer.write(self._key_message[0])
+                    self.writer.write(self._key_message[1])
+                    self._key_message = None
+                    if self._pending is None:
+                        await self.writer.drain()
+                if self._pending is None:
+                    continue
+                sequence, messages, _ = self._pending
+                self._pending = None
+
+                start = time.perf_counter()
+                for header, payload in messages:
+                    self.writer.write(header)
+                    self.writer.write(payload)
+                await self.writer.drain()
+                if self.metrics:
+                    self.metrics.record('send', time.perf_counter() - start)
+
+                self.frames_sent += 1
+                self.bytes_sent += sum(len(header) + len(payload) for header, payload in messages)
+                self.last_sent_sequence = sequence
+                if self._pending is None:
+                    self.behind_since = None
+        except (ConnectionError, OSError) as e:
+            self.logger.info(f"Client {self.address} write failed: {str(e)}")
+        finally:
+            self.close()
+
+    def lag_seconds(self):
+        """How long the client has continuously had frames waiting"""
+        return 0.0 if self.behind_since is None else time.monotonic() - self.behind_since
+
+    def stats(self, latest_sequence):
+        """Per-client lag and drop statistics"""
+        return {
+            'address': self.address,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'bytes_sent': self.bytes_sent,
+            'lag_frames': max(0, latest_sequence - self.last_sent_sequence),
+            'lag_seconds': self.lag_seconds(),
+        }
+
+    def close(self):
+        """Stop the writer and drop the connection"""
+        self.is_running = False
+        self._pending = None
+        self._ready.set()
+        self.writer.transport.abort()
+
+class AsyncSecurityServer:
+    """asyncio version of SecurityServer with the same start/broadcast_frame/stop surface.
+
+    All connections are served by one event loop on a background thread;
+    broadcast_frame may be called from any other thread.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5000, max_client_lag=5.0, backlog=1024,
+                 identity_path=None, stream_key_lifetime=600.0, metrics=None):
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.max_client_lag = max_client_lag
+        self.clients = {}  # only touched from the loop thread
+        self.evicted_clients = 0
+        self.is_running = False
+        # metrics.Metrics for encode/seal/send timings, None to skip them
+        self.metrics = metrics
+        self.logger = logging.getLogger(__name__)
+
+        self.loop = None
+        self._server = None
+        self._thread = None
+
+        # Same key scheme as SecurityServer: per-session keys from an authenticated
+        # handshake, frames sealed once with the shared stream key
+        self.identity = load_identity(identity_path)
+        self.fingerprint = fingerprint(public_bytes(self.identity))
+        self.keyring = StreamKeyring(stream_key_lifetime)
+        self.frame_sequence = 0
+        self.frame_listeners = []
+        self.encoder = FrameEncoder()
+        self.tile_encoder = TileEncoder()
+
+    def start(self):
+        """Start the event loop thread and begin accepting clients"""
+        try:
+            self.loop = asyncio.new_event_loop()
+            started = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(started,))
+            self._thread.daemon = True
+            self._thread.start()
+            started.wait()
+            if not self._server:
+                raise RuntimeError("listening socket could not be opened")
+            self.is_running = True
+            self.logger.info(f"Async server started on {self.host}:{self.port}, identity {self.fingerprint}")
+        except Exception as e:
+            self.logger.error(f"Failed to start server: {str(e)}")
+
+    def _run_loop(self, started):
+        """Body of the event loop thread"""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(asyncio.start_server(
+                self._handle_client, self.host, self.port, backlog=self.backlog
+            ))
+        except Exception as e:
+            self.logger.error(f"Failed to listen on {self.host}:{self.port}: {str(e)}")
+        finally:
+            started.set()
+        if self._server:
+            self.loop.run_forever()
+        self.loop.close()
+
+    async def _handle_client(self, reader, writer):
+        """Run the handshake, register a writer task and read commands until disconnect"""
+        address = writer.get_extra_info('peername')
+        client = None
+        try:
+            header, hello = await asyncio.wait_for(self._read_message(reader), HANDSHAKE_TIMEOUT)
+            if header.msg_type != MSG_HELLO:
+                raise HandshakeError("Client did not start the handshake")
+            reply, send_cipher, receive_cipher = server_handshake(self.identity, hello)
+            writer.write(pack_header(MSG_HANDSHAKE, 0, len(reply)))
+            writer.write(reply)
+            await writer.drain()
+
+            client = AsyncClientWriter(writer, address, send_cipher, self.metrics)
+            client.set_stream_key(self.keyring.key_message(send_cipher))
+            self.clients[writer] = client
+            self.loop.create_task(client.run())
+
+            while self.is_running:
+                header, payload = await self._read_message(reader)
+                if header.msg_type != MSG_COMMAND:
+                    continue
+                try:
+                    decrypted = receive_cipher.open(header, payload)
+                except InvalidTag:
+                    self.logger.warning(f"Dropping unauthenticated command from {address}")
+                    continue
+                command = json.loads(bytes(decrypted).decode('utf-8'))
+                self.logger.debug(f"Command from {address}: {command}")
+                self._handle_command(client, command)
+
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error handling client {address}: {str(e)}")
+        finally:
+            self.clients.pop(writer, None)
+            if client:
+                client.close()
+            else:
+                writer.transport.abort()
+
+    async def _read_message(self, reader):
+        header = unpack_header(await reader.readexactly(HEADER_SIZE))
+        return header, await reader.readexactly(header.length)
+
+    def _handle_command(self, client, command):
+        """Apply a command received from a client"""
+        if not isinstance(command, dict):
+            return
+        data = command.get('data')
+        if command.get('type') != 'command' or not isinstance(data, dict):
+            return
+        if data.get('action') == 'subscribe':
+            client.wants_video = bool(data.get('video', True))
+            client.wants_metadata = bool(data.get('metadata', True))
+            client.profile = resolve_profile(data.get('profile', DEFAULT_PROFILE))
+            client.mode = 'delta' if data.get('mode') == 'delta' else 'full'
+            client.needs_resync = True
+        elif data.get('action') == 'resync':
+            client.needs_resync = True
+
+    def broadcast_frame(self, frame, verdicts=None, timestamp_ns=None, metadata=None):
+        """Encode on the calling thread and hand the messages to every client writer.
+
+        timestamp_ns and metadata are as in SecurityServer.broadcast_frame.
+        """
+        if not self.is_running:
+            return
+        try:
+            start = time.perf_counter()
+            self.frame_sequence += 1
+            sequence = self.frame_sequence
+            rotated = self.keyring.rotate_if_due()
+            seal = self.keyring.cipher.seal
+            # Reading subscriptions off-loop only decides which profiles to encode;
+            # a client whose profile is missing this once just skips a frame
+            video_clients = [client for client in list(self.clients.values()) if client.wants_video]
+            profiles = {client.profile for client in video_clients if client.mode == 'full'}
+            if timestamp_ns is None:
+                timestamp_ns = time.time_ns()
+            encoded = self.encoder.encode_profiles(
+                frame, sequence, list(profiles) + [profile for _, profile in self.frame_listeners],
+                timestamp_ns
+            )
+            delta_message = keyframe = None
+            heartbeat = False
+            if any(client.mode == 'delta' for client in video_clients):
+                delta_message = self.tile_encoder.encode(frame, sequence, timestamp_ns)
+                # Encoded here rather than lazily so the event loop never runs a JPEG encode
+                if any(client.needs_resync for client in video_clients):
+                    keyframe = self.tile_encoder.keyframe_message(frame, sequence, timestamp_ns)
+            encoded_at = time.perf_counter()
+            self._notify_listeners(timestamp_ns, encoded)
+            # Sealed in the order they are sent, metadata first, since clients refuse a
+            # stream key counter that does not go up
+            metadata_message = None
+            if metadata is None and verdicts is not None:
+                metadata = encode_metadata(verdicts, frame.shape)
+            if metadata is not None:
+                metadata_message = seal(pack_header(MSG_METADATA, sequence, len(metadata), timestamp_ns), metadata)
+            frame_messages = {profile: seal(*encoded[profile]) for profile in profiles if profile in encoded}
+            if delta_message:
+                heartbeat = len(delta_message[1]) == 0
+                delta_message = seal(*delta_message)
+            if keyframe:
+                keyframe = seal(*keyframe)
+            self.loop.call_soon_threadsafe(
+                self._offer_all, sequence, frame_messages, delta_message, heartbeat, keyframe,
+                metadata_message, rotated
+            )
+            if self.metrics:
+                self.metrics.record('encode', encoded_at - start)
+                self.metrics.record('seal', time.perf_counter() - encoded_at)
+                self.metrics.record('server', (time.time_ns() - timestamp_ns) / 1e9)
+        except Exception as e:
+            self.logger.error(f"Error broadcasting frame: {str(e)}")
+
+    def add_frame_listener(self, listener, profile=DEFAULT_PROFILE):
+        """Same as SecurityServer.add_frame_listener; listeners run on the broadcasting thread"""
+        self.frame_listeners.append((listener, resolve_profile(profile)))
+
+    def _notify_listeners(self, timestamp_ns, encoded):
+        for listener, profile in self.frame_listeners:
+            message = encoded.get(profile)
+            if message is None:
+                continue
+            try:
+                listener(timestamp_ns, message[1])
+            except Exception as e:
+                self.logger.error(f"Frame listener failed: {str(e)}")
+
+    def _offer_all(self, sequence, frame_messages, delta_message, heartbeat, keyframe,
+                   metadata_message, rotated):
+        """Runs on the loop: queue the shared messages for every client, evicting laggards"""
+        for client in list(self.clients.values()):
+            if rotated:
+                client.set_stream_key(self.keyring.key_message(client.session_cipher))
+            if client.lag_seconds() > self.max_client_lag:
+                self.logger.warning(f"Evicting slow client {client.address}: {client.stats(sequence)}")
+                self.evicted_clients += 1
+                self.clients.pop(client.writer, None)
+                client.close()
+                continue
+            messages = []
+            if metadata_message and client.wants_metadata:
+                messages.append(metadata_message)
+            if client.wants_video and client.mode == 'delta':
+                if delta_message:
+                    resync = (lambda prefix=messages: prefix + [keyframe]) if keyframe else None
+                    client.offer(sequence, messages + [delta_message], resync=resync,
+                                 droppable=heartbeat)
+                continue
+            frame_message = frame_messages.get(client.profile)
+            if frame_message and client.wants_video:
+                messages.append(frame_message)
+            if messages:
+                client.offer(sequence, messages)
+
+    def client_stats(self):
+        """Lag and drop statistics for every connected client"""
+        if not self.is_running:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._collect_stats(), self.loop)
+        return future.result(timeout=5)
+
+    async def _collect_stats(self):
+        return [client.stats(self.frame_sequence) for client in self.clients.values()]
+
+    async def _shutdown(self):
+        """Close the listener and every client connection"""
+        self._server.close()
+        for client in list(self.clients.values()):
+            client.close()
+        self.clients.clear()
+        await self._server.wait_closed()
+
+    def stop(self):
+        """Stop the server and its event loop"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=5)
+        except Exception as e:
+            self.logger.error(f"Error during shutdown: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.logger.info("Server stopped")
@@ -0,0 +1,146 @@
+"""Loopback load test for AsyncSecurityServer.
+
+Starts the server in this process (pinned to one core where the OS allows it),
+connects N viewers from a separate process and broadcasts synthetic frames:
+
+    python bench_async_server.py --clients 500 --seconds 10 --fps 15
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import numpy as np
+from async_security_server import AsyncSecurityServer
+from protocol import MSG_FRAME, MSG_HELLO, HEADER_SIZE, pack_header, unpack_header
+from secure_channel import ClientHandshake
+
+
+def raise_fd_limit(needed):
+    """Make room for one socket per viewer on systems with a low default limit"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+async def _viewer(host, port, deadline, results, connected):
+    """One loopback viewer: count frames and measure send-to-receive latency"""
+    frames = 0
+    latency_total = 0.0
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        results.append((0, 0.0, False))
+        return
+    connected.append(1)
+    try:
+        # Viewers only count frames, so they stop after the handshake reply
+        # and never decrypt; the server still does the full per-session work
+        hello = ClientHandshake().hello
+        writer.write(pack_header(MSG_HELLO, 0, len(hello)) + hello)
+        while time.time() < deadline:
+            header = unpack_header(await reader.readexactly(HEADER_SIZE))
+            await reader.readexactly(header.length)
+            if header.msg_type == MSG_FRAME:
+                frames += 1
+                latency_total += (time.time_ns() - header.timestamp_ns) / 1e9
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+    results.append((frames, latency_total, True))
+
+
+async def _run_viewers(host, port, clients, seconds):
+    deadline = time.time() + seconds
+    results = []
+    connected = []
+    tasks = []
+    for _ in range(clients):
+        tasks.append(asyncio.create_task(_viewer(host, port, deadline, results, connected)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def viewer_process(host, port, clients, seconds, queue):
+    """Entry point of the client-side process"""
+    raise_fd_limit(clients + 64)
+    results = asyncio.run(_run_viewers(host, port, clients, seconds))
+    queue.put(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    raise_fd_limit(args.clients + 64)
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+
+    server = AsyncSecurityServer(host="127.0.0.1", port=args.port)
+    server.start()
+    if not server.is_running:
+        raise SystemExit("Server failed to start")
+
+    queue = multiprocessing.Queue()
+    viewers = multiprocessing.Process(
+        target=viewer_process,
+        args=("127.0.0.1", args.port, args.clients, args.seconds, queue)
+    )
+    viewers.start()
+
+    # Wait until the viewers have connected before measuring
+    connect_deadline = time.monotonic() + 10
+    while len(server.clients) < args.clients and time.monotonic() < connect_deadline:
+        time.sleep(0.05)
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    interval = 1.0 / args.fps
+    broadcasts = 0
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    next_frame = wall_start
+    while viewers.is_alive() and time.monotonic() - wall_start < args.seconds:
+        server.broadcast_frame(frame)
+        broadcasts += 1
+        next_frame += interval
+        time.sleep(max(0.0, next_frame - time.monotonic()))
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    stats = server.client_stats()
+
+    results = queue.get(timeout=args.seconds + 30)
+    viewers.join()
+    server.stop()
+
+    connected = [r for r in results if r[2]]
+    frames = [r[0] for r in connected]
+    received = sum(frames)
+    latency = sum(r[1] for r in connected) / received if received else 0.0
+    print(f"viewers connected:      {len(connected)}/{args.clients}")
+    print(f"frames broadcast:       {broadcasts} ({broadcasts / wall:.1f} fps)")
+    if frames:
+        print(f"frames per viewer:      min {min(frames)}, mean {received / len(frames):.1f}")
+    print(f"delivery ratio:         {received / max(1, broadcasts * args.clients):.3f}")
+    print(f"mean latency:           {latency * 1000:.1f} ms")
+    print(f"frames dropped:         {sum(s['frames_dropped'] for s in stats)}")
+    print(f"evicted viewers:        {server.evicted_clients}")
+    print(f"server CPU:             {100 * cpu / wall:.0f}% of one core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Throughput of the old and new frame protection paths.
+
+old: JPEG -> base64 -> JSON -> Fernet (AES-CBC + HMAC + base64), and back
+new: JPEG sealed with AES-GCM, header as associated data, and opened again
+
+    python bench_crypto.py --iterations 200
+"""
+import argparse
+import base64
+import json
+import time
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+from protocol import MSG_FRAME, pack_header, unpack_header
+from secure_channel import MessageCipher
+
+RESOLUTIONS = {'320x240': (320, 240), '1080p': (1920, 1080)}
+
+
+def synthetic_frame(width, height, seed=0):
+    """Smooth noise with some edges, so the JPEG is about camera-sized"""
+    rng = np.random.default_rng(seed)
+    frame = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    cv2.rectangle(frame, (width // 4, height // 4), (width // 2, height // 2), (0, 0, 255), -1)
+    return frame
+
+
+def old_path(fernet, jpeg):
+    token = fernet.encrypt(json.dumps({
+        'type': 'frame',
+        'data': base64.b64encode(jpeg).decode('utf-8'),
+    }).encode('utf-8'))
+    message = json.loads(fernet.decrypt(token).decode('utf-8'))
+    return len(token), base64.b64decode(message['data'])
+
+
+def new_path(sender, receiver, jpeg):
+    header, payload = sender.seal(pack_header(MSG_FRAME, 1, len(jpeg)), jpeg)
+    opened = receiver.open(unpack_header(header), payload)
+    return len(header) + len(payload), opened
+
+
+def measure(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        wire_bytes, _ = func()
+    return (time.perf_counter() - start) / iterations, wire_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--quality", type=int, default=95)
+    args = parser.parse_args()
+
+    fernet = Fernet(Fernet.generate_key())
+    key = bytes(32)
+    sender, receiver = MessageCipher(key, 2), MessageCipher(key, 2)
+
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = synthetic_frame(width, height)
+        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+        jpeg = buffer.tobytes()
+
+        # Both paths must hand the receiver the exact JPEG
+        assert old_path(fernet, jpeg)[1] == jpeg
+        assert bytes(new_path(sender, receiver, jpeg)[1]) == jpeg
+
+        old_seconds, old_bytes = measure(lambda: old_path(fernet, jpeg), args.iterations)
+        new_seconds, new_bytes = measure(lambda: new_path(sender, receiver, jpeg), args.iterations)
+        megabytes = len(jpeg) / 1e6
+        print(f"{name}: JPEG {len(jpeg) / 1024:.1f} KiB")
+        print(f"  old  {old_seconds * 1e3:8.3f} ms/frame  {megabytes / old_seconds:8.1f} MB/s  "
+              f"wire {old_bytes / 1024:.1f} KiB (+{old_bytes / len(jpeg) - 1:.0%})")
+        print(f"  new  {new_seconds * 1e3:8.3f} ms/frame  {megabytes / new_seconds:8.1f} MB/s  "
+              f"wire {new_bytes / 1024:.1f} KiB (+{new_bytes - len(jpeg)} B)")
+        print(f"  speedup {old_seconds / new_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
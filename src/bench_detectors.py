@@ -0,0 +1,126 @@
+"""Latency and agreement of the detector backends on recorded footage.
+
+Runs every backend over the same frames and compares person boxes with the
+first backend, which serves as the reference:
+
+    python bench_detectors.py --recording recordings --backends ultralytics,onnxruntime,opencv
+    python bench_detectors.py --video clip.mp4 --imgsz 320
+
+Footage is a video file or a Recorder directory. Export the ONNX model once
+with --export (needs ultralytics and onnx).
+"""
+import argparse
+import resource
+import time
+import cv2
+import numpy as np
+from detector_backends import PERSON_CLASS, create_backend, export_onnx
+from recorder import Recorder
+from tracker import iou_matrix, greedy_assignment
+
+
+def load_frames(args):
+    """Decode up to args.frames frames from a video file or a recording directory"""
+    frames = []
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        while len(frames) < args.frames:
+            success, frame = capture.read()
+            if not success:
+                break
+            frames.append(frame)
+        capture.release()
+    else:
+        for _, jpeg in Recorder(args.recording).frames(0, 2 ** 63):
+            frames.append(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR))
+            if len(frames) >= args.frames:
+                break
+    return frames
+
+
+def agreement(reference, detections, iou_threshold=0.5):
+    """(matched, reference boxes, candidate boxes) for person boxes over all frames"""
+    matched = total_reference = total_candidate = 0
+    for expected, found in zip(reference, detections):
+        score = iou_matrix(expected.xyxy, found.xyxy)
+        rows, _ = greedy_assignment(score, iou_threshold)
+        matched += len(rows)
+        total_reference += len(expected)
+        total_candidate += len(found)
+    return matched, total_reference, total_candidate
+
+
+def run_backend(name, model_path, frames, args):
+    """Load one backend and time it over the frames; returns its stats and per-frame person boxes"""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    backend = create_backend(name, model_path, imgsz=args.imgsz, conf_threshold=args.conf,
+                             classes=[PERSON_CLASS])
+    load_seconds = time.perf_counter() - start
+    for frame in frames[:args.warmup]:
+        backend.detect(frame)
+
+    wall, cpu, persons = [], [], []
+    for frame in frames:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        detections = backend.detect(frame)
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+        persons.append(detections.persons())
+    stats = {
+        'load_seconds': load_seconds,
+        'rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        'mean_ms': 1e3 * float(np.mean(wall)),
+        'p95_ms': 1e3 * float(np.percentile(wall, 95)),
+        'cpu_ms': 1e3 * float(np.mean(cpu)),
+        'persons_per_frame': float(np.mean([len(p) for p in persons])),
+    }
+    return stats, persons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--video")
+    source.add_argument("--recording", default="recordings")
+    parser.add_argument("--backends", default="ultralytics,onnxruntime,opencv")
+    parser.add_argument("--pt-model", default="yolov8n.pt")
+    parser.add_argument("--onnx-model", default="yolov8n.onnx")
+    parser.add_argument("--export", action="store_true", help="export --pt-model to ONNX first")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.export:
+        args.onnx_model = export_onnx(args.pt_model, args.imgsz)
+    frames = load_frames(args)
+    if not frames:
+        parser.error("no frames found in the footage")
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, imgsz {args.imgsz}")
+
+    reference = None
+    for name in args.backends.split(","):
+        model_path = args.pt_model if name == "ultralytics" else args.onnx_model
+        try:
+            stats, persons = run_backend(name, model_path, frames, args)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"{name:12s} skipped: {e}")
+            continue
+        line = (f"{name:12s} load {stats['load_seconds']:6.2f}s  rss +{stats['rss_growth_mb']:6.0f} MB  "
+                f"mean {stats['mean_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  cpu {stats['cpu_ms']:7.2f} ms  "
+                f"persons/frame {stats['persons_per_frame']:.2f}")
+        if reference is None:
+            reference = persons
+            line += "  (reference)"
+        else:
+            matched, expected, found = agreement(reference, persons)
+            recall = matched / expected if expected else 1.0
+            precision = matched / found if found else 1.0
+            line += f"  recall {recall:.3f}  precision {precision:.3f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
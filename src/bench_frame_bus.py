@@ -0,0 +1,145 @@
+"""Streamed and detected fps with the in-process pipeline and with the shared-memory frame bus.
+
+Runs the server's capture -> detect -> track -> broadcast path against a
+loopback viewer twice: once as the threaded pipeline of server_main, once
+with detection in its own process behind a FrameBus (server_main.FRAME_BUS):
+
+    python bench_frame_bus.py --model yolov8n.onnx --backend opencv --source synthetic:0 --fps 60
+
+Raise --fps above the camera rate you expect to find the ceiling of each mode.
+"""
+import argparse
+import functools
+import os
+import time
+import server_main
+from camera_manager import CameraManager
+from frame_bus import FrameBus, FrameBusCapture
+from frame_sources import VideoFileSource, open_source
+from object_detector import ObjectDetector
+from security_client import SecurityClient
+from security_server import SecurityServer
+from server_main import BusDetector, BusStreamer, ServerStages, build_bus_pipeline, build_pipeline
+
+
+def make_source(args):
+    """The benchmark source paced at --fps, whatever rate a video file was recorded at"""
+    if os.path.isfile(args.source):
+        return VideoFileSource(args.source, fps=args.fps)
+    return open_source(args.source, args.width, args.height, args.fps)
+
+
+def measure(server, args, detected):
+    """Watch the stream for --seconds; `detected` returns the number of frames the detector finished"""
+    port = server.server_socket.getsockname()[1]
+    client = SecurityClient(port=port, server_fingerprint=server.fingerprint)
+    try:
+        if not client.connect():
+            return {"skipped": "loopback client could not connect"}
+        deadline = time.perf_counter() + args.warmup
+        while time.perf_counter() < deadline:
+            client.get_latest_frame(0.05)
+        before = client.stats(reset_latency=True)
+        detected_before = detected()
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            client.get_latest_frame(0.05)
+        elapsed = time.perf_counter() - start
+        after = client.stats()
+        latency = after["latency"].get("glass_to_glass", {})
+        return {
+            "streamed_fps": (after["decoded"] - before["decoded"]) / elapsed,
+            "detected_fps": (detected() - detected_before) / elapsed,
+            "glass_to_glass_p50_ms": latency.get("p50_ms", 0.0),
+            "glass_to_glass_p95_ms": latency.get("p95_ms", 0.0),
+        }
+    finally:
+        client.stop()
+
+
+def bench_pipeline(args, detector_factory):
+    """Threaded pipeline of server_main: the stream runs at the detector's pace"""
+    server_main.ROI_DETECTION = False
+    camera = CameraManager(args.width, args.height, args.fps, source=make_source(args))
+    server = SecurityServer(host="127.0.0.1", port=0)
+    pipeline = None
+    try:
+        if not camera.initialize_camera() or not camera.start_capture():
+            return {"skipped": "source could not be opened"}
+        server.start()
+        stages = ServerStages(camera, server, detector_factory())
+        pipeline = build_pipeline(stages)
+        pipeline.start()
+        detect_stage = pipeline.stages[1]
+        return measure(server, args, lambda: detect_stage.processed)
+    finally:
+        if pipeline:
+            pipeline.stop()
+        server.stop()
+        camera.release()
+
+
+def bench_bus(args, detector_factory):
+    """Detector process behind a FrameBus: the stream runs at the camera's pace"""
+    # Same frame size as the pipeline mode, whose CameraManager asks for --width x --height
+    bus = FrameBus((args.height, args.width, 3), create=True)
+    capture = FrameBusCapture(bus, source=make_source(args))
+    detector = BusDetector(bus, detector_factory=detector_factory, motion_area_threshold=None, events_dir=None)
+    server = SecurityServer(host="127.0.0.1", port=0)
+    pipeline = None
+    try:
+        if not capture.start():
+            return {"skipped": "source could not be opened"}
+        detector.start()
+        # The model loads in the new process before the first result
+        deadline = time.perf_counter() + args.load_timeout
+        while not bus.stats()["results"] and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        if not bus.stats()["results"]:
+            return {"skipped": "detector process produced no result"}
+        server.start()
+        pipeline = build_bus_pipeline(BusStreamer(bus, server))
+        pipeline.start()
+        result = measure(server, args, lambda: bus.stats()["results"])
+        result["writer_stalls"] = bus.stats()["writer_stalls"]
+        return result
+    finally:
+        if pipeline:
+            pipeline.stop()
+        server.stop()
+        detector.stop()
+        capture.stop()
+        bus.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default="synthetic:0", help='video file, image directory or "synthetic[:seed]"')
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--fps", type=float, default=30, help="camera rate the source is paced to")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backend", default="ultralytics")
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--load-timeout", type=float, default=60.0)
+    parser.add_argument("--modes", default="pipeline,bus")
+    args = parser.parse_args()
+
+    # A partial of the class pickles by reference, so the detector process can build its own
+    detector_factory = functools.partial(ObjectDetector, args.model, backend=args.backend, imgsz=args.imgsz,
+                                         person_only=True)
+    print(f"{os.cpu_count()} CPUs, source {args.source} at {args.fps:g} fps")
+    for mode in args.modes.split(","):
+        result = {"pipeline": bench_pipeline, "bus": bench_bus}[mode](args, detector_factory)
+        if "skipped" in result:
+            print(f"{mode:9s} skipped: {result['skipped']}")
+            continue
+        print(f"{mode:9s} streamed {result['streamed_fps']:5.1f} fps  detected {result['detected_fps']:5.1f} fps  "
+              f"glass-to-glass p50 {result['glass_to_glass_p50_ms']:6.1f}  "
+              f"p95 {result['glass_to_glass_p95_ms']:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare the per-Box MovementTracker path with the vectorized array path.
+
+Generates a crowd of synthetic people walking left and right and times one
+tracking step per frame for each path:
+
+    python bench_movement_tracker.py --people 250 --frames 200
+"""
+import argparse
+import time
+import numpy as np
+import torch
+from ultralytics.engine.results import Boxes
+from detections import Detections
+from movement_tracker import MovementTracker
+
+
+class _Results:
+    """Minimal stand-in for an ultralytics Results object (only .boxes is used)"""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def synthetic_crowd(people, frames, width, height, seed=0):
+    """Yield (N, 7) arrays [x1, y1, x2, y2, id, conf, cls] of people walking across the frame"""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, width, people)
+    y = rng.uniform(0, height - 60, people)
+    speed = rng.choice([-2.0, 2.0], people) + rng.normal(0, 0.5, people)
+    ids = np.arange(1, people + 1, dtype=np.float32)
+    conf = rng.uniform(0.4, 0.95, people)
+    for _ in range(frames):
+        x = (x + speed) % width
+        data = np.stack([x - 10, y, x + 10, y + 60, ids, conf, np.zeros(people)], axis=1)
+        yield data.astype(np.float32)
+
+
+def run_box_path(frames, width, height, draw):
+    tracker = MovementTracker(frame_width=width)
+    canvas = np.zeros((height, width, 3), np.uint8)
+    prev_results = None
+    elapsed = 0.0
+    for data in frames:
+        results = [_Results(Boxes(torch.from_numpy(data), (height, width)))]
+        start = time.perf_counter()
+        boxes = [box for box in results[0].boxes if box.cls.tolist()[0] == 0]
+        if prev_results is not None:
+            if draw:
+                tracker.track_movement(canvas, boxes, prev_results)
+            else:
+                _track_without_drawing(tracker, boxes, prev_results)
+        elapsed += time.perf_counter() - start
+        prev_results = results
+    return elapsed
+
+
+def _track_without_drawing(tracker, boxes, prev_results):
+    """track_movement minus cv2 calls, to isolate the matching cost"""
+    tracker.store.tick()
+    for box in boxes:
+        if box.id:
+            box_id = int(box.id)
+            if box_id in tracker.store:
+                prev_box = tracker._get_prev_box(prev_results, box.id)
+                if prev_box:
+                    tracker.get_direction(box, prev_box)
+            else:
+                tracker.choose_box_side(box)
+
+
+def run_array_path(frames, width, height, draw):
+    tracker = MovementTracker(frame_width=width)
+    canvas = np.zeros((height, width, 3), np.uint8)
+    elapsed = 0.0
+    for data in frames:
+        start = time.perf_counter()
+        detections = Detections(data[:, :4], data[:, 5], data[:, 6], data[:, 4])
+        tracker.track_detections(canvas, detections.persons(), draw=draw)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--people", type=int, default=250)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--draw", action="store_true", help="include box drawing in the timing")
+    args = parser.parse_args()
+
+    frames = list(synthetic_crowd(args.people, args.frames, args.width, args.height))
+    box_time = run_box_path(frames, args.width, args.height, args.draw)
+    array_time = run_array_path(frames, args.width, args.height, args.draw)
+
+    per_frame = 1000 / args.frames
+    print(f"{args.people} people x {args.frames} frames (draw={args.draw})")
+    print(f"per-Box path:    {box_time * per_frame:8.2f} ms/frame")
+    print(f"array path:      {array_time * per_frame:8.2f} ms/frame")
+    print(f"speedup:         {box_time / array_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
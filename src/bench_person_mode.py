@@ -0,0 +1,65 @@
+"""Per-frame CPU time of the all-classes detector path versus person-only mode.
+
+Runs ObjectDetector.detect_objects (model.track, as the server does) over
+the same footage in both configurations:
+
+    python bench_person_mode.py --video clip.mp4 --imgsz 320
+    python bench_person_mode.py --recording recordings
+"""
+import argparse
+import time
+import numpy as np
+from bench_detectors import load_frames
+from object_detector import ObjectDetector
+
+
+def measure(detector, frames, warmup):
+    """Mean wall and CPU milliseconds per frame, and mean person boxes per frame"""
+    for frame in frames[:warmup]:
+        detector.detect_objects(frame)
+    wall, cpu, persons = [], [], []
+    for frame in frames:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        results = detector.detect_objects(frame)
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+        persons.append(len(detector.get_person_boxes(results)))
+    return 1e3 * float(np.mean(wall)), 1e3 * float(np.mean(cpu)), float(np.mean(persons))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--video")
+    source.add_argument("--recording", default="recordings")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--conf", type=float, default=0.35)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=5)
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    if not frames:
+        parser.error("no frames found in the footage")
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    configurations = [
+        ("all classes, 640", ObjectDetector(args.model)),
+        (f"person only, {args.imgsz}", ObjectDetector(args.model, imgsz=args.imgsz, person_only=True,
+                                                      conf_threshold=args.conf, iou_threshold=args.iou)),
+    ]
+    baseline_cpu = None
+    for name, detector in configurations:
+        wall_ms, cpu_ms, persons = measure(detector, frames, args.warmup)
+        line = f"{name:20s} wall {wall_ms:7.2f} ms  cpu {cpu_ms:7.2f} ms  persons/frame {persons:.2f}"
+        if baseline_cpu is None:
+            baseline_cpu = cpu_ms
+        else:
+            line += f"  cpu -{1 - cpu_ms / baseline_cpu:.0%}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""Offline benchmark suite: capture, detection, tracking, encoding and loopback broadcast.
+
+Runs on any headless box from a synthetic, video or image-directory source
+and writes JSON that can be compared against a previous run:
+
+    python bench_suite.py --source synthetic:0 --output bench.json
+    python bench_suite.py --source clip.mp4 --benchmarks encoding,broadcast --compare bench.json
+
+With --compare the exit status is 1 when any benchmark lost more than
+--tolerance of its throughput.
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+from camera_manager import CameraManager
+from detections import Detections
+from frame_encoder import FrameEncoder
+from frame_sources import SyntheticSource, open_source
+from metrics import LatencyHistogram, monotonic_to_wall_ns
+from movement_tracker import MovementTracker
+from tracker import IoUTracker
+
+BENCHMARKS = ("capture", "detection", "tracking", "encoding", "broadcast")
+
+
+def rss_mb():
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        scale = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def timed(items, func):
+    """Call func on every item; returns throughput and latency stats"""
+    histogram = LatencyHistogram()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        func(item)
+        histogram.record(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    result = histogram.snapshot()
+    result["fps"] = len(items) / elapsed if elapsed else 0.0
+    result["rss_growth_mb"] = rss_mb() - rss_before
+    return result
+
+
+def load_frames(args):
+    """Decode the benchmark frames up front so source cost stays out of the measurements"""
+    source = open_source(args.source, args.width, args.height, args.fps, realtime=False)
+    frames = []
+    while len(frames) < args.frames:
+        success, frame = source.read()
+        if not success:
+            break
+        frames.append(frame)
+    source.release()
+    return frames
+
+
+def bench_capture(frames, args):
+    """CameraManager's background capture and read_latest on an unpaced source"""
+    source = open_source(args.source, args.width, args.height, args.fps, realtime=False)
+    camera = CameraManager(args.width, args.height, args.fps, source=source)
+    if not camera.initialize_camera() or not camera.start_capture():
+        return {"skipped": "source could not be opened"}
+    try:
+        result = timed(range(args.frames), lambda _: camera.read_latest())
+        result["dropped"] = camera.frames_dropped
+        return result
+    finally:
+        camera.release()
+
+
+def bench_detection(frames, args):
+    """ObjectDetector.detect_objects as configured in server_main"""
+    from object_detector import ObjectDetector
+    detector = ObjectDetector(args.model, backend=args.backend, imgsz=args.imgsz, person_only=True)
+    for frame in frames[:args.warmup]:
+        detector.detect_objects(frame)
+    return timed(frames, detector.detect_objects)
+
+
+def bench_tracking(frames, args):
+    """IoUTracker plus MovementTracker on ground-truth boxes of the synthetic scene.
+
+    The cost does not depend on the pixels, so the synthetic boxes are used
+    whatever the source is.
+    """
+    scene = SyntheticSource(args.width, args.height, seed=args.seed, objects=args.objects)
+    tracker = IoUTracker()
+    movement = MovementTracker(frame_width=args.width)
+    steps = []
+    for index in range(len(frames)):
+        xyxy = scene.boxes(index)
+        steps.append((frames[index], Detections(xyxy, np.full(len(xyxy), 0.9, np.float32),
+                                                np.zeros(len(xyxy), np.int64))))
+
+    def track(step):
+        frame, detections = step
+        movement.track_detections(frame, tracker.update(detections), draw=False)
+
+    return timed(steps, track)
+
+
+def bench_encoding(frames, args):
+    """FrameEncoder for the full-size and thumbnail profiles"""
+    encoder = FrameEncoder()
+    profiles = args.profiles.split(",")
+    sizes = []
+
+    def encode(item):
+        sequence, frame = item
+        encoded = encoder.encode_profiles(frame, sequence, profiles)
+        sizes.append(sum(len(payload) for _, payload in encoded.values()))
+
+    result = timed(list(enumerate(frames)), encode)
+    result["bytes_per_frame"] = float(np.mean(sizes)) if sizes else 0.0
+    return result
+
+
+def bench_broadcast(frames, args):
+    """SecurityServer -> SecurityClient over loopback at the source frame rate"""
+    from security_client import SecurityClient
+    from security_server import SecurityServer
+    server = SecurityServer(host="127.0.0.1", port=0)
+    server.start()
+    port = server.server_socket.getsockname()[1]
+    client = SecurityClient(port=port, server_fingerprint=server.fingerprint)
+    rss_before = rss_mb()
+    try:
+        if not client.connect():
+            return {"skipped": "loopback client could not connect"}
+        time.sleep(0.2)
+        start = time.perf_counter()
+        for index, frame in enumerate(frames):
+            target = start + index / args.fps
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            server.broadcast_frame(frame, None, monotonic_to_wall_ns(time.monotonic()))
+            # Display loop: wait for this frame until the next one is due
+            client.get_latest_frame(max(0.0, start + (index + 1) / args.fps - time.perf_counter()))
+        deadline = time.perf_counter() + 1.0
+        while client.received_frames < len(frames) and time.perf_counter() < deadline:
+            client.get_latest_frame(0.05)
+        elapsed = time.perf_counter() - start
+        stats = client.stats()
+        result = stats["latency"].get("glass_to_glass", LatencyHistogram().snapshot())
+        result.update({
+            "fps": stats["decoded"] / elapsed,
+            "received": stats["received"],
+            "decoded": stats["decoded"],
+            "skipped_frames": stats["skipped"],
+            "rss_growth_mb": rss_mb() - rss_before,
+        })
+        return result
+    finally:
+        client.stop()
+        server.stop()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print throughput and p95 changes against a previous run; returns the regressed benchmark names"""
+    regressions = []
+    for name, result in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "fps" not in result or "fps" not in previous:
+            continue
+        change = result["fps"] / previous["fps"] - 1 if previous["fps"] else 0.0
+        line = (f"{name:10s} fps {previous['fps']:9.1f} -> {result['fps']:9.1f} ({change:+.1%})  "
+                f"p95 {previous['p95_ms']:7.2f} -> {result['p95_ms']:7.2f} ms")
+        if change < -tolerance:
+            regressions.append(name)
+            line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default="synthetic:0", help='video file, image directory or "synthetic[:seed]"')
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS))
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--objects", type=int, default=8, help="people in the tracking scene")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backend", default="ultralytics")
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--profiles", default="default,thumbnail")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed fractional fps loss")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    if not frames:
+        parser.error(f"no frames from {args.source}")
+    height, width = frames[0].shape[:2]
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "source": args.source,
+            "frames": len(frames),
+            "resolution": f"{width}x{height}",
+        },
+        "results": {},
+    }
+    runners = {name: globals()[f"bench_{name}"] for name in BENCHMARKS}
+    for name in args.benchmarks.split(","):
+        if name not in runners:
+            parser.error(f"unknown benchmark {name}, choose from {', '.join(BENCHMARKS)}")
+        try:
+            result = runners[name](frames, args)
+        except (ImportError, FileNotFoundError, OSError) as e:
+            result = {"skipped": str(e)}
+        results["results"][name] = result
+        if "skipped" in result:
+            print(f"{name:10s} skipped: {result['skipped']}")
+        else:
+            print(f"{name:10s} {result['fps']:9.1f} fps  p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  "
+                  f"p99 {result['p99_ms']:7.2f} ms  rss {result['rss_growth_mb']:+.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
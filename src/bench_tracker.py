@@ -0,0 +1,87 @@
+"""Tracking quality and cost of IoUTracker when the detector runs on every k-th frame only.
+
+Simulates a crowd walking at varying speeds through a 30 fps scene, with
+noisy and occasionally missed detections, and runs the tracker with
+detection every frame and at the given intervals (predictions in between):
+
+    python bench_tracker.py --people 40 --intervals 1,3,6
+"""
+import argparse
+import time
+import numpy as np
+from detections import Detections
+from tracker import IoUTracker, iou_matrix, greedy_assignment
+
+
+def simulate(people, frames, width, height, seed):
+    """Ground-truth boxes (frames, people, 4) of people walking around the scene at constant speed"""
+    rng = np.random.default_rng(seed)
+    size = rng.uniform(40, 90, (people, 1)) * np.array([0.45, 1.0])
+    start = rng.uniform([0, 0], [width, height], (people, 2))
+    # Walking speed of 1-3 m/s at roughly 40 pixels per meter and 30 fps
+    velocity = rng.uniform(1, 4, (people, 1)) * rng.choice([-1, 1], (people, 2)) * rng.uniform(0.2, 1, (people, 2))
+    centers = start[None] + velocity[None] * np.arange(frames)[:, None, None]
+    # Reflect at the edges so everyone stays in the picture and moves continuously
+    bounds = np.array([width, height])
+    centers = bounds - np.abs(np.mod(centers, 2 * bounds) - bounds)
+    return np.concatenate((centers - size / 2, centers + size / 2), axis=2).astype(np.float32)
+
+
+def detect(truth, rng, noise, miss_rate):
+    """Noisy detections of one frame's ground truth, with some people missed"""
+    keep = rng.random(len(truth)) >= miss_rate
+    xyxy = truth[keep] + rng.normal(0, noise, (int(keep.sum()), 4)).astype(np.float32)
+    return Detections(xyxy, np.full(len(xyxy), 0.8, dtype=np.float32), np.zeros(len(xyxy), dtype=np.int64)), keep
+
+
+def evaluate(truth, interval, args):
+    """Run one configuration; returns coverage, id switches and tracker milliseconds per frame"""
+    rng = np.random.default_rng(args.seed + 1)
+    tracker = IoUTracker()
+    assigned = {}
+    covered = switches = 0
+    elapsed = 0.0
+    for frame_index, boxes in enumerate(truth):
+        if frame_index % interval == 0:
+            detections, _ = detect(boxes, rng, args.noise, args.miss_rate)
+            start = time.perf_counter()
+            tracked = tracker.update(detections)
+        else:
+            start = time.perf_counter()
+            tracked = tracker.predict()
+        elapsed += time.perf_counter() - start
+
+        # Match the reported boxes to the ground truth to count coverage and identity changes
+        rows, cols = greedy_assignment(iou_matrix(boxes, tracked.xyxy), 0.3)
+        covered += len(rows)
+        for person, track_id in zip(rows.tolist(), tracked.ids[cols].tolist()):
+            if track_id < 0:
+                continue
+            if person in assigned and assigned[person] != track_id:
+                switches += 1
+            assigned[person] = track_id
+    return covered / truth[:, :, 0].size, switches, 1e3 * elapsed / len(truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--people", type=int, default=40)
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--intervals", default="1,3,6")
+    parser.add_argument("--noise", type=float, default=2.0, help="detection jitter in pixels")
+    parser.add_argument("--miss-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    truth = simulate(args.people, args.frames, args.width, args.height, args.seed)
+    print(f"{args.people} people, {args.frames} frames at 30 fps")
+    for interval in map(int, args.intervals.split(",")):
+        coverage, switches, ms = evaluate(truth, interval, args)
+        print(f"detect every {interval} frame(s) ({30 / interval:4.1f} fps)  coverage {coverage:.3f}  "
+              f"id switches {switches:4d}  tracker {ms:.3f} ms/frame")
+
+
+if __name__ == '__main__':
+    main()
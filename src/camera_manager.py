@@ -1,8 +1,20 @@
 import cv2
 import logging
+import threading
+import time
+import numpy as np
+from frame_sources import open_source
 
 class CameraManager:
-    def __init__(self, width=320, height=240, fps=30):
+    """Camera capture into a ring of reusable buffers.
+    
+    `source` is a camera index, a video file, an image directory,
+    "synthetic[:seed]" or a frame_sources.FrameSource, so the whole pipeline
+    can run without a camera.
+    """
+    
+    def __init__(self, width=320, height=240, fps=30, ring_size=3, source=0):
+        self.source = source
         self.width = width
         self.height = height
         self.fps = fps
@@ -10,15 +22,29 @@ class CameraManager:
         self.is_running = False
         self.logger = logging.getLogger(__name__)
         
+        # Background capture state
+        self.ring_size = max(3, ring_size)
+        self._ring = []
+        self._ring_lock = threading.Condition()
+        self._capture_thread = None
+        self._capturing = False
+        self._latest_slot = None
+        self._reader_slot = None
+        self._latest_timestamp = 0.0
+        self._latest_index = 0
+        self._last_read_index = 0
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        
     def initialize_camera(self):
         """Initialize the camera with the specified settings"""
         try:
-            self.camera = cv2.VideoCapture(0)
+            self.camera = open_source(self.source, self.width, self.height, self.fps)
             self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
             self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
             self.camera.set(cv2.CAP_PROP_FPS, self.fps)
             self.is_running = True
-            self.logger.info("Camera initialized successfully")
+            self.logger.info(f"Camera {self.source} initialized successfully")
             return self.camera.isOpened()
         except Exception as e:
             self.logger.error(f"Failed to initialize camera: {str(e)}")
@@ -26,6 +52,9 @@ class CameraManager:
         
     def read_frame(self):
         """Read a frame from the camera"""
+        if self._capturing:
+            success, frame, _, _ = self.read_latest()
+            return success, frame
         if not self.camera or not self.camera.isOpened():
             self.logger.warning("Camera is not initialized or not opened")
             return False, None
@@ -38,8 +67,94 @@ class CameraManager:
             self.logger.error(f"Error reading frame: {str(e)}")
             return False, None
         
+    def start_capture(self):
+        """Grab frames on a background thread so reads always get the newest one"""
+        if self._capturing:
+            return True
+        if not self.camera or not self.camera.isOpened():
+            self.logger.warning("Camera is not initialized or not opened")
+            return False
+            
+        # Allocate the ring from the real frame size, which may differ from the request
+        success, frame = self.camera.read()
+        if not success:
+            self.logger.warning("Failed to read first frame from camera")
+            return False
+        self._ring = [np.empty_like(frame) for _ in range(self.ring_size)]
+        with self._ring_lock:
+            np.copyto(self._ring[0], frame)
+            self._publish(0)
+            
+        self._capturing = True
+        self._capture_thread = threading.Thread(target=self._capture_loop)
+        self._capture_thread.daemon = True
+        self._capture_thread.start()
+        self.logger.info(f"Background capture started with {self.ring_size} buffers")
+        return True
+        
+    def _publish(self, slot):
+        """Make a filled slot the newest frame (caller holds the lock)"""
+        if self._latest_index > self._last_read_index:
+            self.frames_dropped += 1
+        self._latest_slot = slot
+        self._latest_index += 1
+        self._latest_timestamp = time.monotonic()
+        self.frames_captured += 1
+        self._ring_lock.notify_all()
+        
+    def _free_slot(self):
+        """Pick a slot that is neither the newest frame nor held by the reader"""
+        for slot in range(self.ring_size):
+            if slot != self._latest_slot and slot != self._reader_slot:
+                return slot
+        
+    def _capture_loop(self):
+        """Continuously grab frames into the ring buffers"""
+        while self._capturing:
+            try:
+                if not self.camera.grab():
+                    self.logger.warning("Failed to grab frame from camera")
+                    time.sleep(0.01)
+                    continue
+                with self._ring_lock:
+                    slot = self._free_slot()
+                success, _ = self.camera.retrieve(self._ring[slot])
+                if not success:
+                    continue
+                with self._ring_lock:
+                    self._publish(slot)
+            except Exception as e:
+                self.logger.error(f"Error in capture thread: {str(e)}")
+                time.sleep(0.01)
+        
+    def read_latest(self, timeout=1.0):
+        """Return (success, frame, capture_timestamp, frame_index) for the newest frame.
+        
+        Blocks until a frame newer than the last one returned is available.
+        The frame buffer stays untouched until the next call; copy it to keep it longer.
+        """
+        with self._ring_lock:
+            if not self._ring_lock.wait_for(
+                lambda: self._latest_index > self._last_read_index or not self._capturing,
+                timeout
+            ) or not self._capturing:
+                return False, None, None, None
+            self._reader_slot = self._latest_slot
+            self._last_read_index = self._latest_index
+            return True, self._ring[self._reader_slot], self._latest_timestamp, self._latest_index
+        
+    def stop_capture(self):
+        """Stop the background capture thread"""
+        self._capturing = False
+        with self._ring_lock:
+            self._ring_lock.notify_all()
+        if self._capture_thread:
+            self._capture_thread.join(timeout=1.0)
+            self._capture_thread = None
+        
     def release(self):
         """Release the camera resources"""
+        self.stop_capture()
         if self.camera:
             self.camera.release()
             self.camera = None
@@ -1,7 +1,15 @@
 import logging
+import time
 import cv2
 from security_client import SecurityClient
 
+# Seconds between client statistics lines in the log
+STATS_INTERVAL = 5.0
+# Fingerprint the server prints at startup; when None, the one seen on the first connection
+# is pinned in KNOWN_SERVERS_FILE and a server presenting any other identity is refused
+SERVER_FINGERPRINT = None
+KNOWN_SERVERS_FILE = "known_servers"
+
 def main():
     # הגדרת לוגר
     logging.basicConfig(
@@ -12,9 +20,10 @@ def main():
     )
     logger = logging.getLogger(__name__)
     
+    client = None
     try:
         # אתחול הלקוח
-        client = SecurityClient()
+        client = SecurityClient(server_fingerprint=SERVER_FINGERPRINT, known_servers=KNOWN_SERVERS_FILE)
         
         # התחברות לשרת
         if not client.connect():
@@ -22,24 +31,36 @@ def main():
             return
             
         # לולאה ראשית
-        while client.is_connected:
-            # קבלת פריים מהשרת
-            frame = client.receive_frame()
-            if frame is None:
-                continue
-                
-            # הצגת הפריים
-            cv2.imshow('Security Camera', frame)
+        last_report = time.monotonic()
+        while client.is_running:
+            # The decode worker keeps only the newest frame, so a slow GUI skips frames instead of lagging
+            received = client.get_latest_frame(timeout=0.1)
+            if received is not None:
+                # הצגת הפריים
+                cv2.imshow('Security Camera', received.frame)
             
             # בדיקה להפסקת התוכנית
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
                 
+            if time.monotonic() - last_report >= STATS_INTERVAL:
+                stats = client.stats(reset_latency=True)
+                latency = stats['latency'].get('glass_to_glass')
+                latency = (f"p50 {latency['p50_ms']:.1f} p95 {latency['p95_ms']:.1f} p99 {latency['p99_ms']:.1f} ms"
+                           if latency and latency['count'] else "n/a")
+                logger.info(
+                    f"received {stats['received']} decoded {stats['decoded']} displayed {stats['displayed']} "
+                    f"skipped {stats['skipped']} (queue {stats['queue_dropped']}) "
+                    f"decode {stats['decode_ms']:.2f} ms glass-to-glass {latency}"
+                )
+                last_report = time.monotonic()
+                
     except Exception as e:
         logger.error(f"Error in main loop: {str(e)}")
     finally:
         # ניקוי משאבים
-        client.disconnect()
+        if client is not None:
+            client.stop()
         cv2.destroyAllWindows()
         logger.info("Client stopped")
 
@@ -0,0 +1,225 @@
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+from movement_tracker import VERDICT_INVALID
+from recorder import INDEX_ENTRY, DATA_SUFFIX, INDEX_SUFFIX
+
+
+class EncodedFrameRing:
+    """The most recent encoded frames, bounded by their total size in bytes"""
+
+    def __init__(self, byte_budget=16 * 1024 * 1024):
+        self.byte_budget = byte_budget
+        self._frames = deque()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def append(self, timestamp_ns, jpeg):
+        self._frames.append((timestamp_ns, jpeg))
+        self.bytes += len(jpeg)
+        while self.bytes > self.byte_budget and len(self._frames) > 1:
+            _, oldest = self._frames.popleft()
+            self.bytes -= len(oldest)
+
+    def since(self, timestamp_ns):
+        """Buffered frames at or after timestamp_ns, oldest first"""
+        return [frame for frame in self._frames if frame[0] >= timestamp_ns]
+
+
+class WrongWayTrigger:
+    """Decides which wrong-way verdicts are worth a clip.
+
+    A track has to be judged VERDICT_INVALID on min_frames tracking steps in
+    a row, so a single misjudged frame exports nothing, and each track fires
+    at most once per cooldown_seconds (the length of the clip it starts).
+    State is kept for the max_tracks most recently judged tracks.
+    """
+
+    def __init__(self, min_frames=5, cooldown_seconds=10.0, max_tracks=4096):
+        self.min_frames = min_frames
+        self.cooldown_ns = int(cooldown_seconds * 1e9)
+        self.max_tracks = max_tracks
+        self._streaks = OrderedDict()  # track id -> consecutive invalid steps, LRU-bounded
+        self._fired = {}  # track id -> timestamp_ns of its last trigger
+        self.suppressed = 0
+
+    def update(self, verdicts, timestamp_ns):
+        """Feed one TrackVerdicts step; True when it should trigger a clip"""
+        fire = False
+        for track_id, verdict in zip(verdicts.ids.tolist(), verdicts.verdict.tolist()):
+            streak = self._streaks.pop(track_id, 0)
+            streak = streak + 1 if verdict == VERDICT_INVALID else 0
+            self._streaks[track_id] = streak
+            # A wrong-way walk fires once, when its streak first gets long enough
+            if streak != self.min_frames:
+                continue
+            last = self._fired.get(track_id)
+            if last is not None and timestamp_ns - last < self.cooldown_ns:
+                self.suppressed += 1
+                continue
+            self._fired[track_id] = timestamp_ns
+            fire = True
+        while len(self._streaks) > self.max_tracks:
+            track_id, _ = self._streaks.popitem(last=False)
+            self._fired.pop(track_id, None)
+        return fire
+
+
+class Clip:
+    """One exported clip: the time window it covers and where it is written"""
+
+    def __init__(self, directory, event_ns, start_ns, end_ns):
+        self.event_ns = event_ns
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.base_path = os.path.join(directory, str(event_ns))
+        self.events = 1
+        self.finished = False
+
+
+class ClipExporter:
+    """Writes pre_seconds before and post_seconds after a wrong-way event into a clip.
+
+    Frames arrive already encoded through write() (a SecurityServer frame
+    listener) and are kept in a byte-bounded ring, so the window before an
+    event is available without holding raw frames. Events during an open
+    clip extend it, up to max_clip_seconds, instead of starting another,
+    and frames reach the writer thread through a byte-bounded queue, so
+    memory stays flat however often events fire. Clips use the recorder's
+    segment format and can be read back with recorder.Segment.
+    """
+
+    def __init__(self, directory="clips", pre_seconds=5.0, post_seconds=5.0, max_clip_seconds=60.0,
+                 ring_bytes=16 * 1024 * 1024, queue_bytes=16 * 1024 * 1024):
+        self.directory = directory
+        self.pre_ns = int(pre_seconds * 1e9)
+        self.post_ns = int(post_seconds * 1e9)
+        self.max_clip_ns = int(max_clip_seconds * 1e9)
+        self.queue_bytes = queue_bytes
+        self.logger = logging.getLogger(__name__)
+
+        self.ring = EncodedFrameRing(ring_bytes)
+        self._lock = threading.Lock()
+        self._active = None
+        self._queue = queue.Queue()
+        self._queued_bytes = 0
+        self._thread = None
+        self.is_running = False
+
+        # Statistics
+        self.clips_started = 0
+        self.clips_written = 0
+        self.events_coalesced = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """Start the writer thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.is_running = True
+        self._thread = threading.Thread(target=self._run, name="clip-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, timestamp_ns, jpeg):
+        """Buffer one encoded frame and pass it on to the clip being collected, if any"""
+        with self._lock:
+            self.ring.append(timestamp_ns, jpeg)
+            clip = self._active
+            if clip is None:
+                return
+            if timestamp_ns > clip.end_ns:
+                clip.finished = True
+                self._active = None
+                self._queue.put(None)  # wake the writer to close the clip
+                return
+            self._enqueue(clip, timestamp_ns, jpeg)
+
+    def trigger(self, timestamp_ns):
+        """Start a clip around an event, or extend the open clip to cover it"""
+        with self._lock:
+            clip = self._active
+            if clip is not None:
+                clip.end_ns = min(timestamp_ns + self.post_ns, clip.start_ns + self.max_clip_ns)
+                clip.events += 1
+                self.events_coalesced += 1
+                return
+            clip = Clip(self.directory, timestamp_ns, timestamp_ns - self.pre_ns, timestamp_ns + self.post_ns)
+            self._active = clip
+            self.clips_started += 1
+            for frame_ns, jpeg in self.ring.since(clip.start_ns):
+                self._enqueue(clip, frame_ns, jpeg)
+
+    def _enqueue(self, clip, timestamp_ns, jpeg):
+        """Hand a frame to the writer unless it is too far behind (caller holds the lock)"""
+        if self._queued_bytes + len(jpeg) > self.queue_bytes:
+            self.frames_dropped += 1
+            return
+        self._queued_bytes += len(jpeg)
+        self._queue.put((clip, timestamp_ns, jpeg))
+
+    def _run(self):
+        """Write queued frames, one clip file pair at a time"""
+        current = None
+        files = None
+        offset = 0
+        while self.is_running or not self._queue.empty():
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                clip, timestamp_ns, jpeg = item
+                with self._lock:
+                    self._queued_bytes -= len(jpeg)
+                try:
+                    if clip is not current:
+                        self._close(current, files)
+                        current, offset = clip, 0
+                        files = (open(clip.base_path + DATA_SUFFIX, "wb", buffering=1024 * 1024),
+                                 open(clip.base_path + INDEX_SUFFIX, "wb"))
+                    files[0].write(jpeg)
+                    files[1].write(np.array([(timestamp_ns, offset, len(jpeg))], dtype=INDEX_ENTRY).tobytes())
+                    offset += len(jpeg)
+                except OSError as e:
+                    self.logger.error(f"Clip write failed: {str(e)}")
+            if current is not None and current.finished and self._queue.empty():
+                self._close(current, files)
+                current = files = None
+        self._close(current, files)
+
+    def _close(self, clip, files):
+        if files is None:
+            return
+        for f in files:
+            f.close()
+        self.clips_written += 1
+        self.logger.info(
+            f"Wrote clip {clip.base_path} covering {clip.events} event(s), "
+            f"{(clip.end_ns - clip.start_ns) / 1e9:.1f}s"
+        )
+
+    def stats(self):
+        return {
+            'clips_started': self.clips_started,
+            'clips_written': self.clips_written,
+            'events_coalesced': self.events_coalesced,
+            'frames_dropped': self.frames_dropped,
+            'ring_frames': len(self.ring),
+            'ring_bytes': self.ring.bytes,
+        }
+
+    def stop(self):
+        """Finish the open clip with what has been buffered and stop the writer"""
+        with self._lock:
+            if self._active is not None:
+                self._active.finished = True
+                self._active = None
+        self.is_running = False
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout=10)
@@ -0,0 +1,54 @@
+import numpy as np
+
+class Detections:
+    """Detections of one frame as parallel NumPy arrays.
+
+    xyxy is (N, 4) float32, conf (N,) float32, cls (N,) int64 and ids (N,)
+    int64 with -1 for boxes that have no track ID yet.
+    """
+    __slots__ = ("xyxy", "conf", "cls", "ids")
+
+    def __init__(self, xyxy, conf, cls, ids=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+        if ids is None:
+            self.ids = np.full(len(self.xyxy), -1, dtype=np.int64)
+        else:
+            self.ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+
+    @classmethod
+    def from_results(cls, results):
+        """Convert ultralytics results with a single device-to-host copy"""
+        if isinstance(results, Detections):
+            # Lightweight detector backends already return Detections
+            return results
+        if not results or results[0].boxes is None:
+            return cls.empty()
+        boxes = results[0].boxes
+        data = boxes.data.cpu().numpy()
+        if boxes.is_track:
+            # columns: x1, y1, x2, y2, id, conf, cls
+            return cls(data[:, :4], data[:, 5], data[:, 6], data[:, 4])
+        # columns: x1, y1, x2, y2, conf, cls
+        return cls(data[:, :4], data[:, 4], data[:, 5])
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def __getitem__(self, index):
+        """Select a subset with a mask or index array"""
+        return Detections(self.xyxy[index], self.conf[index], self.cls[index], self.ids[index])
+
+    def persons(self):
+        """Only the boxes of class 0 (person)"""
+        return self[self.cls == 0]
+
+    def centers(self):
+        """(N, 2) array of box centers"""
+        return np.stack(((self.xyxy[:, 0] + self.xyxy[:, 2]) / 2,
+                         (self.xyxy[:, 1] + self.xyxy[:, 3]) / 2), axis=1)
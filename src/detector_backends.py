@@ -0,0 +1,187 @@
+import ast
+import logging
+import os
+import cv2
+import numpy as np
+from detections import Detections
+
+PERSON_CLASS = 0
+# Class names used when an exported model carries none; only the person class matters here
+DEFAULT_NAMES = {PERSON_CLASS: "person"}
+
+
+def letterbox(frame, imgsz, color=(114, 114, 114)):
+    """Resize keeping the aspect ratio and pad to imgsz (int or (height, width)).
+
+    Returns (image, scale, (pad_x, pad_y)) so boxes can be mapped back.
+    """
+    height, width = (imgsz, imgsz) if isinstance(imgsz, int) else imgsz
+    frame_height, frame_width = frame.shape[:2]
+    scale = min(height / frame_height, width / frame_width)
+    new_width, new_height = round(frame_width * scale), round(frame_height * scale)
+    if (new_width, new_height) != (frame_width, frame_height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (width - new_width) // 2, (height - new_height) // 2
+    image = cv2.copyMakeBorder(frame, pad_y, height - new_height - pad_y, pad_x, width - new_width - pad_x,
+                               cv2.BORDER_CONSTANT, value=color)
+    return image, scale, (pad_x, pad_y)
+
+
+def nms(xyxy, conf, cls, iou_threshold, max_det=300):
+    """Per-class non-maximum suppression; returns the kept indices, best first"""
+    if len(xyxy) == 0:
+        return np.zeros(0, dtype=np.int64)
+    xywh = np.concatenate((xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]), axis=1)
+    keep = cv2.dnn.NMSBoxesBatched(xywh.tolist(), conf.tolist(), cls.tolist(), 0.0, iou_threshold, top_k=max_det)
+    return np.asarray(keep, dtype=np.int64).reshape(-1)
+
+
+def yolo_postprocess(output, frame_shape, scale, pad, conf_threshold=0.25, iou_threshold=0.45,
+                     classes=None, max_det=300):
+    """Turn a raw YOLOv8 output of shape (1, 4 + classes, anchors) into Detections.
+
+    Restricting `classes` happens before the confidence filter and NMS, so
+    boxes of other classes cost nothing beyond the model itself.
+    """
+    predictions = np.asarray(output).reshape(output.shape[-2], output.shape[-1]).T
+    scores = predictions[:, 4:]
+    class_ids = np.arange(scores.shape[1])
+    if classes is not None:
+        class_ids = np.asarray(classes, dtype=np.int64)
+        scores = scores[:, class_ids]
+    best = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), best]
+    keep = conf >= conf_threshold
+    if not keep.any():
+        return Detections.empty()
+    boxes = predictions[keep, :4]
+    conf = conf[keep]
+    cls = class_ids[best[keep]]
+
+    # cx, cy, w, h in letterboxed input pixels -> x1, y1, x2, y2 in the frame
+    xyxy = np.empty_like(boxes)
+    xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+    xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+    xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / scale
+    xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / scale
+    height, width = frame_shape[:2]
+    xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, width)
+    xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, height)
+
+    selected = nms(xyxy, conf, cls, iou_threshold, max_det)
+    return Detections(xyxy[selected], conf[selected], cls[selected])
+
+
+class UltralyticsBackend:
+    """Plain predictions through the ultralytics/PyTorch stack"""
+
+    name = "ultralytics"
+    # Letterboxes to whatever imgsz a call asks for
+    fixed_input = False
+
+    def __init__(self, model_path="yolov8n.pt", imgsz=640, conf_threshold=0.25, iou_threshold=0.45,
+                 classes=None):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.classes = classes
+
+    def detect(self, frame):
+        results = self.model.predict(frame, imgsz=self.imgsz, conf=self.conf_threshold, iou=self.iou_threshold,
+                                     classes=self.classes, verbose=False)
+        return Detections.from_results(results)
+
+
+class YoloOnnxBackend:
+    """Shared pre/postprocessing for an exported YOLOv8 ONNX model; subclasses run the graph"""
+
+    name = None
+    # Exported graphs take one imgsz x imgsz image, so every call costs a full inference
+    fixed_input = True
+
+    def __init__(self, model_path="yolov8n.onnx", imgsz=640, conf_threshold=0.25, iou_threshold=0.45,
+                 classes=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model {model_path} not found, see export_onnx()")
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.classes = classes
+        self.names = DEFAULT_NAMES
+        self.logger = logging.getLogger(__name__)
+
+    def _infer(self, blob):
+        raise NotImplementedError
+
+    def detect(self, frame):
+        image, scale, pad = letterbox(frame, self.imgsz)
+        blob = cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True)
+        output = self._infer(blob)
+        return yolo_postprocess(output, frame.shape, scale, pad, self.conf_threshold, self.iou_threshold,
+                                self.classes)
+
+
+class OnnxRuntimeBackend(YoloOnnxBackend):
+    """YOLOv8 ONNX model on ONNX Runtime's CPU provider"""
+
+    name = "onnxruntime"
+
+    def __init__(self, model_path="yolov8n.onnx", threads=None, **kwargs):
+        super().__init__(model_path, **kwargs)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnxruntime backend needs the onnxruntime package")
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # ultralytics stores the class names in the model metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            self.names = ast.literal_eval(names)
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenCVDnnBackend(YoloOnnxBackend):
+    """YOLOv8 ONNX model on OpenCV's own DNN module, with no extra dependencies"""
+
+    name = "opencv"
+
+    def __init__(self, model_path="yolov8n.onnx", threads=None, **kwargs):
+        super().__init__(model_path, **kwargs)
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        if threads:
+            cv2.setNumThreads(threads)
+
+    def _infer(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+BACKENDS = {
+    UltralyticsBackend.name: UltralyticsBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+    OpenCVDnnBackend.name: OpenCVDnnBackend,
+}
+
+
+def create_backend(name, model_path, **kwargs):
+    """Instantiate a backend by name ('ultralytics', 'onnxruntime' or 'opencv')"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{name}'")
+    return BACKENDS[name](model_path, **kwargs)
+
+
+def export_onnx(model_path="yolov8n.pt", imgsz=640):
+    """Export a YOLOv8 checkpoint to ONNX once, on a machine that has ultralytics; returns the path"""
+    from ultralytics import YOLO
+    return YOLO(model_path).export(format="onnx", imgsz=imgsz, simplify=True)
@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from movement_tracker import VERDICT_VALID, VERDICT_INVALID
+
+# One fixed-size record per event. Events are appended in time order to one
+# file per UTC day, so the timestamp column of a day file is sorted and time
+# ranges are found by binary search.
+EVENT_RECORD = np.dtype([
+    ("timestamp_ns", ">u8"),
+    ("track_id", ">i4"),
+    ("x1", ">u2"), ("y1", ">u2"), ("x2", ">u2"), ("y2", ">u2"),
+    ("direction", "i1"),  # DIR_LEFT / DIR_RIGHT
+    ("verdict", "u1"),    # VERDICT_VALID / VERDICT_INVALID
+    ("reserved", ">u2"),
+])
+EVENT_SUFFIX = ".evt"
+TRACK_INDEX_SUFFIX = ".tix"
+DAY_NS = 86400 * 10 ** 9
+
+
+class EventStore:
+    """Append-only store of direction verdicts with time and track indexes.
+
+    A track produces an event when its verdict is first decided and whenever
+    it changes, not on every frame. Track ids restart with the detector, so
+    track queries are best combined with a time range.
+    """
+
+    def __init__(self, directory="events", max_tracked_ids=4096, flush_interval=1.0):
+        self.directory = directory
+        self.max_tracked_ids = max_tracked_ids
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._day = None
+        self._last_flush = 0.0
+        self._last_verdict = OrderedDict()  # track id -> last recorded verdict, LRU-bounded
+        self._track_indexes = {}  # closed day -> (sorted track ids, rows)
+        self.events_written = 0
+
+    def _day_path(self, day, suffix=EVENT_SUFFIX):
+        return os.path.join(self.directory, f"{day}{suffix}")
+
+    def record(self, verdicts, timestamp_ns=None):
+        """Append an event for every track whose verdict changed in this TrackVerdicts step"""
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        decided = (verdicts.verdict == VERDICT_VALID) | (verdicts.verdict == VERDICT_INVALID)
+        if not decided.any():
+            return 0
+        ids = verdicts.ids[decided].tolist()
+        verdict = verdicts.verdict[decided]
+        changed = np.fromiter(
+            (self._last_verdict.get(track_id) != v for track_id, v in zip(ids, verdict.tolist())),
+            dtype=bool, count=len(ids)
+        )
+        for track_id, v in zip(ids, verdict.tolist()):
+            self._last_verdict[track_id] = v
+            self._last_verdict.move_to_end(track_id)
+        while len(self._last_verdict) > self.max_tracked_ids:
+            self._last_verdict.popitem(last=False)
+        if not changed.any():
+            return 0
+
+        records = np.zeros(int(changed.sum()), dtype=EVENT_RECORD)
+        records["timestamp_ns"] = timestamp_ns
+        records["track_id"] = verdicts.ids[decided][changed]
+        xyxy = np.clip(np.rint(verdicts.xyxy[decided][changed]), 0, 65535)
+        records["x1"], records["y1"], records["x2"], records["y2"] = xyxy.T
+        records["direction"] = verdicts.direction[decided][changed]
+        records["verdict"] = verdict[changed]
+        self.append(records)
+        return len(records)
+
+    def append(self, records):
+        """Write prepared EVENT_RECORD rows, which must not be older than what is stored"""
+        with self._lock:
+            day = int(records["timestamp_ns"][0]) // DAY_NS
+            if day != self._day:
+                self._close_file()
+                self._file = open(self._day_path(day), "ab", buffering=64 * 1024)
+                self._day = day
+            self._file.write(records.tobytes())
+            self.events_written += len(records)
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def days(self):
+        """UTC day numbers with stored events, oldest first"""
+        return sorted(int(name[:-len(EVENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(EVENT_SUFFIX) and name[:-len(EVENT_SUFFIX)].isdigit())
+
+    def _load_day(self, day):
+        """Memory-map one day's records (written records only, never a partial one)"""
+        path = self._day_path(day)
+        count = os.path.getsize(path) // EVENT_RECORD.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=EVENT_RECORD)
+        return np.memmap(path, dtype=EVENT_RECORD, mode="r", shape=(count,))
+
+    def _track_index(self, day, records):
+        """(track ids sorted, matching rows) for a day, persisted once the day is closed"""
+        if day == self._day:
+            order = np.argsort(records["track_id"], kind="stable")
+            return records["track_id"][order], order
+        cached = self._track_indexes.get(day)
+        if cached is not None and len(cached[1]) == len(records):
+            return cached
+        path = self._day_path(day, TRACK_INDEX_SUFFIX)
+        order = None
+        if os.path.exists(path):
+            order = np.fromfile(path, dtype=">u4").astype(np.int64)
+            if len(order) != len(records):
+                order = None
+        if order is None:
+            order = np.argsort(records["track_id"], kind="stable")
+            order.astype(">u4").tofile(path)
+        cached = (np.asarray(records["track_id"])[order], order)
+        self._track_indexes[day] = cached
+        return cached
+
+    def query(self, start_ns=None, end_ns=None, track_id=None, verdict=None, direction=None):
+        """Events with start_ns <= timestamp < end_ns matching all given filters, in time order"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        first_day = None if start_ns is None else start_ns // DAY_NS
+        last_day = None if end_ns is None else (end_ns - 1) // DAY_NS
+        matches = []
+        for day in self.days():
+            if (first_day is not None and day < first_day) or (last_day is not None and day > last_day):
+                continue
+            records = self._load_day(day)
+            if not len(records):
+                continue
+            timestamps = records["timestamp_ns"]
+            lo = 0 if start_ns is None else int(np.searchsorted(timestamps, start_ns, side="left"))
+            hi = len(records) if end_ns is None else int(np.searchsorted(timestamps, end_ns, side="left"))
+            if lo >= hi:
+                continue
+            if track_id is not None:
+                ids, order = self._track_index(day, records)
+                left = np.searchsorted(ids, track_id, side="left")
+                right = np.searchsorted(ids, track_id, side="right")
+                rows = np.sort(order[left:right])
+                rows = rows[(rows >= lo) & (rows < hi)]
+            else:
+                rows = slice(lo, hi)
+            selected = np.asarray(records[rows])
+            if verdict is not None:
+                selected = selected[selected["verdict"] == verdict]
+            if direction is not None:
+                selected = selected[selected["direction"] == direction]
+            matches.append(selected)
+        if not matches:
+            return np.zeros(0, dtype=EVENT_RECORD)
+        return np.concatenate(matches)
+
+    def link_recordings(self, events, recorder, tolerance_ns=10 ** 9):
+        """Recorded frame nearest to each event as (segment_start, offset, length), or None"""
+        return [recorder.locate(int(timestamp), tolerance_ns) for timestamp in events["timestamp_ns"]]
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+            self._day = None
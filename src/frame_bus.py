@@ -0,0 +1,268 @@
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from frame_sources import open_source
+from metadata import BOX_RECORD, METADATA_HEADER
+
+# Header fields, one int64 each
+HEAD_LATEST_FRAME = 0   # sequence of the newest published frame
+HEAD_LATEST_SLOT = 1    # frame slot holding it
+HEAD_LATEST_RESULT = 2  # sequence of the newest published result
+HEAD_FRAMES = 3         # frames published
+HEAD_RESULTS = 4        # results published
+HEAD_WRITER_STALLS = 5  # frames the writer could not place because every slot was pinned
+HEAD_SIZE = 8
+FRAME_FIELDS = 3        # per frame slot: sequence (-1 while written), capture time in monotonic ns, reader pin bits
+RESULT_FIELDS = 5       # per result slot: result sequence, frame sequence, capture ns, payload length, flags
+
+# Result flags
+RESULT_WRONG_WAY = 0x01  # the detector's WrongWayTrigger fired on this result: export a clip
+
+
+class FrameBus:
+    """Frames and detection results shared between the streaming process and the detector process.
+
+    One shared-memory block holds fixed-size frame slots and a small ring
+    of result descriptors whose payload is a ready-to-send MSG_METADATA
+    payload. Readers pin the frame slot they work on and use the pixels in
+    place; the writer only fills slots nobody has pinned, as in
+    CameraManager's ring. Each reader has a number below `readers` so the
+    pins of a reader process that died can be released. A lock guards the
+    slot bookkeeping and a semaphore per reader wakes it when a frame is
+    published; unlike a multiprocessing Condition, that keeps working when
+    a waiting reader is killed.
+
+    Create the bus with create=True in the owning process and pass it to
+    worker processes as a Process argument; they attach to the same block.
+    """
+
+    def __init__(self, shape, slots=6, result_slots=8, max_boxes=256, readers=2, name=None, create=False,
+                 context=None, lock=None, wakeups=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.result_slots = result_slots
+        self.max_boxes = max_boxes
+        self.result_capacity = METADATA_HEADER.size + max_boxes * BOX_RECORD.itemsize
+        self.owner = create
+        if lock is None:
+            context = context or multiprocessing.get_context("spawn")
+            lock = context.Lock()
+            wakeups = [context.Semaphore(0) for _ in range(readers)]
+        self.lock = lock
+        self.wakeups = wakeups
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=self._size() if create else 0)
+        self.name = self.shm.name
+        self._map()
+        if create:
+            self.head[:] = 0
+            self.frame_meta[:] = 0
+            self.result_meta[:] = 0
+        self.logger = logging.getLogger(__name__)
+
+    def _size(self):
+        meta = 8 * (HEAD_SIZE + FRAME_FIELDS * self.slots + RESULT_FIELDS * self.result_slots)
+        return meta + self.result_slots * self.result_capacity + self.slots * int(np.prod(self.shape))
+
+    def _map(self):
+        buffer = self.shm.buf
+        offset = 0
+        self.head = np.ndarray((HEAD_SIZE,), np.int64, buffer, offset)
+        offset += 8 * HEAD_SIZE
+        self.frame_meta = np.ndarray((self.slots, FRAME_FIELDS), np.int64, buffer, offset)
+        offset += 8 * FRAME_FIELDS * self.slots
+        self.result_meta = np.ndarray((self.result_slots, RESULT_FIELDS), np.int64, buffer, offset)
+        offset += 8 * RESULT_FIELDS * self.result_slots
+        self.results = np.ndarray((self.result_slots, self.result_capacity), np.uint8, buffer, offset)
+        offset += self.result_slots * self.result_capacity
+        self.frames = np.ndarray((self.slots,) + self.shape, np.uint8, buffer, offset)
+
+    def __getstate__(self):
+        # Only the block name and the synchronization primitives travel to a worker
+        # process, which shares the creator's resource tracker and so never owns the block
+        return (self.shape, self.slots, self.result_slots, self.max_boxes, self.name, self.lock, self.wakeups)
+
+    def __setstate__(self, state):
+        shape, slots, result_slots, max_boxes, name, lock, wakeups = state
+        self.__init__(shape, slots, result_slots, max_boxes, len(wakeups), name=name, lock=lock, wakeups=wakeups)
+
+    # Frames
+
+    def acquire_slot(self):
+        """Free frame slot for the writer to fill, or None when readers hold every other slot"""
+        with self.lock:
+            latest = int(self.head[HEAD_LATEST_SLOT]) if self.head[HEAD_LATEST_FRAME] else -1
+            free = [slot for slot in range(self.slots)
+                    if slot != latest and self.frame_meta[slot, 2] == 0]
+            if not free:
+                self.head[HEAD_WRITER_STALLS] += 1
+                return None
+            slot = min(free, key=lambda s: self.frame_meta[s, 0])
+            self.frame_meta[slot, 0] = -1
+            return slot
+
+    def frame(self, slot):
+        """The pixels of a slot, as a view into shared memory"""
+        return self.frames[slot]
+
+    def publish_frame(self, slot, timestamp_ns):
+        """Make a filled slot the newest frame; timestamp_ns is the capture time (time.monotonic_ns)"""
+        with self.lock:
+            sequence = int(self.head[HEAD_LATEST_FRAME]) + 1
+            self.frame_meta[slot, 0] = sequence
+            self.frame_meta[slot, 1] = timestamp_ns
+            self.head[HEAD_LATEST_SLOT] = slot
+            self.head[HEAD_LATEST_FRAME] = sequence
+            self.head[HEAD_FRAMES] += 1
+        for wakeup in self.wakeups:
+            wakeup.release()
+        return sequence
+
+    def pin_latest(self, reader, after=0, timeout=None):
+        """Pin the newest frame for `reader` if it is newer than `after`, waiting up to timeout for one.
+
+        Returns (slot, sequence, timestamp_ns) or None. The slot is not reused
+        until unpin(reader, slot); read it with frame(slot).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                sequence = int(self.head[HEAD_LATEST_FRAME])
+                if sequence > after:
+                    slot = int(self.head[HEAD_LATEST_SLOT])
+                    self.frame_meta[slot, 2] |= 1 << reader
+                    return slot, sequence, int(self.frame_meta[slot, 1])
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            # Wake-ups for frames already taken just cause another look at the head
+            self.wakeups[reader].acquire(timeout=remaining)
+
+    def unpin(self, reader, slot):
+        with self.lock:
+            self.frame_meta[slot, 2] &= ~(1 << reader)
+
+    def release_reader(self, reader):
+        """Drop every pin and pending wake-up of `reader`, e.g. after its process died"""
+        with self.lock:
+            self.frame_meta[:, 2] &= ~(1 << reader)
+        while self.wakeups[reader].acquire(False):
+            pass
+
+    # Results
+
+    def publish_result(self, frame_sequence, timestamp_ns, payload, flags=0):
+        """Store the metadata payload computed for a frame as the newest result"""
+        payload = memoryview(payload).cast("B")
+        if len(payload) > self.result_capacity:
+            # More boxes than max_boxes: keep the first ones and fix up the count
+            count = (self.result_capacity - METADATA_HEADER.size) // BOX_RECORD.itemsize
+            width, height, _ = METADATA_HEADER.unpack_from(payload)
+            payload = memoryview(METADATA_HEADER.pack(width, height, count)
+                                 + bytes(payload[METADATA_HEADER.size:self.result_capacity])).cast("B")
+        with self.lock:
+            sequence = int(self.head[HEAD_LATEST_RESULT]) + 1
+            slot = sequence % self.result_slots
+            self.results[slot, :len(payload)] = np.frombuffer(payload, np.uint8)
+            self.result_meta[slot] = (sequence, frame_sequence, timestamp_ns, len(payload), flags)
+            self.head[HEAD_LATEST_RESULT] = sequence
+            self.head[HEAD_RESULTS] += 1
+        return sequence
+
+    def latest_result(self):
+        """(result_sequence, frame_sequence, timestamp_ns, flags, payload) of the newest result, or None.
+
+        The payload is a small copy (16 bytes per box) so it stays valid after
+        the detector publishes more results.
+        """
+        with self.lock:
+            sequence = int(self.head[HEAD_LATEST_RESULT])
+            if not sequence:
+                return None
+            slot = sequence % self.result_slots
+            _, frame_sequence, timestamp_ns, length, flags = self.result_meta[slot].tolist()
+            return sequence, frame_sequence, timestamp_ns, flags, self.results[slot, :length].tobytes()
+
+    def stats(self):
+        return {
+            'frames': int(self.head[HEAD_FRAMES]),
+            'results': int(self.head[HEAD_RESULTS]),
+            'writer_stalls': int(self.head[HEAD_WRITER_STALLS]),
+            'pinned_slots': int((self.frame_meta[:, 2] != 0).sum()),
+        }
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        self.head = self.frame_meta = self.result_meta = self.results = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class FrameBusCapture:
+    """Capture thread writing camera frames straight into FrameBus slots.
+
+    Takes the place of CameraManager when the detector runs behind a frame
+    bus: frames are retrieved into shared memory once and everything after
+    reads them in place.
+    """
+
+    def __init__(self, bus, source=0, fps=30):
+        self.bus = bus
+        self.source = source
+        self.fps = fps
+        self.capture = None
+        self.is_running = False
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self._thread = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        height, width = self.bus.shape[:2]
+        self.capture = open_source(self.source, width, height, self.fps)
+        if not self.capture.isOpened():
+            self.logger.error(f"Failed to open camera source {self.source}")
+            return False
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+        self.is_running = True
+        self._thread = threading.Thread(target=self._run, name="bus-capture")
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def _run(self):
+        height, width = self.bus.shape[:2]
+        while self.is_running:
+            if not self.capture.grab():
+                self.logger.warning("Failed to grab frame from camera")
+                time.sleep(0.01)
+                continue
+            slot = self.bus.acquire_slot()
+            if slot is None:
+                # Every slot is pinned by a slow reader; this frame is lost
+                self.frames_dropped += 1
+                continue
+            frame = self.bus.frame(slot)
+            success, image = self.capture.retrieve(frame)
+            if success and image is not frame:
+                # Cameras that ignore the requested size (or the buffer) are fitted into the slot
+                if image.shape != frame.shape:
+                    image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                np.copyto(frame, image)
+            if not success:
+                continue
+            self.bus.publish_frame(slot, time.monotonic_ns())
+            self.frames_captured += 1
+
+    def stop(self):
+        self.is_running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        if self.capture is not None:
+            self.capture.release()
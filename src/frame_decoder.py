@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+# Reduced-size decodes supported by libjpeg's DCT scaling
+DECODE_SCALES = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# What LatestFrame.take() hands to the display loop
+ReceivedFrame = namedtuple("ReceivedFrame", ["frame", "sequence", "timestamp_ns", "latency_ms", "skipped"])
+
+
+class FrameDecoder:
+    """JPEG decoding into caller-provided arrays, optionally at 1/2, 1/4 or 1/8 size.
+
+    With simplejpeg installed the pixels are written straight into the
+    given buffer; OpenCV's Python binding cannot decode into an existing
+    array, so without it every decode allocates a fresh one.
+    """
+
+    def __init__(self, scale=1):
+        if scale not in DECODE_SCALES:
+            raise ValueError(f"Decode scale must be one of {sorted(DECODE_SCALES)}")
+        self.scale = scale
+        self.in_place = simplejpeg is not None
+
+    def output_shape(self, jpeg):
+        """Shape of the decoded image, or None when the header cannot be read"""
+        if not self.in_place:
+            return None
+        try:
+            height, width, _, _ = simplejpeg.decode_jpeg_header(jpeg)
+        except ValueError:
+            return None
+        return -(-height // self.scale), -(-width // self.scale), 3
+
+    def decode(self, jpeg, buffer=None):
+        """Decode into `buffer` (of output_shape) when possible; returns the image or None"""
+        if self.in_place:
+            shape = buffer.shape if buffer is not None else self.output_shape(jpeg)
+            if shape is None:
+                return None
+            try:
+                # The smallest DCT scaling that still covers this size is exactly 1/scale
+                return simplejpeg.decode_jpeg(jpeg, colorspace="BGR", min_height=shape[0], min_width=shape[1],
+                                              buffer=buffer, strict=False)
+            except ValueError:
+                return None
+        return cv2.imdecode(np.frombuffer(jpeg, np.uint8), DECODE_SCALES[self.scale])
+
+
+class LatestFrame:
+    """Triple-buffered hand-off of the newest decoded frame to a display loop.
+
+    The decode worker fills a spare buffer and publishes it; a frame that is
+    published before the display took the previous one replaces it, so the
+    display always gets the newest picture and never waits on the network.
+    A taken frame stays valid until the next take().
+    """
+
+    def __init__(self, spares=2):
+        self.spares = spares
+        self._condition = threading.Condition()
+        self._spare = []
+        self._latest = None
+        self._shown = None
+        self._last_index = None
+        self.published = 0
+        self.taken = 0
+        self.skipped = 0
+
+    def buffer(self, shape):
+        """A spare array of the given shape for the next frame"""
+        with self._condition:
+            for i, spare in enumerate(self._spare):
+                if spare.shape == shape:
+                    return self._spare.pop(i)
+        return np.empty(shape, dtype=np.uint8)
+
+    def publish(self, frame, index, sequence, timestamp_ns):
+        """Make `frame` the newest picture; `index` counts received frames to detect skips"""
+        with self._condition:
+            if self._latest is not None:
+                self._release(self._latest[0])
+            self._latest = (frame, index, sequence, timestamp_ns)
+            self.published += 1
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """Return the newest unseen frame as a ReceivedFrame, or None if none arrives in time"""
+        with self._condition:
+            if self._latest is None:
+                self._condition.wait(timeout)
+            if self._latest is None:
+                return None
+            frame, index, sequence, timestamp_ns = self._latest
+            self._latest = None
+            if self._shown is not None:
+                self._release(self._shown)
+            self._shown = frame
+            skipped = 0 if self._last_index is None else max(0, index - self._last_index - 1)
+            self._last_index = index
+            self.taken += 1
+            self.skipped += skipped
+        latency_ms = (time.time_ns() - timestamp_ns) / 1e6
+        return ReceivedFrame(frame, sequence, timestamp_ns, latency_ms, skipped)
+
+    def close(self):
+        """Wake up a waiting take()"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def _release(self, frame):
+        if len(self._spare) < self.spares and frame.base is None and frame.flags.writeable:
+            self._spare.append(frame)
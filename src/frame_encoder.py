@@ -0,0 +1,56 @@
+import logging
+import cv2
+from protocol import MSG_FRAME, pack_header
+
+# Quality profiles clients can subscribe to: maximum width (None keeps the
+# capture size) and JPEG quality. 'default' matches cv2.imencode's defaults.
+QUALITY_PROFILES = {
+    'default': {'width': None, 'quality': 95},
+    'high': {'width': None, 'quality': 90},
+    'medium': {'width': 640, 'quality': 75},
+    'mobile': {'width': 480, 'quality': 60},
+    'thumbnail': {'width': 160, 'quality': 50},
+}
+DEFAULT_PROFILE = 'default'
+
+
+def resolve_profile(name):
+    """Return a known profile name, falling back to the default"""
+    return name if name in QUALITY_PROFILES else DEFAULT_PROFILE
+
+
+class FrameEncoder:
+    """Encodes each frame once per requested quality profile"""
+
+    def __init__(self):
+        self.encodes = 0
+        self.logger = logging.getLogger(__name__)
+
+    def encode(self, frame, profile):
+        """JPEG-encode a frame with a profile's size and quality, or return None"""
+        settings = QUALITY_PROFILES[profile]
+        width = settings['width']
+        height, frame_width = frame.shape[:2]
+        if width and frame_width > width:
+            frame = cv2.resize(frame, (width, round(height * width / frame_width)),
+                               interpolation=cv2.INTER_AREA)
+        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, settings['quality']])
+        if not success:
+            self.logger.warning(f"Failed to encode frame for profile {profile}")
+            return None
+        self.encodes += 1
+        return buffer
+
+    def encode_profiles(self, frame, sequence, profiles, timestamp_ns=None):
+        """Build one frame message per profile in use: {profile: (header, payload)}.
+
+        Profiles nobody subscribed to are never passed in and never encoded.
+        """
+        messages = {}
+        for profile in set(profiles):
+            buffer = self.encode(frame, profile)
+            if buffer is None:
+                continue
+            payload = memoryview(buffer).cast('B')
+            messages[profile] = (pack_header(MSG_FRAME, sequence, len(payload), timestamp_ns), payload)
+        return messages
@@ -0,0 +1,223 @@
+import glob
+import os
+import time
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource:
+    """Offline stand-in for cv2.VideoCapture with the subset CameraManager uses.
+
+    Subclasses implement _render(index, out) to draw frame `index` into
+    `out`, which has the source's own size. Frames are delivered at the
+    size last requested with set(CAP_PROP_FRAME_WIDTH/HEIGHT), scaled when
+    that differs, so a 1280-wide clip plays at the 320x240 the pipeline
+    (and its tracker geometry) expects. With realtime=True reads are paced
+    to `fps` like a camera; otherwise frames are produced as fast as they
+    are read.
+    """
+
+    def __init__(self, width, height, fps=30, realtime=True, loop=True, frame_count=None):
+        # Size the source renders at, and the size frames are delivered at
+        self.source_width = width
+        self.source_height = height
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.frame_count = frame_count
+        self.index = 0
+        self._opened = True
+        self._next_time = None
+        self._pending = False
+        self._source_frame = None
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        # Frames are scaled to the requested size; the rate is the source's own
+        if prop == cv2.CAP_PROP_FRAME_WIDTH and value > 0:
+            self.width = int(value)
+            return True
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT and value > 0:
+            self.height = int(value)
+            return True
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count or 0)
+        return 0.0
+
+    def grab(self):
+        """Wait for the next frame time; False once a non-looping source is exhausted"""
+        if not self._opened:
+            return False
+        if self.frame_count is not None and self.index >= self.frame_count:
+            if not self.loop:
+                return False
+            self.index = 0
+            self._rewind()
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_time is None or now - self._next_time > 1.0:
+                self._next_time = now
+            elif self._next_time > now:
+                time.sleep(self._next_time - now)
+            self._next_time += 1.0 / self.fps
+        self._pending = True
+        return True
+
+    def retrieve(self, image=None, flag=0):
+        """Render the grabbed frame into `image` (allocated when None)"""
+        if not self._pending:
+            return False, None
+        self._pending = False
+        if image is None or image.shape != (self.height, self.width, 3):
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        if (self.width, self.height) == (self.source_width, self.source_height):
+            success = self._render(self.index, image)
+        else:
+            if self._source_frame is None:
+                self._source_frame = np.empty((self.source_height, self.source_width, 3), dtype=np.uint8)
+            success = self._render(self.index, self._source_frame)
+            if success:
+                cv2.resize(self._source_frame, (self.width, self.height), image, interpolation=cv2.INTER_AREA)
+        self.index += 1
+        return success, image if success else None
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        self._opened = False
+
+    def _rewind(self):
+        pass
+
+    def _render(self, index, out):
+        raise NotImplementedError
+
+
+class SyntheticSource(FrameSource):
+    """Moving rectangles over a fixed textured background, identical for a given seed.
+
+    The rectangles are person-shaped and walk at constant velocity,
+    bouncing off the edges; boxes(index) returns where they are, in source
+    pixels, as ground truth for tracking benchmarks.
+    """
+
+    def __init__(self, width=320, height=240, fps=30, seed=0, objects=3, noise=0, **kwargs):
+        super().__init__(width, height, fps, **kwargs)
+        rng = np.random.default_rng(seed)
+        base = rng.integers(60, 160, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+        self.background = cv2.resize(base, (width, height), interpolation=cv2.INTER_LINEAR)
+        heights = rng.uniform(0.25, 0.5, objects) * height
+        self.sizes = np.stack((heights * 0.4, heights), axis=1)
+        self.starts = rng.uniform(0, 1, (objects, 2)) * ([width, height] - self.sizes)
+        self.velocities = rng.uniform(1, 3, (objects, 2)) * rng.choice([-1, 1], (objects, 2)) * [1.0, 0.3]
+        self.colors = rng.integers(0, 256, (objects, 3)).tolist()
+        self.noise = noise
+        self.seed = seed
+
+    def boxes(self, index):
+        """xyxy boxes of every rectangle in frame `index`"""
+        span = np.array([self.source_width, self.source_height]) - self.sizes
+        position = self.starts + self.velocities * index
+        # Reflect at the edges so motion stays continuous
+        position = span - np.abs(np.mod(position, 2 * span) - span)
+        return np.concatenate((position, position + self.sizes), axis=1).astype(np.float32)
+
+    def _render(self, index, out):
+        np.copyto(out, self.background)
+        for (x1, y1, x2, y2), color in zip(self.boxes(index).astype(int).tolist(), self.colors):
+            cv2.rectangle(out, (x1, y1), (x2, y2), color, -1)
+        if self.noise:
+            noise = np.random.default_rng((self.seed, index)).integers(-self.noise, self.noise + 1, out.shape)
+            np.copyto(out, np.clip(out + noise, 0, 255).astype(np.uint8))
+        return True
+
+
+class ImageDirectorySource(FrameSource):
+    """Sorted image files of a directory played as a video"""
+
+    def __init__(self, directory, fps=30, **kwargs):
+        self.paths = sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                            if path.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.paths:
+            raise FileNotFoundError(f"No images in {directory}")
+        first = cv2.imread(self.paths[0])
+        super().__init__(first.shape[1], first.shape[0], fps, frame_count=len(self.paths), **kwargs)
+
+    def _render(self, index, out):
+        image = cv2.imread(self.paths[index])
+        if image is None:
+            return False
+        if image.shape != out.shape:
+            image = cv2.resize(image, (out.shape[1], out.shape[0]))
+        np.copyto(out, image)
+        return True
+
+
+class VideoFileSource(FrameSource):
+    """A video file, paced to its own frame rate and optionally looped"""
+
+    def __init__(self, path, fps=None, **kwargs):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Video {path} not found")
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 30
+        frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        super().__init__(width, height, fps, frame_count=frame_count, **kwargs)
+
+    def _render(self, index, out):
+        success, frame = self.capture.read(out)
+        if not success and self.loop:
+            # The frame count of some containers is only an estimate
+            self._rewind()
+            success, frame = self.capture.read(out)
+        if success and frame is not out:
+            np.copyto(out, frame)
+        return success
+
+    def _rewind(self):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+def open_source(source, width=320, height=240, fps=30, **kwargs):
+    """Open a camera index, a video file, an image directory or "synthetic[:seed]".
+
+    Anything else with read/grab/retrieve (e.g. a FrameSource) is returned as is.
+    """
+    if isinstance(source, int):
+        return cv2.VideoCapture(source)
+    if not isinstance(source, str):
+        return source
+    if source == "synthetic" or source.startswith("synthetic:"):
+        seed = int(source.partition(":")[2] or 0)
+        return SyntheticSource(width, height, fps, seed=seed, **kwargs)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, fps, **kwargs)
+    if os.path.isfile(source):
+        return VideoFileSource(source, **kwargs)
+    # Stream URLs and device paths go to OpenCV
+    return cv2.VideoCapture(source)
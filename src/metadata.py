@@ -0,0 +1,60 @@
+import struct
+import cv2
+import numpy as np
+
+# Payload of a MSG_METADATA message; the message header's sequence number is
+# the sequence of the frame the boxes belong to.
+#   frame_width(H) frame_height(H) count(I), then `count` 16-byte box records
+METADATA_HEADER = struct.Struct("!HHI")
+BOX_RECORD = np.dtype([
+    ("id", ">i4"),
+    ("x1", ">u2"), ("y1", ">u2"), ("x2", ">u2"), ("y2", ">u2"),
+    ("conf", "u1"),       # confidence in percent
+    ("direction", "i1"),  # DIR_LEFT / DIR_NONE / DIR_RIGHT
+    ("verdict", "u1"),    # VERDICT_* from movement_tracker
+    ("reserved", "u1"),
+])
+
+# Overlay colors per verdict, matching MovementTracker (BGR)
+VERDICT_COLORS = {0: (255, 0, 0), 1: (0, 255, 0), 2: (0, 0, 255)}
+DIRECTION_ARROWS = {1: ">", -1: "<", 0: ""}
+
+
+def encode_metadata(verdicts, frame_shape):
+    """Pack a TrackVerdicts result into the compact binary record"""
+    height, width = frame_shape[:2]
+    count = len(verdicts.ids)
+    records = np.zeros(count, dtype=BOX_RECORD)
+    records["id"] = verdicts.ids
+    xyxy = np.clip(np.rint(verdicts.xyxy), 0, 65535)
+    records["x1"], records["y1"], records["x2"], records["y2"] = xyxy.T
+    records["conf"] = np.clip(verdicts.conf * 100, 0, 100)
+    records["direction"] = verdicts.direction
+    records["verdict"] = verdicts.verdict
+    return METADATA_HEADER.pack(width, height, count) + records.tobytes()
+
+
+def decode_metadata(payload):
+    """Return (frame_width, frame_height, records) from a metadata payload"""
+    width, height, count = METADATA_HEADER.unpack_from(payload)
+    records = np.frombuffer(payload, dtype=BOX_RECORD, count=count, offset=METADATA_HEADER.size)
+    return width, height, records.copy()
+
+
+def draw_metadata(frame, records, source_width=None, source_height=None):
+    """Draw the boxes of a metadata record onto a frame, like MovementTracker.draw_verdicts.
+
+    Boxes are scaled when the frame was resized from the source size.
+    """
+    height, width = frame.shape[:2]
+    scale_x = width / source_width if source_width else 1.0
+    scale_y = height / source_height if source_height else 1.0
+    for box_id, x1, y1, x2, y2, conf, direction, verdict, _ in records.tolist():
+        color = VERDICT_COLORS.get(verdict)
+        if color is None:
+            continue
+        x1, x2 = round(x1 * scale_x), round(x2 * scale_x)
+        y1, y2 = round(y1 * scale_y), round(y2 * scale_y)
+        header = f"conf: {conf}, direction: {DIRECTION_ARROWS.get(direction, '')}, id: {box_id}"
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color)
+        cv2.putText(frame, header, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color)
@@ -0,0 +1,165 @@
+import json
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Offset from time.monotonic() to the wall clock, fixed at startup: capture
+# timestamps converted with it are comparable with a viewer's time.time_ns()
+# but never jump when the system clock is adjusted
+_MONOTONIC_TO_WALL_NS = time.time_ns() - time.monotonic_ns()
+
+
+def monotonic_to_wall_ns(monotonic_seconds):
+    """Wall-clock nanoseconds of a time.monotonic() reading, e.g. a capture timestamp"""
+    return int(monotonic_seconds * 1e9) + _MONOTONIC_TO_WALL_NS
+
+
+class LatencyHistogram:
+    """Fixed-size histogram of durations in logarithmic buckets.
+
+    Each bucket is `growth` times wider than the previous one, so
+    percentiles are accurate to about 5% with a few hundred counters,
+    however many samples are recorded.
+    """
+
+    def __init__(self, lowest=1e-6, highest=100.0, growth=1.05):
+        self.lowest = lowest
+        self.growth = growth
+        self._log_lowest = math.log(lowest)
+        self._log_growth = math.log(growth)
+        self.size = int(math.ceil(math.log(highest / lowest) / self._log_growth)) + 2
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * self.size
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def record(self, seconds):
+        if seconds > self.lowest:
+            index = min(int((math.log(seconds) - self._log_lowest) / self._log_growth) + 1, self.size - 1)
+        else:
+            index = 0
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100), in seconds"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q / 100 * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    return min(self.lowest * self.growth ** index, self.max)
+            return self.max
+
+    def snapshot(self):
+        """Count, mean, p50/p95/p99 and max in milliseconds"""
+        return {
+            'count': self.count,
+            'mean_ms': 1e3 * self.total / self.count if self.count else 0.0,
+            'p50_ms': 1e3 * self.percentile(50),
+            'p95_ms': 1e3 * self.percentile(95),
+            'p99_ms': 1e3 * self.percentile(99),
+            'max_ms': 1e3 * self.max,
+        }
+
+
+class Metrics:
+    """Named latency histograms shared by the pipeline stages, the server and its client writers"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def record(self, name, seconds):
+        """Add one duration (in seconds) to the named histogram"""
+        if self.enabled:
+            self.histogram(name).record(seconds)
+
+    def snapshot(self, reset=False):
+        """Stats of every histogram by name; reset=True starts a new measurement window"""
+        stats = {}
+        for name, histogram in list(self.histograms.items()):
+            stats[name] = histogram.snapshot()
+            if reset:
+                histogram.reset()
+        return stats
+
+    def format_stats(self, reset=False):
+        """One-line summary of snapshot() for periodic logging"""
+        parts = []
+        for name, entry in self.snapshot(reset).items():
+            if entry['count']:
+                parts.append(f"{name}: p50 {entry['p50_ms']:.1f} p95 {entry['p95_ms']:.1f} "
+                             f"p99 {entry['p99_ms']:.1f} ms")
+        return " | ".join(parts)
+
+
+class StatsServer:
+    """Serves the metrics and any extra stats as JSON on a local HTTP port.
+
+    `extra` is a callable returning a JSON-serializable dict merged into
+    the response, e.g. pipeline and client statistics.
+    """
+
+    def __init__(self, metrics, host='127.0.0.1', port=8081, extra=None):
+        self.metrics = metrics
+        self.extra = extra
+        self.logger = logging.getLogger(__name__)
+        stats_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/stats'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(stats_server.stats(), default=str).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    def stats(self):
+        stats = {'latency': self.metrics.snapshot()}
+        if self.extra:
+            stats.update(self.extra())
+        return stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stats-server")
+        self._thread.daemon = True
+        self._thread.start()
+        self.logger.info(f"Stats available at http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/stats")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,142 @@
+import logging
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """Cheap frame-differencing check that decides whether a frame is worth running YOLO on.
+
+    The background is a running average, so lighting drift and people who
+    stop moving fade into it instead of triggering detection forever.
+    """
+
+    def __init__(self, area_threshold=0.002, keep_alive=2.0, learning_rate=0.05,
+                 diff_threshold=30, work_width=160):
+        self.area_threshold = area_threshold  # fraction of the frame that must change
+        self.keep_alive = keep_alive  # seconds between forced detections
+        self.learning_rate = learning_rate
+        self.diff_threshold = diff_threshold
+        self.work_width = work_width
+        self.logger = logging.getLogger(__name__)
+
+        self.background = None
+        self.foreground = None
+        self.scale = 1.0
+        self.last_detection_time = None
+        self.frames = 0
+        self.skipped = 0
+        self._kernel = np.ones((3, 3), np.uint8)
+
+    def preprocess_frame(self, frame):
+        """Downscale, grayscale and blur a frame for differencing"""
+        height, width = frame.shape[:2]
+        self.scale = min(1.0, self.work_width / width)
+        if self.scale < 1.0:
+            frame = cv2.resize(frame, (self.work_width, round(height * self.scale)),
+                               interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def detect_motion(self, gray):
+        """Foreground mask of pixels that differ from the background, then update the background"""
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, thresh = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, self._kernel, iterations=2)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return thresh
+
+    def check(self, frame):
+        """Return True when the model should run on this frame"""
+        self.frames += 1
+        self.foreground = self.detect_motion(self.preprocess_frame(frame))
+        changed = cv2.countNonZero(self.foreground) / self.foreground.size
+
+        now = time.monotonic()
+        expired = self.last_detection_time is None or now - self.last_detection_time >= self.keep_alive
+        if changed >= self.area_threshold or expired:
+            self.last_detection_time = now
+            return True
+        self.skipped += 1
+        return False
+
+    def extract_blobs(self, min_area=120):
+        """Bounding rects (x, y, w, h) of foreground blobs, in full-frame coordinates"""
+        if self.foreground is None:
+            return []
+        contours, _ = cv2.findContours(self.foreground, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        scaled_min_area = min_area * self.scale * self.scale
+        rects = []
+        for cnt in contours:
+            if cv2.contourArea(cnt) < scaled_min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(cnt)
+            rects.append((x / self.scale, y / self.scale, w / self.scale, h / self.scale))
+        return rects
+
+    def motion_rois(self, frame_shape, padding=0.25, max_rois=3, max_coverage=0.6):
+        """Merge the motion blobs into a few padded crop regions (x1, y1, x2, y2).
+
+        Returns None when there is nothing to crop to or the regions would cover
+        most of the frame anyway; the caller should then run on the full frame.
+        """
+        height, width = frame_shape[:2]
+        boxes = []
+        for x, y, w, h in self.extract_blobs():
+            # People are partially detected by motion, pad generously around each blob
+            pad_x, pad_y = w * padding + 16, h * padding + 16
+            boxes.append([max(0, x - pad_x), max(0, y - pad_y),
+                          min(width, x + w + pad_x), min(height, y + h + pad_y)])
+        if not boxes:
+            return None
+
+        boxes = _merge_overlapping(boxes)
+        while len(boxes) > max_rois:
+            boxes = _merge_cheapest_pair(boxes)
+
+        covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in boxes)
+        if covered > max_coverage * width * height:
+            return None
+        return [tuple(int(round(v)) for v in box) for box in boxes]
+
+    def skip_ratio(self):
+        """Fraction of frames for which detection was skipped"""
+        return self.skipped / self.frames if self.frames else 0.0
+
+def _union(a, b):
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+def _area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+def _merge_overlapping(boxes):
+    """Repeatedly merge boxes that intersect until none do"""
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = _union(a, b)
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+def _merge_cheapest_pair(boxes):
+    """Merge the two boxes whose union adds the least extra area"""
+    best = None
+    for i in range(len(boxes)):
+        for j in range(i + 1, len(boxes)):
+            union = _union(boxes[i], boxes[j])
+            cost = _area(union) - _area(boxes[i]) - _area(boxes[j])
+            if best is None or cost < best[0]:
+                best = (cost, i, j, union)
+    _, i, j, union = best
+    boxes = [box for k, box in enumerate(boxes) if k not in (i, j)]
+    boxes.append(union)
+    return _merge_overlapping(boxes)
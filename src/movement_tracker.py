@@ -1,12 +1,30 @@
 import logging
+from collections import namedtuple
 import cv2
+import numpy as np
+from detections import Detections
+from track_store import TrackStore
+
+# Direction codes used by the array path
+DIR_LEFT = -1
+DIR_NONE = 0
+DIR_RIGHT = 1
+
+# Per-box outcome of a tracking step
+VERDICT_NEW = 0      # first time the ID is seen, or not yet moved far enough to tell (blue)
+VERDICT_VALID = 1    # moving in the expected direction (green)
+VERDICT_INVALID = 2  # moving against the expected direction (red)
+
+TrackVerdicts = namedtuple("TrackVerdicts", ["ids", "xyxy", "conf", "direction", "verdict"])
 
 class MovementTracker:
-    def __init__(self, frame_width=320):
+    def __init__(self, frame_width=320, max_tracks=4096, track_ttl=300, min_displacement=4.0):
         self.frame_width = frame_width
-        self.going_right_ids = set()
-        self.going_left_ids = set()
-        self.prev_boxes = {}
+        # Horizontal pixels a track must cover over its stored history before its
+        # direction changes; box jitter of a standing person stays below it
+        self.min_displacement = min_displacement
+        # Expected side (DIR_RIGHT / DIR_LEFT) and last position of every live track
+        self.store = TrackStore(max_tracks=max_tracks, ttl_frames=track_ttl)
         self.logger = logging.getLogger(__name__)
         
         # Colors in BGR format
@@ -25,12 +43,13 @@ class MovementTracker:
     def choose_box_side(self, box):
         """Determine which side of the frame the box is on"""
         x1, y1, x2, y2 = box.xyxy[0]
-        x = (x1 + x2) / 2
+        x = float((x1 + x2) / 2)
+        y = float((y1 + y2) / 2)
         if x < self.frame_width - x:
-            self.going_right_ids.add(int(box.id))
+            self.store.add([int(box.id)], [DIR_RIGHT], [(x, y)])
             self.logger.debug("Adding person to left side")
         else:
-            self.going_left_ids.add(int(box.id))
+            self.store.add([int(box.id)], [DIR_LEFT], [(x, y)])
             self.logger.debug("Adding person to right side")
             
     def draw_data(self, frame, box, color, direction=""):
@@ -44,11 +63,13 @@ class MovementTracker:
         
     def track_movement(self, frame, boxes, prev_results):
         """Track movement of detected boxes"""
+        self.store.tick()
         for box in boxes:
             if box.id:
-                if int(box.id) in self.going_right_ids:
+                side = self.store.get_side(int(box.id))
+                if side == DIR_RIGHT:
                     self._check_direction(box, ">", prev_results, frame)
-                elif int(box.id) in self.going_left_ids:
+                elif side == DIR_LEFT:
                     self._check_direction(box, "<", prev_results, frame)
                 else:
                     self.choose_box_side(box)
@@ -67,4 +88,72 @@ class MovementTracker:
         for box in prev_results[0].boxes:
             if box.cls.tolist()[0] == 0 and box.id == box_id:
                 return box
-        return None 
\ No newline at end of file
+        return None
+        
+    def track_results(self, frame, results, draw=True):
+        """Vectorized track_movement that takes a whole ultralytics result at once"""
+        return self.track_detections(frame, Detections.from_results(results).persons(), draw)
+        
+    def track_detections(self, frame, detections, draw=True):
+        """Classify every tracked person box in one NumPy pass.
+        
+        Previous positions come from the track store through its id -> slot
+        map instead of scanning the previous frame's boxes, so a frame costs O(n).
+        The direction comes from the displacement over the stored history of
+        each track (TrackStore.displacement) and only changes once that
+        reaches min_displacement; until then the track keeps its last one.
+        """
+        store = self.store
+        store.tick()
+        tracked = detections[detections.ids >= 0]
+        ids = tracked.ids
+        centers = np.stack(((tracked.xyxy[:, 0] + tracked.xyxy[:, 2]) / 2,
+                            (tracked.xyxy[:, 1] + tracked.xyxy[:, 3]) / 2), axis=1)
+        x = centers[:, 0]
+        
+        # Known tracks carry their expected side and last position in the store
+        slots = store.lookup(ids.tolist())
+        known = slots >= 0
+        known_slots = slots[known]
+        expected = np.full(len(ids), DIR_NONE, dtype=np.int64)
+        expected[known] = store.side[known_slots]
+        store.update(known_slots, centers[known])
+        displacement = np.zeros(len(ids), dtype=np.float32)
+        displacement[known] = store.displacement(known_slots)[:, 0]
+        
+        direction = np.full(len(ids), DIR_NONE, dtype=np.int64)
+        direction[known] = store.direction[known_slots]
+        moved = known & (np.abs(displacement) >= self.min_displacement)
+        direction[moved] = np.where(displacement[moved] > 0, DIR_RIGHT, DIR_LEFT)
+        store.direction[slots[moved]] = direction[moved]
+        verdict = np.full(len(ids), VERDICT_NEW, dtype=np.int64)
+        decided = known & (direction != DIR_NONE)
+        verdict[decided & (direction == expected)] = VERDICT_VALID
+        verdict[decided & (direction != expected)] = VERDICT_INVALID
+        
+        # New IDs: people starting in the left half are expected to walk right
+        new = ~known
+        if new.any():
+            sides = np.where(x[new] < self.frame_width - x[new], DIR_RIGHT, DIR_LEFT)
+            store.add(ids[new].tolist(), sides, centers[new])
+            
+        verdicts = TrackVerdicts(ids, tracked.xyxy, tracked.conf, direction, verdict)
+        if draw:
+            self.draw_verdicts(frame, verdicts)
+        return verdicts
+        
+    def draw_verdicts(self, frame, verdicts):
+        """Draw all boxes of a tracking step, converting the arrays to Python once"""
+        colors = {VERDICT_NEW: self.BLUE, VERDICT_VALID: self.GREEN, VERDICT_INVALID: self.RED}
+        arrows = {DIR_RIGHT: ">", DIR_LEFT: "<", DIR_NONE: ""}
+        boxes = np.rint(verdicts.xyxy).astype(np.int64).tolist()
+        for box_id, (x1, y1, x2, y2), conf, direction, verdict in zip(
+            verdicts.ids.tolist(), boxes, (100 * verdicts.conf).astype(np.int64).tolist(),
+            verdicts.direction.tolist(), verdicts.verdict.tolist()
+        ):
+            color = colors.get(verdict)
+            if color is None:
+                continue
+            header = f"conf: {conf}, direction: {arrows[direction]}, id: {box_id}"
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color)
+            cv2.putText(frame, header, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color)
\ No newline at end of file
@@ -0,0 +1,338 @@
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from frame_sources import open_source
+
+# Header of a SharedFrameRing, one int64 each
+HEAD_LATEST = 0       # sequence of the newest complete frame, 0 before the first
+HEAD_STATE = 1        # STATE_* of the capture worker
+HEAD_FRAMES = 2       # frames captured since start
+HEAD_FAILURES = 3     # failed reads and opens
+HEAD_RECONNECTS = 4
+HEAD_PID = 5
+HEAD_SIZE = 8
+SLOT_FIELDS = 2       # per slot: sequence (-1 while being written), capture time in monotonic ns
+
+STATE_STARTING = 0
+STATE_RUNNING = 1
+STATE_RECONNECTING = 2
+STATE_STOPPED = 3
+STATE_NAMES = {STATE_STARTING: "starting", STATE_RUNNING: "running", STATE_RECONNECTING: "reconnecting",
+               STATE_STOPPED: "stopped"}
+
+
+class SharedFrameRing:
+    """Ring of fixed-size frames in shared memory, one writer process and any number of readers.
+
+    Each slot carries the sequence of the frame in it; the writer marks a
+    slot as being written before touching the pixels, so a reader that
+    copies a slot and finds the same sequence before and after has a whole
+    frame. Only the shared memory name crosses process boundaries, frames
+    are never pickled.
+    """
+
+    def __init__(self, shape, slots=4, name=None, create=False):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        meta_bytes = 8 * (HEAD_SIZE + SLOT_FIELDS * slots)
+        size = meta_bytes + frame_bytes * slots
+        # Worker processes share the creator's resource tracker, so attaching does not take ownership
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.shm.name
+        self.owner = create
+        buffer = self.shm.buf
+        self.head = np.ndarray((HEAD_SIZE,), dtype=np.int64, buffer=buffer)
+        self.slot_meta = np.ndarray((slots, SLOT_FIELDS), dtype=np.int64, buffer=buffer, offset=8 * HEAD_SIZE)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buffer, offset=meta_bytes)
+        if create:
+            self.head[:] = 0
+            self.slot_meta[:] = 0
+
+    def writable_slot(self):
+        """Slot for the next frame, marked as being written; fill it and then call publish()"""
+        sequence = int(self.head[HEAD_LATEST]) + 1
+        slot = sequence % self.slots
+        self.slot_meta[slot, 0] = -1
+        return slot, self.frames[slot]
+
+    def publish(self, slot, timestamp_ns):
+        sequence = int(self.head[HEAD_LATEST]) + 1
+        self.slot_meta[slot, 1] = timestamp_ns
+        self.slot_meta[slot, 0] = sequence
+        self.head[HEAD_LATEST] = sequence
+        self.head[HEAD_FRAMES] += 1
+
+    def read(self, out, after=0, attempts=3):
+        """Copy the newest frame into `out` if it is newer than `after`.
+
+        Returns (sequence, timestamp_ns), or None when there is no newer frame
+        or the writer kept overwriting it.
+        """
+        for _ in range(attempts):
+            sequence = int(self.head[HEAD_LATEST])
+            if sequence <= after:
+                return None
+            slot = sequence % self.slots
+            if self.slot_meta[slot, 0] != sequence:
+                continue
+            timestamp_ns = int(self.slot_meta[slot, 1])
+            np.copyto(out, self.frames[slot])
+            if self.slot_meta[slot, 0] == sequence:
+                return sequence, timestamp_ns
+        return None
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        self.head = self.slot_meta = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def capture_worker(ring_name, shape, slots, source, fps, stop_event, backoff_initial, backoff_max):
+    """Body of a capture process: read frames from `source` straight into the shared ring.
+
+    Lost or unopenable sources are retried with exponential backoff until
+    stop_event is set.
+    """
+    logger = logging.getLogger(__name__)
+    ring = SharedFrameRing(shape, slots, name=ring_name)
+    ring.head[HEAD_PID] = multiprocessing.current_process().pid
+    height, width = shape[:2]
+    backoff = backoff_initial
+    capture = frame = image = None
+    try:
+        while not stop_event.is_set():
+            if capture is None:
+                capture = open_source(source, width, height, fps)
+                if not capture.isOpened():
+                    capture.release()
+                    capture = None
+                    ring.head[HEAD_FAILURES] += 1
+                    ring.head[HEAD_STATE] = STATE_RECONNECTING
+                    stop_event.wait(backoff)
+                    backoff = min(backoff * 2, backoff_max)
+                    continue
+                capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                capture.set(cv2.CAP_PROP_FPS, fps)
+
+            slot, frame = ring.writable_slot()
+            success = capture.grab()
+            if success:
+                success, image = capture.retrieve(frame)
+                if success and image is not frame:
+                    # Sources that do not match the ring size (or ignore the buffer) are fitted into it
+                    if image.shape != frame.shape:
+                        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                    np.copyto(frame, image)
+            if not success:
+                ring.head[HEAD_FAILURES] += 1
+                ring.head[HEAD_STATE] = STATE_RECONNECTING
+                capture.release()
+                capture = None
+                ring.head[HEAD_RECONNECTS] += 1
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, backoff_max)
+                continue
+            ring.publish(slot, time.monotonic_ns())
+            ring.head[HEAD_STATE] = STATE_RUNNING
+            backoff = backoff_initial
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Capture worker for {source} failed: {str(e)}")
+    finally:
+        if capture is not None:
+            capture.release()
+        ring.head[HEAD_STATE] = STATE_STOPPED
+        frame = image = None
+        ring.close()
+
+
+class CameraSource:
+    """One source of a MultiCameraManager: its ring, worker process and reader state"""
+
+    def __init__(self, name, source, shape, slots):
+        self.name = name
+        self.source = source
+        self.ring = SharedFrameRing(shape, slots, create=True)
+        self.process = None
+        self.restarts = 0
+        self.restart_at = 0.0
+        self.backoff_step = 0
+        # Read side, as in CameraManager.read_latest
+        self.buffer = np.empty(shape, dtype=np.uint8)
+        self.last_read = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.fps = 0.0
+        self._fps_frames = 0
+        self._fps_time = time.monotonic()
+
+
+class MultiCameraManager:
+    """Captures N sources, each in its own process, publishing into shared-memory rings.
+
+    Sources are camera indexes, video files, image directories, stream URLs
+    or "synthetic[:seed]" (see frame_sources.open_source), keyed by name.
+    Every source is delivered at width x height. Worker processes that die
+    are restarted with backoff and health() reports per-source state and fps.
+    """
+
+    def __init__(self, sources, width=320, height=240, fps=30, slots=4, backoff_initial=0.5, backoff_max=30.0):
+        if not isinstance(sources, dict):
+            sources = {str(i): source for i, source in enumerate(sources)}
+        self.shape = (height, width, 3)
+        self.fps = fps
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.sources = {name: CameraSource(name, source, self.shape, slots) for name, source in sources.items()}
+        self.is_running = False
+        self._monitor_thread = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start a capture process per source and the supervising thread"""
+        self.stop_event.clear()
+        for camera in self.sources.values():
+            self._spawn(camera)
+        self.is_running = True
+        self._monitor_thread = threading.Thread(target=self._monitor, name="camera-monitor")
+        self._monitor_thread.daemon = True
+        self._monitor_thread.start()
+        self.logger.info(f"Capturing {len(self.sources)} sources: {list(self.sources)}")
+
+    def _spawn(self, camera):
+        camera.process = self.context.Process(
+            target=capture_worker, name=f"capture-{camera.name}",
+            args=(camera.ring.name, self.shape, camera.ring.slots, camera.source, self.fps, self.stop_event,
+                  self.backoff_initial, self.backoff_max)
+        )
+        camera.process.daemon = True
+        camera.process.start()
+
+    def _monitor(self):
+        """Restart dead workers with backoff and refresh the fps figures once a second"""
+        while not self.stop_event.wait(1.0):
+            now = time.monotonic()
+            for camera in self.sources.values():
+                frames = int(camera.ring.head[HEAD_FRAMES])
+                delivered = frames > camera._fps_frames
+                camera.fps = (frames - camera._fps_frames) / max(now - camera._fps_time, 1e-9)
+                camera._fps_frames, camera._fps_time = frames, now
+                if camera.process.is_alive():
+                    if delivered:
+                        # Delivering again, so the next crash starts from the shortest delay
+                        camera.backoff_step = 0
+                    continue
+                if not camera.restart_at:
+                    delay = min(self.backoff_initial * 2 ** camera.backoff_step, self.backoff_max)
+                    camera.backoff_step += 1
+                    camera.restart_at = now + delay
+                    self.logger.warning(
+                        f"Capture process for {camera.name} exited with {camera.process.exitcode}, "
+                        f"restarting in {delay:.1f}s"
+                    )
+                elif now >= camera.restart_at:
+                    camera.restarts += 1
+                    camera.restart_at = 0.0
+                    self._spawn(camera)
+
+    def read_latest(self, name, timeout=1.0):
+        """Return (success, frame, capture_timestamp, frame_index) for a source's newest frame.
+
+        Same contract as CameraManager.read_latest: blocks until a frame newer
+        than the last one returned arrives, and the returned buffer is reused
+        by the next call for this source.
+        """
+        camera = self.sources[name]
+        deadline = time.monotonic() + timeout
+        while self.is_running:
+            result = camera.ring.read(camera.buffer, camera.last_read)
+            if result is not None:
+                sequence, timestamp_ns = result
+                if camera.last_read:
+                    camera.frames_dropped += sequence - camera.last_read - 1
+                camera.last_read = sequence
+                camera.frames_read += 1
+                return True, camera.buffer, timestamp_ns / 1e9, sequence
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.002)
+        return False, None, None, None
+
+    def camera(self, name):
+        """A CameraManager-like view of one source, for code that reads a single camera"""
+        return SourceView(self, name)
+
+    def health(self):
+        """Per-source state, capture fps, counters and age of the newest frame"""
+        now_ns = time.monotonic_ns()
+        report = {}
+        for name, camera in self.sources.items():
+            head = camera.ring.head
+            latest = int(head[HEAD_LATEST])
+            age = None
+            if latest:
+                age = (now_ns - int(camera.ring.slot_meta[latest % camera.ring.slots, 1])) / 1e9
+            report[name] = {
+                'source': str(camera.source),
+                'state': STATE_NAMES.get(int(head[HEAD_STATE]), "unknown"),
+                'alive': camera.process is not None and camera.process.is_alive(),
+                'pid': int(head[HEAD_PID]),
+                'fps': camera.fps,
+                'frames': int(head[HEAD_FRAMES]),
+                'failures': int(head[HEAD_FAILURES]),
+                'reconnects': int(head[HEAD_RECONNECTS]),
+                'restarts': camera.restarts,
+                'frames_read': camera.frames_read,
+                'frames_dropped': camera.frames_dropped,
+                'frame_age_seconds': age,
+            }
+        return report
+
+    def stop(self, timeout=2.0):
+        """Stop all workers and free the shared memory"""
+        self.is_running = False
+        self.stop_event.set()
+        if self._monitor_thread:
+            self._monitor_thread.join(timeout)
+        for camera in self.sources.values():
+            if camera.process is not None:
+                camera.process.join(timeout)
+                if camera.process.is_alive():
+                    camera.process.terminate()
+                    camera.process.join(timeout)
+            camera.ring.close()
+        self.logger.info("Multi-camera capture stopped")
+
+
+class SourceView:
+    """read_latest/is_running/frame counters of one MultiCameraManager source, like a CameraManager"""
+
+    def __init__(self, manager, name):
+        self.manager = manager
+        self.name = name
+
+    @property
+    def is_running(self):
+        return self.manager.is_running
+
+    @property
+    def frames_captured(self):
+        return int(self.manager.sources[self.name].ring.head[HEAD_FRAMES])
+
+    @property
+    def frames_dropped(self):
+        return self.manager.sources[self.name].frames_dropped
+
+    def read_latest(self, timeout=1.0):
+        return self.manager.read_latest(self.name, timeout)
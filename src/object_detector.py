@@ -1,24 +1,258 @@
-from ultralytics import YOLO
+import inspect
 import logging
+import time
 import numpy as np
+from detections import Detections
+from detector_backends import PERSON_CLASS, create_backend, nms
+from tracker import IoUTracker
+
+def create_stream_tracker(tracker_config="bytetrack.yaml", frame_rate=30):
+    """Build a standalone ultralytics tracker for one video stream"""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.trackers.bot_sort import BOTSORT
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    try:
+        from ultralytics.utils import YAML
+        config = YAML.load(check_yaml(tracker_config))
+    except ImportError:
+        from ultralytics.utils import yaml_load
+        config = yaml_load(check_yaml(tracker_config))
+    tracker_class = BOTSORT if config["tracker_type"] == "botsort" else BYTETracker
+    if "frame_rate" in inspect.signature(tracker_class.__init__).parameters:
+        return tracker_class(IterableSimpleNamespace(**config), frame_rate=frame_rate)
+    # Newer ultralytics takes only args and counts track_buffer in frames; scale it
+    # the way older versions did so lost tracks live as long at any frame rate
+    config["track_buffer"] = int(frame_rate / 30.0 * config["track_buffer"])
+    return tracker_class(IterableSimpleNamespace(**config))
 
 class ObjectDetector:
-    def __init__(self, model_path="yolov8n.pt"):
-        self.model = YOLO(model_path)
-        self.names = self.model.names
+    """YOLO person detection with per-stream tracking.
+    
+    backend="ultralytics" runs the PyTorch model with ultralytics trackers and
+    returns ultralytics results. "onnxruntime" and "opencv" run an exported
+    ONNX model (see detector_backends.export_onnx) without importing torch,
+    track with the lightweight IoUTracker and return Detections instead;
+    MovementTracker and get_person_boxes accept either.
+    
+    person_only restricts inference to the person class, so the model's NMS
+    and box extraction never see the other 79 COCO classes; imgsz is the
+    inference size (320 suits the 320x240 capture) and the confidence/IoU
+    thresholds are applied inside the model call rather than afterwards.
+    
+    tracker="iou" also puts the ultralytics backend on IoUTracker. With the
+    IoUTracker, detect_interval=k runs the model on every k-th frame of a
+    stream only; the frames in between get the tracker's constant-velocity
+    predictions, so tracking keeps the camera frame rate.
+    """
+    
+    def __init__(self, model_path="yolov8n.pt", tracker_config="bytetrack.yaml", backend="ultralytics",
+                 imgsz=640, person_only=False, conf_threshold=0.25, iou_threshold=0.7, tracker="bytetrack",
+                 detect_interval=1):
+        self.imgsz = imgsz
+        self.classes = [PERSON_CLASS] if person_only else None
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        if backend == "ultralytics":
+            # Imported here so the ONNX backends never load PyTorch
+            from ultralytics import YOLO
+            self.model = YOLO(model_path)
+            self.backend = None
+            self.names = self.model.names
+        else:
+            self.model = None
+            # Only people are tracked, so other classes are always dropped before NMS
+            self.backend = create_backend(backend, model_path, imgsz=imgsz, conf_threshold=conf_threshold,
+                                          iou_threshold=iou_threshold, classes=[PERSON_CLASS])
+            self.names = self.backend.names
+        self.tracker_config = tracker_config
+        self.light_tracking = self.backend is not None or tracker == "iou"
+        self.detect_interval = detect_interval if self.light_tracking else 1
+        self.stream_frames = {}
+        self.stream_trackers = {}
+        self.roi_pixels = 0
+        self.full_pixels = 0
         self.logger = logging.getLogger(__name__)
         
     def detect_objects(self, frame):
         """Detect objects in the frame using YOLO"""
         try:
-            results = self.model.track(frame, persist=True)
+            if self.light_tracking:
+                return self._detect_light(0, frame)
+            results = self.model.track(frame, persist=True, **self._predict_args())
             return results
         except Exception as e:
             self.logger.error(f"Error in object detection: {str(e)}")
             return None
             
+    def detect_batch(self, frames, stream_ids):
+        """Run one batched inference over frames from several streams.
+        
+        Each stream keeps its own tracker, so IDs stay consistent per camera no
+        matter how the batch is composed. Returns {stream_id: results} where
+        results has the same shape as detect_objects() output.
+        """
+        if self.light_tracking:
+            return {stream_id: self._detect_light(stream_id, frame) for stream_id, frame in zip(stream_ids, frames)}
+        try:
+            batch_results = self.model.predict(list(frames), **self._predict_args())
+        except Exception as e:
+            self.logger.error(f"Error in batched detection: {str(e)}")
+            return {}
+            
+        tracked = {}
+        for stream_id, result in zip(stream_ids, batch_results):
+            try:
+                tracked[stream_id] = [self._track_result(stream_id, result)]
+            except Exception as e:
+                # One stream's tracker failing must not cost the other streams their results
+                self.logger.error(f"Error tracking stream {stream_id}: {str(e)}")
+        return tracked
+        
+    def _predict_args(self, imgsz=None):
+        """Keyword arguments for ultralytics predict/track calls"""
+        return {
+            'imgsz': imgsz or self.imgsz,
+            'classes': self.classes,
+            'conf': self.conf_threshold,
+            'iou': self.iou_threshold,
+            'verbose': False,
+        }
+        
+    def _detect_plain(self, frame, imgsz=None):
+        """Untracked Detections from whichever backend is loaded"""
+        if self.backend:
+            return self.backend.detect(frame)
+        return Detections.from_results(self.model.predict(frame, **self._predict_args(imgsz)))
+        
+    def _stream_tracker(self, stream_id):
+        tracker = self.stream_trackers.get(stream_id)
+        if tracker is None:
+            tracker = IoUTracker()
+            self.stream_trackers[stream_id] = tracker
+        return tracker
+        
+    def _predicted(self, stream_id):
+        """Tracker predictions when this is not a detection frame of the stream, else None"""
+        count = self.stream_frames.get(stream_id, 0)
+        self.stream_frames[stream_id] = count + 1
+        if count % self.detect_interval == 0:
+            return None
+        return self._stream_tracker(stream_id).predict()
+        
+    def _detect_light(self, stream_id, frame):
+        """Detect on a whole frame and track with the stream's IoUTracker"""
+        predicted = self._predicted(stream_id)
+        if predicted is not None:
+            return predicted
+        return self._stream_tracker(stream_id).update(self._detect_plain(frame))
+        
+    def _track_result(self, stream_id, result):
+        """Assign track IDs to a plain prediction using the stream's own tracker"""
+        import torch
+        tracker = self.stream_trackers.get(stream_id)
+        if tracker is None:
+            tracker = create_stream_tracker(self.tracker_config)
+            self.stream_trackers[stream_id] = tracker
+            
+        detections = result.boxes.cpu().numpy()
+        if len(detections) == 0:
+            return result
+        tracks = tracker.update(detections, result.orig_img)
+        if len(tracks) == 0:
+            return result
+        # Last column is the index of the source detection
+        result = result[tracks[:, -1].astype(int)]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+        
+    def detect_rois(self, frame, rois, stream_id=0, nms_iou=0.6):
+        """Detect only inside motion regions and map the boxes back to the full frame.
+        
+        rois is a list of (x1, y1, x2, y2) crops; None means run on the whole
+        frame. Each batch is letterboxed to the largest crop instead of the
+        model's full input size, which is where the pixel savings come from.
+        Fixed-input ONNX backends would pay a full inference per crop, so they
+        run once on the whole frame instead. IDs come from the stream's own
+        tracker, so crops and full frames can be mixed on the same stream.
+        """
+        try:
+            if self.light_tracking:
+                return self._detect_rois_light(frame, rois, stream_id, nms_iou)
+            import torch
+            import torchvision
+            from ultralytics.engine.results import Results
+            pixels = frame.shape[0] * frame.shape[1]
+            self.full_pixels += pixels
+            if not rois:
+                self.roi_pixels += pixels
+                result = self.model.predict(frame, **self._predict_args())[0]
+                return [self._track_result(stream_id, result)]
+                
+            crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rois]
+            longest = max(max(crop.shape[:2]) for crop in crops)
+            imgsz = min(self.imgsz, max(64, -(-longest // 32) * 32))
+            crop_results = self.model.predict(crops, **self._predict_args(imgsz))
+            
+            boxes = []
+            for (x1, y1, _, _), result in zip(rois, crop_results):
+                data = result.boxes.data.clone()
+                data[:, [0, 2]] += x1
+                data[:, [1, 3]] += y1
+                boxes.append(data)
+            boxes = torch.cat(boxes) if boxes else torch.zeros((0, 6))
+            
+            # A person straddling two overlapping crops is detected twice
+            if len(boxes) > 1:
+                offsets = boxes[:, 5:6] * 4096  # keep NMS per class
+                keep = torchvision.ops.nms(boxes[:, :4] + offsets, boxes[:, 4], nms_iou)
+                boxes = boxes[keep]
+                
+            result = Results(orig_img=frame, path="", names=self.names, boxes=boxes)
+            self.roi_pixels += sum(crop.shape[0] * crop.shape[1] for crop in crops)
+            return [self._track_result(stream_id, result)]
+        except Exception as e:
+            self.logger.error(f"Error in ROI detection: {str(e)}")
+            return None
+            
+    def _detect_rois_light(self, frame, rois, stream_id, nms_iou):
+        """detect_rois on the IoUTracker path, one model call per crop"""
+        predicted = self._predicted(stream_id)
+        if predicted is not None:
+            return predicted
+        pixels = frame.shape[0] * frame.shape[1]
+        self.full_pixels += pixels
+        if not rois or (self.backend and self.backend.fixed_input):
+            self.roi_pixels += pixels
+            return self._stream_tracker(stream_id).update(self._detect_plain(frame))
+        parts = []
+        for x1, y1, x2, y2 in rois:
+            crop = frame[y1:y2, x1:x2]
+            detections = self._detect_plain(crop, min(self.imgsz, max(64, -(-max(crop.shape[:2]) // 32) * 32)))
+            detections.xyxy[:, [0, 2]] += x1
+            detections.xyxy[:, [1, 3]] += y1
+            parts.append(detections)
+            self.roi_pixels += (y2 - y1) * (x2 - x1)
+        detections = Detections(np.concatenate([d.xyxy for d in parts]), np.concatenate([d.conf for d in parts]),
+                                np.concatenate([d.cls for d in parts]))
+        # A person straddling two overlapping crops is detected twice
+        if len(detections) > 1:
+            detections = detections[nms(detections.xyxy, detections.conf, detections.cls, nms_iou)]
+        return self._stream_tracker(stream_id).update(detections)
+        
+    def roi_pixel_ratio(self):
+        """Share of frame pixels actually cropped out for the model in ROI mode"""
+        return self.roi_pixels / self.full_pixels if self.full_pixels else 1.0
+        
+    def reset_stream(self, stream_id):
+        """Forget the tracker state of a stream (e.g. after its camera reconnects)"""
+        self.stream_trackers.pop(stream_id, None)
+        self.stream_frames.pop(stream_id, None)
+        
     def get_person_boxes(self, results):
         """Extract person boxes from detection results"""
+        if isinstance(results, Detections):
+            return results.persons()
         if not results or len(results) == 0:
             return []
             
@@ -33,4 +267,76 @@ class ObjectDetector:
         x1, y1, x2, y2 = box.xyxy[0]
         x = (x1 + x2) / 2
         y = (y1 + y2) / 2
-        return x, y 
\ No newline at end of file
+        return x, y
+
+class BatchCollector:
+    """Collects the newest frame from several cameras into one detector batch"""
+    
+    def __init__(self, detector, cameras, batch_size=4, max_wait=0.02):
+        self.detector = detector
+        self.cameras = dict(cameras)  # stream_id -> CameraManager in background capture mode
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.frames = 0
+        self._next_start = 0
+        self.logger = logging.getLogger(__name__)
+        
+    def collect(self, timeout=1.0):
+        """Gather up to batch_size frames, waiting at most max_wait after the first one.
+        
+        Each camera contributes at most one frame per batch. Returns a list of
+        (stream_id, frame, capture_timestamp, frame_index), empty if no camera
+        produced a frame within timeout seconds.
+        """
+        stream_ids = list(self.cameras)
+        # Rotate the polling order so no camera is starved when batch_size < cameras
+        start = self._next_start % len(stream_ids)
+        stream_ids = stream_ids[start:] + stream_ids[:start]
+        self._next_start += 1
+        
+        limit = min(self.batch_size, len(stream_ids))
+        batch = []
+        waiting = stream_ids
+        first_frame_time = None
+        deadline = time.monotonic() + timeout
+        while len(batch) < limit:
+            for stream_id in list(waiting):
+                success, frame, timestamp, index = self.cameras[stream_id].read_latest(timeout=0)
+                if success:
+                    # Copy out of the capture ring, the buffer is reused on the next read
+                    batch.append((stream_id, frame.copy(), timestamp, index))
+                    waiting.remove(stream_id)
+                    if first_frame_time is None:
+                        first_frame_time = time.monotonic()
+                    if len(batch) >= limit:
+                        break
+            now = time.monotonic()
+            if first_frame_time is not None and now - first_frame_time >= self.max_wait:
+                break
+            if first_frame_time is None and now >= deadline:
+                break
+            if len(batch) < limit:
+                time.sleep(0.001)
+        return batch
+        
+    def run_batch(self):
+        """Collect one batch and run it through the detector.
+        
+        Returns a list of (stream_id, frame, capture_timestamp, frame_index, results).
+        """
+        return self.detect(self.collect())
+        
+    def detect(self, batch):
+        """Run collected items through the detector, appending each stream's results (None on failure)"""
+        if not batch:
+            return []
+        tracked = self.detector.detect_batch(
+            [item[1] for item in batch], [item[0] for item in batch]
+        )
+        self.batches += 1
+        self.frames += len(batch)
+        return [item + (tracked.get(item[0]),) for item in batch]
+        
+    def mean_batch_size(self):
+        return self.frames / self.batches if self.batches else 0.0
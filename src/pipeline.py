@@ -0,0 +1,243 @@
+import logging
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+class FramePacket:
+    """A frame and everything the stages attach to it on its way through"""
+    __slots__ = ("index", "timestamp", "frame", "motion", "rois", "results", "person_boxes", "verdicts")
+
+    def __init__(self, index, timestamp, frame):
+        self.index = index
+        self.timestamp = timestamp
+        self.frame = frame
+        self.motion = True
+        self.rois = None
+        self.results = None
+        self.person_boxes = []
+        self.verdicts = None
+
+
+class DropOldestQueue:
+    """Bounded queue that discards the oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """Add an item, dropping the oldest one when the queue is full"""
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None on timeout or after close()"""
+        with self._condition:
+            if not self._items and not self._closed:
+                self._condition.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        """Wake up all waiting consumers"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def qsize(self):
+        with self._condition:
+            return len(self._items)
+
+
+class Stage:
+    """One pipeline step running `func` on a thread or in a worker process.
+
+    A stage without an input queue is a source and calls func() repeatedly;
+    every other stage calls func(item). Returning None drops the item.
+    The process executor needs a picklable func, i.e. a module-level
+    function such as server_main.detect_in_process; a bound method would
+    carry its object (and any locks or sockets in it) to the worker.
+    """
+
+    def __init__(self, name, func, executor="thread", initializer=None, initargs=()):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor '{executor}' for stage {name}")
+        if executor == "process":
+            try:
+                pickle.dumps(func)
+            except Exception as e:
+                raise ValueError(f"Stage {name} cannot run in a process, its function does not pickle: {str(e)}")
+        self.name = name
+        self.func = func
+        self.executor = executor
+        self.initializer = initializer
+        self.initargs = initargs
+        self.input_queue = None
+        self.output_queue = None
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        # metrics.Metrics recording the duration of every call, set by Pipeline
+        self.metrics = None
+        self._pool = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start the stage worker"""
+        if self.executor == "process":
+            # func, initializer and items must be picklable in this mode
+            self._pool = ProcessPoolExecutor(
+                max_workers=1, initializer=self.initializer, initargs=self.initargs
+            )
+        elif self.initializer:
+            self.initializer(*self.initargs)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the stage worker and its process pool"""
+        self._stop_event.set()
+        if self.input_queue:
+            self.input_queue.close()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _call(self, *args):
+        if self._pool:
+            return self._pool.submit(self.func, *args).result()
+        return self.func(*args)
+
+    def _run(self):
+        """Pull items, process them and push the results downstream"""
+        while not self._stop_event.is_set():
+            if self.input_queue is None:
+                args = ()
+            else:
+                item = self.input_queue.get(timeout=0.1)
+                if item is None:
+                    continue
+                args = (item,)
+
+            start = time.perf_counter()
+            try:
+                result = self._call(*args)
+            except Exception as e:
+                self.errors += 1
+                self.logger.error(f"Error in stage {self.name}: {str(e)}")
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                self.busy_seconds += elapsed
+                if self.metrics:
+                    self.metrics.record(self.name, elapsed)
+
+            self.processed += 1
+            if result is None:
+                continue
+            if self.output_queue is not None:
+                self.output_queue.put(result)
+
+
+class Pipeline:
+    """Chain of stages connected by bounded drop-oldest queues"""
+
+    def __init__(self, queue_size=2, metrics=None):
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.stages = []
+        self.queues = []
+        self.is_running = False
+        self._start_time = None
+        # window name -> (time, processed by stage) of that caller's previous stats() call
+        self._windows = {}
+        self._windows_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def add_stage(self, name, func, executor="thread", initializer=None, initargs=(), queue_size=None):
+        """Append a stage; the first stage added is the source"""
+        stage = Stage(name, func, executor, initializer, initargs)
+        stage.metrics = self.metrics
+        if self.stages:
+            queue = DropOldestQueue(queue_size or self.queue_size)
+            self.stages[-1].output_queue = queue
+            stage.input_queue = queue
+            self.queues.append(queue)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        """Start all stages, sinks first so nothing is produced into a dead queue"""
+        for stage in reversed(self.stages):
+            stage.start()
+        self.is_running = True
+        self._start_time = time.perf_counter()
+        self.logger.info(f"Pipeline started with stages: {[s.name for s in self.stages]}")
+
+    def stop(self):
+        """Stop all stages, source first"""
+        self.is_running = False
+        for stage in self.stages:
+            stage.stop()
+        self.logger.info("Pipeline stopped")
+
+    def stats(self, window=None):
+        """Per-stage counters, throughput, queue depths and drops.
+
+        fps is measured since the previous call with the same `window` name,
+        so each periodic reader (the log, a dashboard) keeps its own rate
+        without disturbing the others; window=None gives the average since
+        start and changes nothing.
+        """
+        now = time.perf_counter()
+        processed_now = {stage.name: stage.processed for stage in self.stages}
+        with self._windows_lock:
+            since, previous = self._windows.get(window, (self._start_time or now, {}))
+            if window is not None:
+                self._windows[window] = (now, processed_now)
+        elapsed = max(now - since, 1e-9)
+
+        stats = {}
+        for stage in self.stages:
+            processed = processed_now[stage.name]
+            entry = {
+                "executor": stage.executor,
+                "processed": processed,
+                "errors": stage.errors,
+                "fps": (processed - previous.get(stage.name, 0)) / elapsed,
+                "busy_seconds": stage.busy_seconds,
+            }
+            if stage.input_queue is not None:
+                entry["queue_depth"] = stage.input_queue.qsize()
+                entry["queue_dropped"] = stage.input_queue.dropped
+            stats[stage.name] = entry
+        return stats
+
+    def format_stats(self, window="log"):
+        """One-line summary of stats() for periodic logging"""
+        parts = []
+        for name, entry in self.stats(window).items():
+            part = f"{name}: {entry['fps']:.1f} fps"
+            if "queue_depth" in entry:
+                part += f" (queue {entry['queue_depth']}, dropped {entry['queue_dropped']})"
+            parts.append(part)
+        return " | ".join(parts)
@@ -0,0 +1,139 @@
+import socket
+import struct
+import time
+from collections import namedtuple
+
+# Wire format (network byte order):
+#   magic(4s) version(B) type(B) flags(H) sequence(I) timestamp_ns(Q) length(I)
+# followed by `length` bytes of payload (raw JPEG for frame messages).
+# Payloads of messages with FLAG_ENCRYPTED set are sealed by secure_channel.
+MAGIC = b"MCAM"
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct("!4sBBHIQI")
+HEADER_SIZE = HEADER.size
+
+# Message types
+MSG_KEY = 1  # stream key, sealed with the session key
+MSG_FRAME = 2
+MSG_COMMAND = 3
+MSG_METADATA = 4
+MSG_TILES = 5
+MSG_HEARTBEAT = 6
+MSG_HELLO = 7
+MSG_HANDSHAKE = 8
+
+# Header flags
+FLAG_ENCRYPTED = 0x0001
+
+MAX_PAYLOAD_SIZE = 32 * 1024 * 1024
+SEQUENCE_MASK = 0xFFFFFFFF
+
+MessageHeader = namedtuple(
+    "MessageHeader",
+    ["version", "msg_type", "flags", "sequence", "timestamp_ns", "length"]
+)
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends data that does not follow the wire format"""
+
+
+def pack_header(msg_type, sequence, length, timestamp_ns=None, flags=0):
+    """Build the fixed-size header for a message"""
+    if timestamp_ns is None:
+        timestamp_ns = time.time_ns()
+    return HEADER.pack(
+        MAGIC, PROTOCOL_VERSION, msg_type, flags,
+        sequence & SEQUENCE_MASK, timestamp_ns, length
+    )
+
+
+def unpack_header(data):
+    """Parse and validate a header from a bytes-like object"""
+    magic, version, msg_type, flags, sequence, timestamp_ns, length = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad magic {magic!r}")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload of {length} bytes exceeds limit")
+    return MessageHeader(version, msg_type, flags, sequence, timestamp_ns, length)
+
+
+def send_message(sock, msg_type, sequence, payload, timestamp_ns=None, flags=0):
+    """Send one message without concatenating header and payload"""
+    payload = memoryview(payload).cast("B")
+    header = pack_header(msg_type, sequence, len(payload), timestamp_ns, flags)
+    send_packed(sock, header, payload)
+
+
+def send_packed(sock, header, payload):
+    """Send a header built by pack_header followed by its payload"""
+    if hasattr(sock, "sendmsg"):
+        _sendmsg_all(sock, [header, payload])
+    else:
+        # Windows has no sendmsg; a single write keeps Nagle from delaying the payload
+        sock.sendall(header + bytes(payload))
+
+
+def _sendmsg_all(sock, buffers):
+    """Gather-write all buffers, handling partial sends"""
+    views = [memoryview(b).cast("B") for b in buffers]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if views and sent:
+            views[0] = views[0][sent:]
+
+
+class MessageReader:
+    """Reads framed messages from a socket into a reusable buffer"""
+
+    def __init__(self, sock, initial_size=256 * 1024):
+        self.sock = sock
+        self._header = bytearray(HEADER_SIZE)
+        self._header_view = memoryview(self._header)
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+
+    def read_message(self):
+        """Read the next message.
+
+        Returns (header, payload) where payload is a memoryview into the
+        reader's buffer that stays valid only until the next call, or None
+        when the peer closed the connection.
+        """
+        if not self._recv_exact(self._header_view):
+            return None
+        header = unpack_header(self._header)
+        if header.length > len(self._buffer):
+            self._buffer = bytearray(max(header.length, 2 * len(self._buffer)))
+            self._view = memoryview(self._buffer)
+        payload = self._view[:header.length]
+        if not self._recv_exact(payload):
+            return None
+        return header, payload
+
+    def _recv_exact(self, view):
+        """Fill the whole view from the socket, returning False on EOF"""
+        received = 0
+        total = len(view)
+        while received < total:
+            try:
+                count = self.sock.recv_into(view[received:], total - received)
+            except InterruptedError:
+                continue
+            if count == 0:
+                return False
+            received += count
+        return True
+
+
+def enable_low_latency(sock):
+    """Disable Nagle so small headers are not held back"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
@@ -0,0 +1,310 @@
+import bisect
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from pipeline import DropOldestQueue
+
+# A recording is a directory of segments, each a pair of files named after the
+# timestamp of its first frame:
+#   <start_ns>.mjpg  the encoded JPEGs back to back
+#   <start_ns>.idx   one INDEX_ENTRY per frame, in timestamp order
+INDEX_ENTRY = np.dtype([
+    ("timestamp_ns", ">u8"),
+    ("offset", ">u8"),
+    ("length", ">u4"),
+])
+DATA_SUFFIX = ".mjpg"
+INDEX_SUFFIX = ".idx"
+
+
+class Segment:
+    """Read side of one segment: the index is loaded once, frame data is memory-mapped"""
+
+    def __init__(self, directory, start_ns):
+        self.start_ns = start_ns
+        self.data_path = os.path.join(directory, f"{start_ns}{DATA_SUFFIX}")
+        self.index_path = os.path.join(directory, f"{start_ns}{INDEX_SUFFIX}")
+        index = np.fromfile(self.index_path, dtype=INDEX_ENTRY)
+        # After a crash the index may be ahead of the data; ignore entries past its end
+        data_size = os.path.getsize(self.data_path)
+        self.index = index[index["offset"].astype(np.uint64) + index["length"] <= data_size]
+        self._timestamps = self.index["timestamp_ns"].astype(np.uint64)
+        self._file = None
+        self._map = None
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def end_ns(self):
+        return int(self._timestamps[-1]) if len(self.index) else self.start_ns
+
+    def _data(self):
+        if self._map is None:
+            self._file = open(self.data_path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def position(self, timestamp_ns):
+        """Index of the last frame at or before timestamp_ns, or -1"""
+        return int(np.searchsorted(self._timestamps, np.uint64(timestamp_ns), side="right")) - 1
+
+    def frame(self, position):
+        """(timestamp_ns, JPEG bytes as a memoryview into the mapping) of one frame"""
+        timestamp_ns, offset, length = self.index[position].tolist()
+        return timestamp_ns, memoryview(self._data())[offset:offset + length]
+
+    def frames(self, start_ns, end_ns):
+        """Frames with start_ns <= timestamp < end_ns"""
+        first = int(np.searchsorted(self._timestamps, np.uint64(start_ns), side="left"))
+        last = int(np.searchsorted(self._timestamps, np.uint64(end_ns), side="left"))
+        for position in range(first, last):
+            yield self.frame(position)
+
+    def close(self):
+        if self._map is None:
+            return
+        try:
+            self._map.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping goes away with it
+            pass
+        self._file.close()
+        self._map = self._file = None
+
+
+class Recorder:
+    """Appends already-encoded frames to rotating segment files on a background thread.
+
+    Frames are handed over with write() (for example as a SecurityServer frame
+    listener) and written with large buffered writes; the capture and
+    broadcast path never touches the disk. Segments rotate after
+    segment_bytes or segment_seconds, and the oldest are deleted once the
+    recording exceeds retention_bytes.
+    """
+
+    def __init__(self, directory="recordings", segment_bytes=64 * 1024 * 1024, segment_seconds=300,
+                 retention_bytes=4 * 1024 * 1024 * 1024, write_buffer=1024 * 1024, queue_size=64):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.retention_bytes = retention_bytes
+        self.write_buffer = write_buffer
+        self.logger = logging.getLogger(__name__)
+
+        self._queue = DropOldestQueue(maxsize=queue_size)
+        self._lock = threading.Lock()  # guards the open segment against readers
+        self._thread = None
+        self.is_running = False
+
+        self._data_file = None
+        self._index_file = None
+        self._segment_start = None
+        self._segment_size = 0
+        self._index_cache = OrderedDict()
+
+        # Statistics
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.segments_deleted = 0
+
+    def start(self):
+        """Start the writer thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.is_running = True
+        self._thread = threading.Thread(target=self._run, name="recorder")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, timestamp_ns, jpeg):
+        """Queue one encoded frame; the buffer must not be modified afterwards"""
+        if self.is_running:
+            self._queue.put((timestamp_ns, jpeg))
+
+    @property
+    def frames_dropped(self):
+        return self._queue.dropped
+
+    def _run(self):
+        """Drain the queue into the current segment until stopped"""
+        while self.is_running or self._queue.qsize():
+            item = self._queue.get(timeout=0.5)
+            if item is None:
+                continue
+            try:
+                with self._lock:
+                    self._append(*item)
+            except OSError as e:
+                self.logger.error(f"Recording write failed: {str(e)}")
+        with self._lock:
+            self._close_segment()
+
+    def _append(self, timestamp_ns, jpeg):
+        if self._data_file is None or self._rotation_due(timestamp_ns):
+            self._close_segment()
+            self._enforce_retention()
+            self._open_segment(timestamp_ns)
+        length = len(jpeg)
+        entry = np.array([(timestamp_ns, self._segment_size, length)], dtype=INDEX_ENTRY)
+        self._data_file.write(jpeg)
+        self._index_file.write(entry.tobytes())
+        self._segment_size += length
+        self.frames_written += 1
+        self.bytes_written += length
+
+    def _rotation_due(self, timestamp_ns):
+        return (self._segment_size >= self.segment_bytes
+                or timestamp_ns - self._segment_start >= self.segment_seconds * 1e9)
+
+    def _open_segment(self, start_ns):
+        base = os.path.join(self.directory, str(start_ns))
+        self._data_file = open(base + DATA_SUFFIX, "ab", buffering=self.write_buffer)
+        self._index_file = open(base + INDEX_SUFFIX, "ab", buffering=64 * 1024)
+        self._segment_start = start_ns
+        # Appending to an existing segment (same start after a restart) keeps its offsets valid
+        self._segment_size = self._data_file.tell()
+
+    def _close_segment(self):
+        if self._data_file is None:
+            return
+        # Data first, so an index entry never points past the end of the data
+        self._data_file.close()
+        self._index_file.close()
+        self._data_file = self._index_file = None
+
+    def _flush(self):
+        if self._data_file is not None:
+            self._data_file.flush()
+            self._index_file.flush()
+
+    def segment_starts(self):
+        """Start timestamps of all segments on disk, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(INDEX_SUFFIX)]) for name in names
+                      if name.endswith(INDEX_SUFFIX) and name[:-len(INDEX_SUFFIX)].isdigit())
+
+    def _enforce_retention(self):
+        """Delete the oldest closed segments until the recording fits the budget"""
+        starts = self.segment_starts()
+        sizes = [self._segment_disk_size(start) for start in starts]
+        total = sum(sizes)
+        for start, size in zip(starts, sizes):
+            if total <= self.retention_bytes:
+                break
+            for suffix in (DATA_SUFFIX, INDEX_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.directory, f"{start}{suffix}"))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self._index_cache.pop(start, None)
+            self.segments_deleted += 1
+            self.logger.info(f"Retention removed segment {start}")
+
+    def _segment_disk_size(self, start):
+        size = 0
+        for suffix in (DATA_SUFFIX, INDEX_SUFFIX):
+            try:
+                size += os.path.getsize(os.path.join(self.directory, f"{start}{suffix}"))
+            except FileNotFoundError:
+                pass
+        return size
+
+    def open_segment(self, timestamp_ns):
+        """Segment holding timestamp_ns (the last one starting at or before it), or None"""
+        starts = self.segment_starts()
+        position = bisect.bisect_right(starts, timestamp_ns) - 1
+        if position < 0:
+            return None
+        with self._lock:
+            if starts[position] == self._segment_start:
+                # Make the open segment's buffered tail visible to the mapping
+                self._flush()
+            return Segment(self.directory, starts[position])
+
+    def frame_at(self, timestamp_ns):
+        """(timestamp_ns, JPEG bytes) of the last frame recorded at or before timestamp_ns, or None"""
+        segment = self.open_segment(timestamp_ns)
+        if segment is None:
+            return None
+        position = segment.position(timestamp_ns)
+        if position < 0:
+            return None
+        timestamp, jpeg = segment.frame(position)
+        return timestamp, bytes(jpeg)
+
+    def locate(self, timestamp_ns, tolerance_ns=10 ** 9):
+        """Recorded frame nearest to timestamp_ns as (segment_start, offset, length), or None.
+
+        Frames further than tolerance_ns away do not count.
+        """
+        starts = self.segment_starts()
+        position = bisect.bisect_right(starts, timestamp_ns) - 1
+        best = None
+        # The nearest frame is in the segment holding the time or at the start of the next one
+        for start in starts[max(position, 0):position + 2]:
+            index = self._closed_index(start)
+            if index is None:
+                segment = self.open_segment(start)
+                index = segment.index
+            timestamps = index["timestamp_ns"].astype(np.int64)
+            if not len(timestamps):
+                continue
+            at = int(np.searchsorted(timestamps, timestamp_ns))
+            for candidate in (at - 1, at):
+                if 0 <= candidate < len(timestamps):
+                    distance = abs(int(timestamps[candidate]) - timestamp_ns)
+                    if distance <= tolerance_ns and (best is None or distance < best[0]):
+                        _, offset, length = index[candidate].tolist()
+                        best = (distance, (start, offset, length))
+        return None if best is None else best[1]
+
+    def _closed_index(self, start):
+        """Index of a closed segment, cached for repeated lookups; None for the open one"""
+        if start == self._segment_start and self._data_file is not None:
+            return None
+        index = self._index_cache.get(start)
+        if index is None:
+            index = Segment(self.directory, start).index
+            self._index_cache[start] = index
+            while len(self._index_cache) > 16:
+                self._index_cache.popitem(last=False)
+        return index
+
+    def frames(self, start_ns, end_ns):
+        """Yield (timestamp_ns, JPEG memoryview) for every frame in [start_ns, end_ns).
+
+        Each memoryview points into a segment mapping that is closed when the
+        generator moves on, so copy what must outlive the iteration step.
+        """
+        starts = self.segment_starts()
+        first = max(bisect.bisect_right(starts, start_ns) - 1, 0)
+        for start in starts[first:]:
+            if start >= end_ns:
+                break
+            segment = self.open_segment(start)
+            try:
+                yield from segment.frames(start_ns, end_ns)
+            finally:
+                segment.close()
+
+    def stats(self):
+        return {
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'bytes_written': self.bytes_written,
+            'segments_deleted': self.segments_deleted,
+        }
+
+    def stop(self):
+        """Write out everything queued and close the open segment"""
+        self.is_running = False
+        self._queue.close()
+        if self._thread:
+            self._thread.join(timeout=10)
@@ -0,0 +1,319 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from protocol import MSG_KEY, FLAG_ENCRYPTED, pack_header, unpack_header
+
+# Handshake, before anything else is exchanged:
+#   client -> server  MSG_HELLO      client_x25519(32) client_nonce(16)
+#   server -> client  MSG_HANDSHAKE  server_x25519(32) server_identity(32) signature(64)
+# The server signs the transcript with its long-term Ed25519 identity and both
+# sides derive one key per direction with HKDF. The server then sends the
+# current stream key as a MSG_KEY sealed with its session key; frames are
+# sealed once with the stream key and shared by every client.
+HELLO = struct.Struct("!32s16s")
+HANDSHAKE = struct.Struct("!32s32s64s")
+HKDF_INFO = b"MCAM session v2"
+STREAM_KEY = struct.Struct("!I32s")  # key_id, key
+STREAM_KEY_LIFETIME = 600.0
+
+# Sealed payload: nonce(12) ciphertext tag(16), the nonce being key_id(4) counter(8)
+NONCE = struct.Struct("!IQ")
+NONCE_SIZE = NONCE.size
+TAG_SIZE = 16
+SEAL_OVERHEAD = NONCE_SIZE + TAG_SIZE
+_BLOCK_SLACK = 15  # update_into wants room for one more block than it writes
+
+SERVER_TO_CLIENT = 0
+CLIENT_TO_SERVER = 1
+
+
+class HandshakeError(Exception):
+    """Raised when the peer cannot be authenticated or the handshake is malformed"""
+
+
+class IdentityMismatch(HandshakeError):
+    """Raised when the server signs with another identity than the pinned one"""
+
+
+def load_identity(path=None):
+    """Load the server's Ed25519 identity, generating one (and saving it to path) if missing"""
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            return serialization.load_pem_private_key(f.read(), password=None)
+    identity = Ed25519PrivateKey.generate()
+    if path:
+        with open(path, "wb") as f:
+            f.write(identity.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ))
+        os.chmod(path, 0o600)
+    return identity
+
+
+def public_bytes(private_key):
+    """Raw 32-byte public key of an X25519 or Ed25519 private key"""
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw
+    )
+
+
+def fingerprint(identity_public):
+    """Printable fingerprint of a server identity, for pinning on the client"""
+    return hashlib.sha256(identity_public).hexdigest()[:32]
+
+
+class KnownServers:
+    """Trust-on-first-use store of server fingerprints, one "host:port fingerprint" line each.
+
+    Like ssh's known_hosts: the first identity seen for an address is
+    remembered and every later connection must present the same one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 2 and not fields[0].startswith("#"):
+                        entries[fields[0]] = fields[1]
+        return entries
+
+    def lookup(self, host, port):
+        """Pinned fingerprint of host:port, or None if it was never seen"""
+        with self._lock:
+            return self._load().get(f"{host}:{port}")
+
+    def remember(self, host, port, server_fingerprint):
+        """Pin a fingerprint for host:port; an existing pin is kept, to be removed from the file by hand"""
+        with self._lock:
+            address = f"{host}:{port}"
+            if address in self._load():
+                return
+            with open(self.path, "a") as f:
+                f.write(f"{address} {server_fingerprint}\n")
+
+
+def _session_ciphers(shared_secret, transcript, client_nonce):
+    """Derive the (server_to_client, client_to_server) ciphers of one session"""
+    material = HKDF(
+        algorithm=hashes.SHA256(), length=64, salt=client_nonce, info=HKDF_INFO + transcript
+    ).derive(shared_secret)
+    return (MessageCipher(material[:32], SERVER_TO_CLIENT, ordered=True),
+            MessageCipher(material[32:], CLIENT_TO_SERVER, ordered=True))
+
+
+class ClientHandshake:
+    """Client side of the key exchange"""
+
+    def __init__(self, server_fingerprint=None):
+        self.server_fingerprint = server_fingerprint
+        self.server_identity = None
+        self._ephemeral = X25519PrivateKey.generate()
+        self._nonce = os.urandom(16)
+        self.hello = HELLO.pack(public_bytes(self._ephemeral), self._nonce)
+
+    def finish(self, reply):
+        """Authenticate the server's reply and return (receive_cipher, send_cipher)"""
+        if len(reply) != HANDSHAKE.size:
+            raise HandshakeError("Malformed handshake reply")
+        server_public, identity_public, signature = HANDSHAKE.unpack(reply)
+        transcript = self.hello + server_public + identity_public
+        try:
+            Ed25519PublicKey.from_public_bytes(identity_public).verify(signature, transcript)
+        except InvalidSignature:
+            raise HandshakeError("Server signature does not verify")
+        if self.server_fingerprint and fingerprint(identity_public) != self.server_fingerprint:
+            raise IdentityMismatch(f"Server identity {fingerprint(identity_public)} does not match the pinned "
+                                   f"fingerprint {self.server_fingerprint}")
+        self.server_identity = identity_public
+
+        shared = self._ephemeral.exchange(X25519PublicKey.from_public_bytes(server_public))
+        return _session_ciphers(shared, transcript, self._nonce)
+
+
+def server_handshake(identity, hello):
+    """Answer a client hello; returns (reply, send_cipher, receive_cipher)"""
+    if len(hello) != HELLO.size:
+        raise HandshakeError("Malformed hello")
+    client_public, client_nonce = HELLO.unpack(hello)
+    ephemeral = X25519PrivateKey.generate()
+    server_public = public_bytes(ephemeral)
+    identity_public = public_bytes(identity)
+    transcript = bytes(hello) + server_public + identity_public
+
+    shared = ephemeral.exchange(X25519PublicKey.from_public_bytes(client_public))
+    send_cipher, receive_cipher = _session_ciphers(shared, transcript, client_nonce)
+    reply = HANDSHAKE.pack(server_public, identity_public, identity.sign(transcript))
+    return reply, send_cipher, receive_cipher
+
+
+class MessageCipher:
+    """AES-256-GCM over framed messages.
+
+    Each sealed message gets a fresh nonce (key id + counter) and its final
+    header is the associated data, so type, sequence and timestamp are
+    authenticated along with the payload. With ordered=True, opening also
+    rejects replayed or reordered messages: the counter of each opened
+    message must be above the last one. Clients open the shared stream key
+    that way too; the server seals its messages in the order it sends them,
+    so a viewer only sees gaps for messages meant for other viewers.
+    """
+
+    def __init__(self, key, key_id, ordered=False):
+        self.key = key
+        self.key_id = key_id
+        self.ordered = ordered
+        self._algorithm = algorithms.AES(key)
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._last_opened = 0
+        self._open_buffer = bytearray(64 * 1024)
+
+    @property
+    def messages_sealed(self):
+        return self._counter
+
+    def _next_nonce(self):
+        with self._lock:
+            self._counter += 1
+            return NONCE.pack(self.key_id, self._counter)
+
+    def seal(self, header, payload):
+        """Encrypt a (header, payload) message built with pack_header; returns the sealed pair.
+
+        The ciphertext is written straight into the buffer that goes on the
+        wire, between the nonce and the tag, so the payload is copied once.
+        """
+        h = unpack_header(header)
+        payload = memoryview(payload).cast("B")
+        length = len(payload)
+        sealed_header = pack_header(
+            h.msg_type, h.sequence, length + SEAL_OVERHEAD, h.timestamp_ns, h.flags | FLAG_ENCRYPTED
+        )
+        nonce = self._next_nonce()
+        buffer = memoryview(bytearray(SEAL_OVERHEAD + length + _BLOCK_SLACK))
+        buffer[:NONCE_SIZE] = nonce
+        encryptor = Cipher(self._algorithm, modes.GCM(nonce)).encryptor()
+        encryptor.authenticate_additional_data(sealed_header)
+        encryptor.update_into(payload, buffer[NONCE_SIZE:NONCE_SIZE + length + _BLOCK_SLACK])
+        encryptor.finalize()
+        buffer[NONCE_SIZE + length:NONCE_SIZE + length + TAG_SIZE] = encryptor.tag
+        return sealed_header, buffer[:SEAL_OVERHEAD + length]
+
+    def seal_message(self, msg_type, sequence, payload, timestamp_ns=None):
+        """Build and encrypt a message in one step"""
+        payload = memoryview(payload).cast("B")
+        return self.seal(pack_header(msg_type, sequence, len(payload), timestamp_ns), payload)
+
+    def open(self, header, payload):
+        """Decrypt the payload of a received message (header as parsed by unpack_header).
+
+        Returns a memoryview into a reusable buffer that stays valid until the
+        next call. Raises InvalidTag for anything that does not authenticate.
+        """
+        length = len(payload) - SEAL_OVERHEAD
+        if length < 0 or not header.flags & FLAG_ENCRYPTED:
+            raise InvalidTag()
+        key_id, counter = NONCE.unpack_from(payload)
+        if key_id != self.key_id or (self.ordered and counter <= self._last_opened):
+            raise InvalidTag()
+        aad = pack_header(header.msg_type, header.sequence, header.length, header.timestamp_ns, header.flags)
+        if len(self._open_buffer) < length + _BLOCK_SLACK:
+            self._open_buffer = bytearray(2 * (length + _BLOCK_SLACK))
+        out = memoryview(self._open_buffer)
+        decryptor = Cipher(
+            self._algorithm, modes.GCM(bytes(payload[:NONCE_SIZE]), bytes(payload[NONCE_SIZE + length:]))
+        ).decryptor()
+        decryptor.authenticate_additional_data(aad)
+        decryptor.update_into(payload[NONCE_SIZE:NONCE_SIZE + length], out[:length + _BLOCK_SLACK])
+        decryptor.finalize()
+        self._last_opened = counter
+        return out[:length]
+
+
+class StreamKeyring:
+    """Server-side stream key: frames are sealed with it once for all clients.
+
+    The key is replaced after `lifetime` seconds so a client that has left
+    stops being able to read the stream; the new key goes out to every
+    connected session before any frame sealed with it.
+    """
+
+    def __init__(self, lifetime=STREAM_KEY_LIFETIME):
+        self.lifetime = lifetime
+        self.rotations = 0
+        # Stream key ids never collide with the two session directions
+        self._next_key_id = 2 + struct.unpack("!I", os.urandom(4))[0] % 0x7FFFFFFF
+        self.cipher = None
+        self.created_at = 0.0
+        self.rotate()
+
+    def rotate(self):
+        self.cipher = MessageCipher(os.urandom(32), self._next_key_id)
+        self._next_key_id = 2 + (self._next_key_id - 1) % 0xFFFFFFFD
+        self.created_at = time.monotonic()
+        self.rotations += 1
+
+    def rotate_if_due(self):
+        """Rotate an expired key; returns True if the clients need the new one"""
+        if time.monotonic() - self.created_at < self.lifetime:
+            return False
+        self.rotate()
+        return True
+
+    def key_message(self, session_cipher):
+        """MSG_KEY carrying the current stream key, sealed for one session"""
+        payload = STREAM_KEY.pack(self.cipher.key_id, self.cipher.key)
+        return session_cipher.seal_message(MSG_KEY, 0, payload)
+
+
+class StreamKeys:
+    """Client-side stream keys.
+
+    The previous key is kept for frames sealed before the rotation that are
+    still in flight, until the first message under the new key arrives.
+    Every key only opens messages whose counter goes up, so recorded stream
+    messages cannot be replayed.
+    """
+
+    def __init__(self):
+        self._ciphers = {}
+
+    def add(self, payload):
+        """Install a key from a decrypted MSG_KEY payload"""
+        key_id, key = STREAM_KEY.unpack(bytes(payload))
+        if key_id in self._ciphers:
+            return
+        for old_id in list(self._ciphers)[:-1]:
+            del self._ciphers[old_id]
+        self._ciphers[key_id] = MessageCipher(key, key_id, ordered=True)
+
+    def open(self, header, payload):
+        """Decrypt a stream message, raising InvalidTag for unknown keys or bad data"""
+        if len(payload) < NONCE_SIZE:
+            raise InvalidTag()
+        key_id, _ = NONCE.unpack_from(payload)
+        cipher = self._ciphers.get(key_id)
+        if cipher is None:
+            raise InvalidTag()
+        opened = cipher.open(header, payload)
+        if len(self._ciphers) > 1 and key_id == list(self._ciphers)[-1]:
+            # The server has moved to the new key, nothing sealed with the old one follows
+            for old_id in list(self._ciphers)[:-1]:
+                del self._ciphers[old_id]
+        return opened
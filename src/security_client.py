@@ -2,17 +2,67 @@ import socket
 import threading
 import logging
 import json
-import base64
-import cv2
+import time
 import numpy as np
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from protocol import (
+    MSG_KEY, MSG_FRAME, MSG_COMMAND, MSG_METADATA, MSG_TILES, MSG_HEARTBEAT, MSG_HELLO, MSG_HANDSHAKE,
+    MessageReader, send_message, send_packed, enable_low_latency
+)
+from secure_channel import ClientHandshake, HandshakeError, IdentityMismatch, KnownServers, StreamKeys, fingerprint
+from frame_decoder import FrameDecoder, LatestFrame
+from metadata import decode_metadata, draw_metadata
+from metrics import Metrics
+from pipeline import DropOldestQueue
+from tile_codec import TileDecoder
 
 class SecurityClient:
-    def __init__(self, host='localhost', port=5000):
+    """Viewer connection split into a network reader and a decode worker.
+
+    The reader thread only reads, authenticates and queues; JPEG decoding and
+    overlays run on the decode worker, and the display loop polls
+    get_latest_frame(), so a slow decode or GUI never backs up the socket.
+    """
+    
+    def __init__(self, host='localhost', port=5000, video=True, metadata=True, on_metadata=None,
+                 profile='default', mode='full', server_fingerprint=None, known_servers='known_servers',
+                 decode_scale=1, decode_queue=None):
         self.host = host
         self.port = port
+        # Expected fingerprint of the server identity. Without one, the fingerprint pinned in the
+        # known_servers file on first use is required; known_servers=None trusts whatever server answers
+        self.server_fingerprint = server_fingerprint
+        self.known_servers = KnownServers(known_servers) if known_servers else None
+        self.video = video
+        self.profile = profile  # quality profile name from frame_encoder.QUALITY_PROFILES
+        self.mode = mode  # 'full' frames or 'delta' tile updates
+        self.tile_decoder = TileDecoder()
+        # Full frames can be decoded at 1/2, 1/4 or 1/8 size; delta mode always decodes at full size
+        self.frame_decoder = FrameDecoder(decode_scale if mode == 'full' else 1)
+        self.latest_frame = LatestFrame()
+        # Encoded frames waiting for the decode worker; the oldest are dropped when it falls behind,
+        # which in delta mode costs a keyframe round trip, so that queue is longer
+        if decode_queue is None:
+            decode_queue = 2 if mode == 'full' else 8
+        self.decode_queue = DropOldestQueue(decode_queue)
+        self.metadata = metadata
+        # Called as on_metadata(sequence, frame_width, frame_height, records) for headless consumers
+        self.on_metadata = on_metadata
+        self.last_metadata = None
         self.client_socket = None
-        self.cipher_suite = None
+        self.session_receive = None
+        self.session_send = None
+        self.stream_keys = StreamKeys()
+        self.reader = None
+        self.send_lock = threading.Lock()
+        self.command_sequence = 0
+        self.last_frame_sequence = None
+        self.received_frames = 0
+        self.decoded_frames = 0
+        self.decode_seconds = 0.0
+        # 'decode' time per frame and 'glass_to_glass' from capture on the server to get_latest_frame()
+        self.metrics = Metrics()
+        self._awaiting_keyframe = False
         self.is_running = False
         self.logger = logging.getLogger(__name__)
         
@@ -21,16 +71,52 @@ class SecurityClient:
         try:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.connect((self.host, self.port))
+            enable_low_latency(self.client_socket)
+            self.reader = MessageReader(self.client_socket)
+            
+            # Authenticate the server and derive this session's keys
+            expected = self.server_fingerprint
+            if not expected and self.known_servers:
+                expected = self.known_servers.lookup(self.host, self.port)
+            handshake = ClientHandshake(expected)
+            send_message(self.client_socket, MSG_HELLO, 0, handshake.hello)
+            message = self.reader.read_message()
+            if message is None or message[0].msg_type != MSG_HANDSHAKE:
+                raise HandshakeError("Server did not answer the handshake")
+            try:
+                self.session_receive, self.session_send = handshake.finish(message[1])
+            except IdentityMismatch:
+                self.logger.error(f"Server at {self.host}:{self.port} changed its identity, refusing to connect")
+                raise
+            if not expected:
+                server_fingerprint = fingerprint(handshake.server_identity)
+                if self.known_servers:
+                    self.known_servers.remember(self.host, self.port, server_fingerprint)
+                    self.logger.warning(
+                        f"Trusting server identity {server_fingerprint} on first use, "
+                        f"pinned in {self.known_servers.path}"
+                    )
+                else:
+                    self.logger.warning(f"Server identity {server_fingerprint} is not pinned")
             self.is_running = True
             
-            # Receive encryption key from server
-            key = self.client_socket.recv(4096)
-            self.cipher_suite = Fernet(key)
+            # Tell the server which streams we want
+            self.send_command({
+                'action': 'subscribe',
+                'video': self.video,
+                'metadata': self.metadata,
+                'profile': self.profile,
+                'mode': self.mode,
+            })
             
-            # Start receiving data in a separate thread
-            receive_thread = threading.Thread(target=self._receive_data)
+            # Receive on one thread, decode on another
+            receive_thread = threading.Thread(target=self._receive_data, name="client-reader")
             receive_thread.daemon = True
             receive_thread.start()
+            if self.video:
+                decode_thread = threading.Thread(target=self._decode_frames, name="client-decoder")
+                decode_thread.daemon = True
+                decode_thread.start()
             
             self.logger.info(f"Connected to server at {self.host}:{self.port}")
             return True
@@ -40,32 +126,141 @@ class SecurityClient:
             return False
             
     def _receive_data(self):
-        """Receive and process data from server"""
+        """Read and authenticate messages, handing encoded pictures to the decode worker"""
         while self.is_running:
             try:
-                data = self.client_socket.recv(4096)
-                if not data:
+                message = self.reader.read_message()
+                if message is None:
                     break
-                    
-                # Decrypt the data
-                decrypted_data = self.cipher_suite.decrypt(data)
-                message = json.loads(decrypted_data.decode('utf-8'))
+                header, payload = message
                 
-                if message['type'] == 'frame':
-                    # Convert base64 to image
-                    frame_bytes = base64.b64decode(message['data'])
-                    nparr = np.frombuffer(frame_bytes, np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    
-                    # Display the frame
-                    cv2.imshow("Security Camera", frame)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        self.stop()
+                # Everything after the handshake is sealed: stream keys with the
+                # session key, the media itself with the current stream key
+                try:
+                    if header.msg_type == MSG_KEY:
+                        self.stream_keys.add(self.session_receive.open(header, payload))
+                        continue
+                    payload = self.stream_keys.open(header, payload)
+                except InvalidTag:
+                    self.logger.warning(f"Dropping unauthenticated message {header.msg_type}/{header.sequence}")
+                    continue
+                
+                if header.msg_type == MSG_METADATA:
+                    width, height, records = decode_metadata(payload)
+                    self.last_metadata = (header.sequence, width, height, records)
+                    if self.on_metadata:
+                        self.on_metadata(header.sequence, width, height, records)
                         
+                elif header.msg_type in (MSG_FRAME, MSG_TILES):
+                    # The decrypted payload lives in a reusable buffer, the worker gets its own copy
+                    metadata = self.last_metadata
+                    if metadata and metadata[0] != header.sequence:
+                        metadata = None
+                    self.received_frames += 1
+                    self.decode_queue.put((self.received_frames, header, bytes(payload), metadata))
+                    
+                elif header.msg_type == MSG_HEARTBEAT:
+                    # Nothing changed, the displayed picture is still current
+                    self.last_frame_sequence = header.sequence
+                    
             except Exception as e:
                 self.logger.error(f"Error receiving data: {str(e)}")
                 break
-                
+        self.is_running = False
+        self.decode_queue.close()
+        self.latest_frame.close()
+        
+    def _decode_frames(self):
+        """Decode worker: turn queued JPEGs and tile updates into pictures for the display loop"""
+        last_index = 0
+        while self.is_running:
+            item = self.decode_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            index, header, payload, metadata = item
+            start = time.perf_counter()
+            try:
+                if header.msg_type == MSG_FRAME:
+                    frame = self._decode_keyframe(payload)
+                else:
+                    # A dropped tile update leaves holes in the picture until the next keyframe
+                    if index != last_index + 1:
+                        self._request_keyframe()
+                    frame = None if self._awaiting_keyframe else self.tile_decoder.apply_tiles(payload)
+                    if frame is None:
+                        self._request_keyframe()
+                    else:
+                        frame = self._copy_canvas(frame)
+            except Exception as e:
+                self.logger.error(f"Error decoding frame {header.sequence}: {str(e)}")
+                frame = None
+            last_index = index
+            if frame is None:
+                continue
+            if metadata:
+                _, width, height, records = metadata
+                draw_metadata(frame, records, width, height)
+            elapsed = time.perf_counter() - start
+            self.decode_seconds += elapsed
+            self.metrics.record('decode', elapsed)
+            self.decoded_frames += 1
+            self.last_frame_sequence = header.sequence
+            self.latest_frame.publish(frame, index, header.sequence, header.timestamp_ns)
+            
+    def _decode_keyframe(self, jpeg):
+        """Decode a full frame into a spare display buffer; returns it or None"""
+        shape = self.frame_decoder.output_shape(jpeg)
+        buffer = self.latest_frame.buffer(shape) if shape else None
+        frame = self.frame_decoder.decode(jpeg, buffer)
+        if frame is None:
+            self.logger.warning("Failed to decode frame")
+            return None
+        if buffer is not None:
+            frame = buffer
+        if self.mode == 'delta':
+            self.tile_decoder.apply_keyframe(frame)
+            self._awaiting_keyframe = False
+        return frame
+        
+    def _copy_canvas(self, canvas):
+        """Snapshot the delta canvas so it can be drawn on and displayed while tiles keep arriving"""
+        frame = self.latest_frame.buffer(canvas.shape)
+        np.copyto(frame, canvas)
+        return frame
+        
+    def _request_keyframe(self):
+        if not self._awaiting_keyframe:
+            self._awaiting_keyframe = True
+            self.send_command({'action': 'resync'})
+            
+    def get_latest_frame(self, timeout=None):
+        """Newest decoded frame as a frame_decoder.ReceivedFrame, or None if none arrived in time.
+        
+        Frames decoded since the previous call are skipped rather than queued,
+        and the returned frame stays valid until the next call.
+        """
+        received = self.latest_frame.take(timeout)
+        if received is not None:
+            # Header timestamps are capture times on the server clock; across machines this
+            # needs the clocks in sync (NTP), on one machine it is exact
+            self.metrics.record('glass_to_glass', received.latency_ms / 1e3)
+        return received
+        
+    def stats(self, reset_latency=False):
+        """Receive, decode and display counters of this connection plus latency percentiles.
+        
+        reset_latency=True starts a new percentile window, for periodic reporting.
+        """
+        return {
+            'received': self.received_frames,
+            'queue_dropped': self.decode_queue.dropped,
+            'decoded': self.decoded_frames,
+            'decode_ms': 1e3 * self.decode_seconds / max(self.decoded_frames, 1),
+            'displayed': self.latest_frame.taken,
+            'skipped': self.latest_frame.skipped,
+            'latency': self.metrics.snapshot(reset_latency),
+        }
+        
     def send_command(self, command):
         """Send a command to the server"""
         try:
@@ -74,11 +269,13 @@ class SecurityClient:
                 'data': command
             }
             
-            encrypted_message = self.cipher_suite.encrypt(
-                json.dumps(message).encode('utf-8')
-            )
-            
-            self.client_socket.send(encrypted_message)
+            # The decode worker sends resync requests while the caller sends its own commands
+            with self.send_lock:
+                self.command_sequence += 1
+                header, payload = self.session_send.seal_message(
+                    MSG_COMMAND, self.command_sequence, json.dumps(message).encode('utf-8')
+                )
+                send_packed(self.client_socket, header, payload)
             
         except Exception as e:
             self.logger.error(f"Error sending command: {str(e)}")
@@ -88,5 +285,6 @@ class SecurityClient:
         self.is_running = False
         if self.client_socket:
             self.client_socket.close()
-        cv2.destroyAllWindows()
-        self.logger.info("Client stopped") 
\ No newline at end of file
+        self.decode_queue.close()
+        self.latest_frame.close()
+        self.logger.info("Client stopped")
@@ -2,23 +2,174 @@ import socket
 import threading
 import logging
 import json
-import base64
-import cv2
-import numpy as np
-from cryptography.fernet import Fernet
+import time
+from cryptography.exceptions import InvalidTag
+from protocol import (
+    MSG_COMMAND, MSG_METADATA, MSG_HELLO, MSG_HANDSHAKE, MessageReader, send_message, send_packed,
+    pack_header, enable_low_latency
+)
+from secure_channel import HandshakeError, StreamKeyring, load_identity, public_bytes, fingerprint, server_handshake
+from metadata import encode_metadata
+from frame_encoder import FrameEncoder, DEFAULT_PROFILE, resolve_profile
+from tile_codec import TileEncoder
+
+HANDSHAKE_TIMEOUT = 10.0
+
+class ClientWriter:
+    """Sends frames to one client from its own thread, keeping only the latest pending frame"""
+    
+    def __init__(self, client_socket, address, session_cipher, metrics=None):
+        self.client_socket = client_socket
+        self.address = address
+        self.session_cipher = session_cipher
+        self.metrics = metrics
+        self.is_running = False
+        self.logger = logging.getLogger(__name__)
+        
+        self._condition = threading.Condition()
+        self._pending = None
+        self._key_message = None
+        self._thread = None
+        
+        # Subscriptions, changed by the client with a 'subscribe' command
+        self.wants_video = True
+        self.wants_metadata = True
+        self.profile = DEFAULT_PROFILE
+        self.mode = 'full'  # 'full' frames or 'delta' tile updates
+        self.needs_resync = True
+        
+        # Statistics
+        self.connected_at = time.monotonic()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self.last_sent_sequence = 0
+        self.last_send_time = self.connected_at
+        self.behind_since = None
+        
+    def start(self):
+        """Start the writer thread"""
+        self.is_running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def offer(self, sequence, messages, resync=None, droppable=True):
+        """Queue a frame's messages, replacing any frame the client has not picked up yet.
+        
+        messages is a list of (header, payload) pairs sent back to back. For
+        delta streams, messages that must not be lost are offered with
+        droppable=False, and resync is a callable returning full-frame
+        messages that is used instead whenever the client has missed one.
+        """
+        with self._condition:
+            if self._pending is not None:
+                self.frames_dropped += 1
+                if self.behind_since is None:
+                    self.behind_since = time.monotonic()
+                if not self._pending[2]:
+                    self.needs_resync = True
+            if resync is not None and self.needs_resync:
+                messages = resync()
+                if messages is None:
+                    return
+                self.needs_resync = False
+                droppable = False
+            self._pending = (sequence, messages, droppable)
+            self._condition.notify()
+            
+    def set_stream_key(self, message):
+        """Queue a sealed MSG_KEY, sent ahead of any frame still pending"""
+        with self._condition:
+            self._key_message = message
+            self._condition.notify()
+            
+    def _run(self):
+        """Send pending frames until the client disconnects"""
+        while self.is_running:
+            with self._condition:
+                while self._pending is None and self._key_message is None and self.is_running:
+                    self._condition.wait()
+                if not self.is_running:
+                    break
+                key_message, self._key_message = self._key_message, None
+                pending, self._pending = self._pending, None
+            try:
+                if key_message:
+                    send_packed(self.client_socket, *key_message)
+                if pending:
+                    start = time.perf_counter()
+                    for header, payload in pending[1]:
+                        send_packed(self.client_socket, header, payload)
+                    if self.metrics:
+                        self.metrics.record('send', time.perf_counter() - start)
+            except OSError as e:
+                self.logger.info(f"Client {self.address} write failed: {str(e)}")
+                self.close()
+                break
+            if pending is None:
+                continue
+            sequence, messages, _ = pending
+            with self._condition:
+                self.frames_sent += 1
+                self.bytes_sent += sum(len(header) + len(payload) for header, payload in messages)
+                self.last_sent_sequence = sequence
+                self.last_send_time = time.monotonic()
+                if self._pending is None:
+                    self.behind_since = None
+                    
+    def lag_seconds(self):
+        """How long the client has continuously had frames waiting"""
+        behind_since = self.behind_since
+        return 0.0 if behind_since is None else time.monotonic() - behind_since
+        
+    def stats(self, latest_sequence):
+        """Per-client lag and drop statistics"""
+        return {
+            'address': self.address,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'bytes_sent': self.bytes_sent,
+            'lag_frames': max(0, latest_sequence - self.last_sent_sequence),
+            'lag_seconds': self.lag_seconds(),
+        }
+        
+    def close(self):
+        """Stop the writer and unblock any send in progress"""
+        with self._condition:
+            self.is_running = False
+            self._pending = None
+            self._condition.notify()
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
 class SecurityServer:
-    def __init__(self, host='0.0.0.0', port=5000):
+    def __init__(self, host='0.0.0.0', port=5000, max_client_lag=5.0, identity_path=None,
+                 stream_key_lifetime=600.0, metrics=None):
         self.host = host
         self.port = port
         self.server_socket = None
-        self.clients = []
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+        self.max_client_lag = max_client_lag
+        self.evicted_clients = 0
         self.is_running = False
+        # metrics.Metrics for encode/seal/send timings, None to skip them
+        self.metrics = metrics
         self.logger = logging.getLogger(__name__)
         
-        # Generate encryption key
-        self.key = Fernet.generate_key()
-        self.cipher_suite = Fernet(self.key)
+        # Long-term identity clients authenticate us by; frames are sealed with a
+        # shared stream key that each session receives under its own key
+        self.identity = load_identity(identity_path)
+        self.fingerprint = fingerprint(public_bytes(self.identity))
+        self.keyring = StreamKeyring(stream_key_lifetime)
+        self._sealed_keyframe = (None, None)
+        self.frame_sequence = 0
+        self.frame_listeners = []
+        self.encoder = FrameEncoder()
+        self.tile_encoder = TileEncoder()
         
     def start(self):
         """Start the security server"""
@@ -27,7 +178,7 @@ class SecurityServer:
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(5)
             self.is_running = True
-            self.logger.info(f"Server started on {self.host}:{self.port}")
+            self.logger.info(f"Server started on {self.host}:{self.port}, identity {self.fingerprint}")
             
             # Start accepting clients in a separate thread
             accept_thread = threading.Thread(target=self._accept_clients)
@@ -43,7 +194,7 @@ class SecurityServer:
             try:
                 client_socket, address = self.server_socket.accept()
                 self.logger.info(f"New connection from {address}")
-                self.clients.append(client_socket)
+                enable_low_latency(client_socket)
                 
                 # Start handling client in a separate thread
                 client_thread = threading.Thread(
@@ -58,59 +209,208 @@ class SecurityServer:
                 
     def _handle_client(self, client_socket, address):
         """Handle communication with a client"""
+        writer = None
         try:
-            # Send encryption key to client
-            client_socket.send(self.key)
+            # Authenticated key exchange, bounded so a silent peer cannot hold the thread
+            reader = MessageReader(client_socket, initial_size=4096)
+            client_socket.settimeout(HANDSHAKE_TIMEOUT)
+            message = reader.read_message()
+            if message is None or message[0].msg_type != MSG_HELLO:
+                raise HandshakeError("Client did not start the handshake")
+            reply, send_cipher, receive_cipher = server_handshake(self.identity, message[1])
+            send_message(client_socket, MSG_HANDSHAKE, 0, reply)
+            client_socket.settimeout(None)
+            
+            # Frames are sent by the client's own writer thread from now on,
+            # starting with the stream key they are sealed with
+            writer = ClientWriter(client_socket, address, send_cipher, self.metrics)
+            writer.start()
+            with self.clients_lock:
+                writer.set_stream_key(self.keyring.key_message(send_cipher))
+                self.clients[client_socket] = writer
             
             while self.is_running:
                 # Receive data from client
-                data = client_socket.recv(4096)
-                if not data:
+                message = reader.read_message()
+                if message is None:
                     break
+                header, payload = message
+                if header.msg_type != MSG_COMMAND:
+                    continue
                     
                 # Decrypt and process the data
-                decrypted_data = self.cipher_suite.decrypt(data)
-                # Process the data as needed
+                try:
+                    decrypted_data = receive_cipher.open(header, payload)
+                except InvalidTag:
+                    self.logger.warning(f"Dropping unauthenticated command from {address}")
+                    continue
+                command = json.loads(bytes(decrypted_data).decode('utf-8'))
+                self.logger.debug(f"Command from {address}: {command}")
+                self._handle_command(writer, command)
                 
         except Exception as e:
             self.logger.error(f"Error handling client {address}: {str(e)}")
         finally:
-            self.clients.remove(client_socket)
+            with self.clients_lock:
+                self.clients.pop(client_socket, None)
+            if writer:
+                writer.close()
             client_socket.close()
             
-    def broadcast_frame(self, frame):
-        """Broadcast frame to all connected clients"""
-        try:
-            # Convert frame to bytes
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = base64.b64encode(buffer).decode('utf-8')
+    def _handle_command(self, writer, command):
+        """Apply a command received from a client"""
+        if not isinstance(command, dict):
+            return
+        data = command.get('data')
+        if command.get('type') != 'command' or not isinstance(data, dict):
+            return
+        if data.get('action') == 'subscribe':
+            writer.wants_video = bool(data.get('video', True))
+            writer.wants_metadata = bool(data.get('metadata', True))
+            writer.profile = resolve_profile(data.get('profile', DEFAULT_PROFILE))
+            writer.mode = 'delta' if data.get('mode') == 'delta' else 'full'
+            writer.needs_resync = True
+            self.logger.info(
+                f"Client {writer.address} subscribed to video={writer.wants_video} "
+                f"({writer.profile}, {writer.mode}), metadata={writer.wants_metadata}"
+            )
+        elif data.get('action') == 'resync':
+            writer.needs_resync = True
             
-            # Create message
-            message = {
-                'type': 'frame',
-                'data': frame_bytes
-            }
+    def broadcast_frame(self, frame, verdicts=None, timestamp_ns=None, metadata=None):
+        """Broadcast frame and, if given, its tracking verdicts to all connected clients.
+        
+        timestamp_ns is the frame's capture time on the wall clock (see
+        metrics.monotonic_to_wall_ns); it goes out in every message header so
+        viewers can measure glass-to-glass latency. Defaults to now.
+        metadata is an already encoded MSG_METADATA payload (see
+        metadata.encode_metadata), e.g. one computed by a detector in another
+        process; it takes the place of verdicts.
+        """
+        try:
+            start = time.perf_counter()
+            with self.clients_lock:
+                if self.keyring.rotate_if_due():
+                    for writer in self.clients.values():
+                        writer.set_stream_key(self.keyring.key_message(writer.session_cipher))
+                writers = list(self.clients.values())
+            self.frame_sequence += 1
+            sequence = self.frame_sequence
+            seal = self.keyring.cipher.seal
             
-            # Encrypt and send to all clients
-            encrypted_message = self.cipher_suite.encrypt(
-                json.dumps(message).encode('utf-8')
+            # Everything is encoded once per profile in use and shared by the client
+            # writers; with only metadata consumers connected no JPEG is encoded at all
+            video_writers = [writer for writer in writers if writer.wants_video]
+            profiles = {writer.profile for writer in video_writers if writer.mode == 'full'}
+            if timestamp_ns is None:
+                timestamp_ns = time.time_ns()
+            encoded = self.encoder.encode_profiles(
+                frame, sequence, list(profiles) + [profile for _, profile in self.frame_listeners],
+                timestamp_ns
             )
-            
-            for client in self.clients[:]:  # Use a copy of the list
-                try:
-                    client.send(encrypted_message)
-                except:
-                    self.clients.remove(client)
+            delta_message = None
+            heartbeat = False
+            if any(writer.mode == 'delta' for writer in video_writers):
+                delta_message = self.tile_encoder.encode(frame, sequence, timestamp_ns)
+            encoded_at = time.perf_counter()
+            self._notify_listeners(timestamp_ns, encoded)
+            # ...and sealed once with the stream key, in the order they are sent (metadata
+            # first), because clients refuse a stream key counter that does not go up
+            metadata_message = None
+            if metadata is None and verdicts is not None:
+                metadata = encode_metadata(verdicts, frame.shape)
+            if metadata is not None:
+                metadata_message = seal(pack_header(MSG_METADATA, sequence, len(metadata), timestamp_ns), metadata)
+            frame_messages = {profile: seal(*encoded[profile]) for profile in profiles if profile in encoded}
+            if delta_message:
+                heartbeat = len(delta_message[1]) == 0
+                delta_message = seal(*delta_message)
+            if self.metrics:
+                self.metrics.record('encode', encoded_at - start)
+                self.metrics.record('seal', time.perf_counter() - encoded_at)
+                
+            for writer in writers:
+                if writer.lag_seconds() > self.max_client_lag:
+                    self._evict(writer)
+                    continue
+                # Metadata goes first so clients can overlay it when the frame arrives
+                messages = []
+                if metadata_message and writer.wants_metadata:
+                    messages.append(metadata_message)
+                if writer.wants_video and writer.mode == 'delta':
+                    if delta_message:
+                        writer.offer(sequence, messages + [delta_message],
+                                     resync=self._resync_messages(frame, sequence, messages, timestamp_ns),
+                                     droppable=heartbeat)
+                    continue
+                frame_message = frame_messages.get(writer.profile)
+                if frame_message and writer.wants_video:
+                    messages.append(frame_message)
+                if messages:
+                    writer.offer(sequence, messages)
+            if self.metrics:
+                # Capture to hand-off to the client writers
+                self.metrics.record('server', (time.time_ns() - timestamp_ns) / 1e9)
                     
         except Exception as e:
             self.logger.error(f"Error broadcasting frame: {str(e)}")
             
+    def add_frame_listener(self, listener, profile=DEFAULT_PROFILE):
+        """Also hand every broadcast frame, encoded with `profile`, to listener(timestamp_ns, jpeg).
+        
+        Listeners run on the broadcasting thread and receive the same buffer
+        the clients are sent, so they should only queue it and return.
+        """
+        self.frame_listeners.append((listener, resolve_profile(profile)))
+        
+    def _notify_listeners(self, timestamp_ns, encoded):
+        for listener, profile in self.frame_listeners:
+            message = encoded.get(profile)
+            if message is None:
+                continue
+            try:
+                listener(timestamp_ns, message[1])
+            except Exception as e:
+                self.logger.error(f"Frame listener failed: {str(e)}")
+            
+    def _resync_messages(self, frame, sequence, messages, timestamp_ns):
+        """Callable producing a full keyframe for a delta client that lost sync"""
+        def resync():
+            cached_sequence, keyframe = self._sealed_keyframe
+            if cached_sequence != sequence:
+                keyframe = self.tile_encoder.keyframe_message(frame, sequence, timestamp_ns)
+                if keyframe is None:
+                    return None
+                keyframe = self.keyring.cipher.seal(*keyframe)
+                self._sealed_keyframe = (sequence, keyframe)
+            return messages + [keyframe]
+        return resync
+        
+    def _evict(self, writer):
+        """Disconnect a client that has fallen too far behind"""
+        self.logger.warning(
+            f"Evicting slow client {writer.address}: {writer.stats(self.frame_sequence)}"
+        )
+        self.evicted_clients += 1
+        with self.clients_lock:
+            self.clients.pop(writer.client_socket, None)
+        writer.close()
+        
+    def client_stats(self):
+        """Lag and drop statistics for every connected client"""
+        with self.clients_lock:
+            writers = list(self.clients.values())
+        return [writer.stats(self.frame_sequence) for writer in writers]
+        
     def stop(self):
         """Stop the security server"""
         self.is_running = False
         if self.server_socket:
             self.server_socket.close()
-        for client in self.clients:
-            client.close()
-        self.clients.clear()
+        with self.clients_lock:
+            writers = list(self.clients.values())
+            self.clients.clear()
+        for writer in writers:
+            writer.close()
+            writer.client_socket.close()
         self.logger.info("Server stopped") 
\ No newline at end of file
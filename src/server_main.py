@@ -1,9 +1,411 @@
+import functools
 import logging
-import cv2
+import multiprocessing
+import os
+import time
 from camera_manager import CameraManager
-from object_detector import ObjectDetector
+from frame_bus import FrameBus, FrameBusCapture, RESULT_WRONG_WAY
+from multi_camera import MultiCameraManager
+from object_detector import BatchCollector, ObjectDetector
 from movement_tracker import MovementTracker
 from security_server import SecurityServer
+from motion_gate import MotionGate
+from recorder import Recorder
+from event_store import EventStore
+from clip_exporter import ClipExporter, WrongWayTrigger
+from metadata import METADATA_HEADER, encode_metadata
+from metrics import Metrics, StatsServer, monotonic_to_wall_ns
+from pipeline import Pipeline, FramePacket
+
+# Camera index, video file, image directory or "synthetic[:seed]" (see frame_sources)
+CAMERA_SOURCE = 0
+# {name: source} to capture several sources, each in its own process. All of them are detected,
+# tracked and recorded as events (under EVENTS_DIR/<name>); the first one is streamed
+CAMERA_SOURCES = None
+# With CAMERA_SOURCES, frames of up to BATCH_SIZE sources go through one batched inference,
+# waiting at most BATCH_MAX_WAIT seconds after the first frame for the others
+BATCH_SIZE = 4
+BATCH_MAX_WAIT = 0.02
+# Detector backend: "ultralytics" (PyTorch), or "onnxruntime" / "opencv" with an exported ONNX model
+DETECTOR_BACKEND = "ultralytics"
+DETECTOR_MODEL = "yolov8n.pt"
+# Inference restricted to people at a size matched to the 320x240 capture
+PERSON_ONLY = True
+DETECT_IMGSZ = 320
+DETECT_CONF = 0.35
+DETECT_IOU = 0.5
+# "bytetrack" (ultralytics trackers) or "iou" (tracker.IoUTracker, always used by the ONNX backends)
+TRACKER = "bytetrack"
+# With the IoU tracker, run the model on every n-th frame and predict the boxes in between
+DETECT_INTERVAL = 1
+# Executor for the detect stage: "thread" or "process". The other stages always run on
+# threads: annotate keeps the tracker state and broadcast writes to the client sockets.
+# The batched CAMERA_SOURCES detector always runs on a thread
+DETECT_EXECUTOR = "thread"
+QUEUE_SIZE = 2
+# Run detection and tracking in a dedicated process that reads frames from a
+# shared-memory frame bus; this process only captures into the bus and streams
+# (replaces the pipeline above, CAMERA_SOURCE only)
+FRAME_BUS = False
+FRAME_BUS_SLOTS = 6
+# The newest detector result is attached to every streamed frame until it is this old (seconds)
+FRAME_BUS_RESULT_AGE = 0.5
+# Skip detection on static frames (None disables the gate)
+MOTION_AREA_THRESHOLD = 0.002
+MOTION_KEEP_ALIVE = 2.0
+# Run the detector only on padded crops around motion blobs (needs the motion gate); the
+# fixed-input ONNX backends keep running one full-frame inference
+ROI_DETECTION = True
+# Draw boxes into the broadcast frames; viewers also get them as metadata and draw locally
+DRAW_ON_SERVER = False
+# Record the broadcast JPEGs to disk (None disables recording)
+RECORDING_DIR = "recordings"
+RECORDING_PROFILE = "default"
+RECORDING_RETENTION_BYTES = 4 * 1024 * 1024 * 1024
+# Store direction verdicts as queryable events (None disables the event store)
+EVENTS_DIR = "events"
+# Export a clip around every wrong-way verdict (None disables clip export)
+CLIPS_DIR = "clips"
+CLIP_PRE_SECONDS = 5.0
+CLIP_POST_SECONDS = 5.0
+CLIP_RING_BYTES = 16 * 1024 * 1024
+# Tracking steps in a row a track must be judged wrong-way before its clip is exported;
+# each track then triggers at most once per clip length
+CLIP_MIN_FRAMES = 5
+# Ed25519 identity of the server, generated on the first start and reused after; clients pin its
+# fingerprint, so a new file locks them out until their known_servers entry is removed
+IDENTITY_PATH = "server_identity.pem"
+STATS_INTERVAL = 5.0
+# Per-stage latency histograms; percentiles are logged every STATS_INTERVAL and
+# served as JSON on 127.0.0.1:STATS_PORT (None disables the endpoint)
+METRICS_ENABLED = True
+STATS_PORT = 8081
+
+# Detector instance owned by a detection worker process
+_process_detector = None
+# Frame bus reader numbers
+BUS_READER_STREAM = 0
+BUS_READER_DETECTOR = 1
+
+
+def detector_factory():
+    """Picklable callable building the detector configured from the settings above.
+
+    The settings are bound now, so a spawned process gets them even though it
+    imports this module afresh.
+    """
+    return functools.partial(ObjectDetector, DETECTOR_MODEL, backend=DETECTOR_BACKEND, imgsz=DETECT_IMGSZ,
+                             person_only=PERSON_ONLY, conf_threshold=DETECT_CONF, iou_threshold=DETECT_IOU,
+                             tracker=TRACKER, detect_interval=DETECT_INTERVAL)
+
+
+def create_detector():
+    """Detector configured from the settings above"""
+    return detector_factory()()
+
+
+def init_process_detector():
+    """Load the model inside the detection worker process"""
+    global _process_detector
+    _process_detector = create_detector()
+
+
+def detect_in_process(packet):
+    """Run detection in the worker process (the packet is pickled both ways)"""
+    if not packet.motion:
+        return packet
+    if ROI_DETECTION:
+        packet.results = _process_detector.detect_rois(packet.frame, packet.rois)
+    else:
+        packet.results = _process_detector.detect_objects(packet.frame)
+    if packet.results:
+        packet.person_boxes = _process_detector.get_person_boxes(packet.results)
+    return packet
+
+
+class ServerStages:
+    """Stage functions for capture -> detect -> annotate -> broadcast"""
+
+    def __init__(self, camera, server, detector=None, tracker=None, gate=None, events=None, clips=None,
+                 metrics=None, clip_trigger=None):
+        self.camera = camera
+        self.server = server
+        self.detector = detector
+        self.tracker = tracker or MovementTracker()
+        self.gate = gate
+        self.events = events
+        self.clips = clips
+        self.clip_trigger = clip_trigger or WrongWayTrigger()
+        self.metrics = metrics
+
+    def capture(self):
+        # קריאת הפריים העדכני ביותר מהמצלמה
+        success, frame, timestamp, index = self.camera.read_latest()
+        if not success:
+            return None
+        # The ring buffer is reused by the capture thread, and later stages draw on the frame
+        packet = FramePacket(index, timestamp, frame.copy())
+        if self.gate:
+            packet.motion = self.gate.check(packet.frame)
+            if packet.motion and ROI_DETECTION:
+                packet.rois = self.gate.motion_rois(packet.frame.shape)
+        return packet
+
+    def detect(self, packet):
+        # אין תנועה - אין צורך בזיהוי
+        if not packet.motion:
+            return packet
+        # זיהוי אובייקטים
+        if ROI_DETECTION:
+            packet.results = self.detector.detect_rois(packet.frame, packet.rois)
+        else:
+            packet.results = self.detector.detect_objects(packet.frame)
+        if packet.results:
+            # חילוץ תיבות של אנשים
+            packet.person_boxes = self.detector.get_person_boxes(packet.results)
+        return packet
+
+    def annotate(self, packet):
+        # מעקב אחר תנועה
+        if packet.results:
+            start = time.perf_counter()
+            packet.verdicts = self.tracker.track_results(packet.frame, packet.results, draw=DRAW_ON_SERVER)
+            if self.metrics:
+                self.metrics.record("track", time.perf_counter() - start)
+            # Events, clips and recordings are all stamped with the capture time
+            timestamp_ns = monotonic_to_wall_ns(packet.timestamp)
+            if self.events:
+                self.events.record(packet.verdicts, timestamp_ns)
+            if self.clips and self.clip_trigger.update(packet.verdicts, timestamp_ns):
+                self.clips.trigger(timestamp_ns)
+        return packet
+
+    def broadcast(self, packet):
+        # שליחת הפריים לכל הלקוחות
+        self.server.broadcast_frame(packet.frame, packet.verdicts, monotonic_to_wall_ns(packet.timestamp))
+        return packet
+
+
+class MultiStreamStages:
+    """Stage functions for CAMERA_SOURCES: every source is detected in one batch, the first is streamed.
+
+    Items between the stages are lists of (source name, FramePacket), one per
+    source that delivered a frame for the batch. Each source has its own
+    motion gate, movement tracker and event store; clips are cut from the
+    broadcast, so only the streamed source triggers them.
+    """
+
+    def __init__(self, cameras, server, detector, streamed, gates=None, events=None, clips=None, metrics=None,
+                 clip_trigger=None, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT):
+        self.server = server
+        self.streamed = streamed
+        self.collector = BatchCollector(detector, {name: cameras.camera(name) for name in cameras.sources},
+                                        batch_size, max_wait)
+        self.trackers = {name: MovementTracker() for name in cameras.sources}
+        # The streamed source's tracker, for the periodic track store log line
+        self.tracker = self.trackers[streamed]
+        self.gates = gates or {}
+        self.events = events or {}
+        self.clips = clips
+        self.clip_trigger = clip_trigger or WrongWayTrigger()
+        self.metrics = metrics
+
+    def capture(self):
+        batch = []
+        for name, frame, timestamp, index in self.collector.collect():
+            # collect() already copied the frame out of the capture ring
+            packet = FramePacket(index, timestamp, frame)
+            gate = self.gates.get(name)
+            if gate:
+                packet.motion = gate.check(frame)
+            batch.append((name, packet))
+        return batch or None
+
+    def detect(self, batch):
+        # Static frames stay out of the batch
+        moving = [(name, packet.frame, packet.timestamp, packet.index) for name, packet in batch if packet.motion]
+        results = {item[0]: item[-1] for item in self.collector.detect(moving)}
+        for name, packet in batch:
+            packet.results = results.get(name)
+        return batch
+
+    def annotate(self, batch):
+        for name, packet in batch:
+            if not packet.results:
+                continue
+            start = time.perf_counter()
+            packet.verdicts = self.trackers[name].track_results(packet.frame, packet.results,
+                                                                draw=DRAW_ON_SERVER and name == self.streamed)
+            if self.metrics:
+                self.metrics.record("track", time.perf_counter() - start)
+            timestamp_ns = monotonic_to_wall_ns(packet.timestamp)
+            if name in self.events:
+                self.events[name].record(packet.verdicts, timestamp_ns)
+            if name == self.streamed and self.clips and self.clip_trigger.update(packet.verdicts, timestamp_ns):
+                self.clips.trigger(timestamp_ns)
+        return batch
+
+    def broadcast(self, batch):
+        for name, packet in batch:
+            if name == self.streamed:
+                self.server.broadcast_frame(packet.frame, packet.verdicts, monotonic_to_wall_ns(packet.timestamp))
+                return packet
+        return None
+
+
+def detect_from_bus(bus, stop_event, detector_factory, motion_area_threshold, motion_keep_alive, roi_detection,
+                    events_dir, clip_trigger):
+    """Body of the FRAME_BUS detector process: detect and track the newest bus frame, publish the metadata.
+
+    Settings are passed in rather than read from this module, which a spawned
+    process imports afresh.
+    """
+    detector = detector_factory()
+    tracker = MovementTracker()
+    gate = None
+    if motion_area_threshold is not None:
+        gate = MotionGate(area_threshold=motion_area_threshold, keep_alive=motion_keep_alive)
+    events = EventStore(events_dir) if events_dir else None
+    sequence = 0
+    try:
+        while not stop_event.is_set():
+            pinned = bus.pin_latest(BUS_READER_DETECTOR, sequence, timeout=0.5)
+            if pinned is None:
+                continue
+            slot, sequence, timestamp = pinned
+            # The frame stays pinned, and is used in place, until tracking is done
+            try:
+                frame = bus.frame(slot)
+                if gate and not gate.check(frame):
+                    continue
+                if gate and roi_detection:
+                    results = detector.detect_rois(frame, gate.motion_rois(frame.shape))
+                else:
+                    results = detector.detect_objects(frame)
+                verdicts = None
+                if results:
+                    verdicts = tracker.track_results(frame, results, draw=False)
+                    payload = encode_metadata(verdicts, frame.shape)
+                else:
+                    # Published anyway so the streamer stops attaching older boxes
+                    payload = METADATA_HEADER.pack(frame.shape[1], frame.shape[0], 0)
+            finally:
+                frame = results = None
+                bus.unpin(BUS_READER_DETECTOR, slot)
+            flags = 0
+            if verdicts is not None:
+                timestamp_ns = monotonic_to_wall_ns(timestamp / 1e9)
+                if events:
+                    events.record(verdicts, timestamp_ns)
+                if clip_trigger and clip_trigger.update(verdicts, timestamp_ns):
+                    flags = RESULT_WRONG_WAY
+            bus.publish_result(sequence, timestamp, payload, flags)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        # The process exits and BusDetector starts a new one
+        logging.getLogger(__name__).error(f"Detector process failed: {str(e)}")
+    finally:
+        if events:
+            events.close()
+        bus.close()
+
+
+class BusDetector:
+    """The FRAME_BUS detector process, restarted when it dies"""
+
+    def __init__(self, bus, detector_factory, motion_area_threshold=None, motion_keep_alive=MOTION_KEEP_ALIVE,
+                 roi_detection=False, events_dir=None, clip_trigger=None):
+        self.bus = bus
+        # detector_factory must pickle: a module-level function or a functools.partial of a class
+        self.args = (detector_factory, motion_area_threshold, motion_keep_alive, roi_detection, events_dir,
+                     clip_trigger)
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.process = None
+        self.restarts = 0
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        self.process = self.context.Process(target=detect_from_bus, name="detector",
+                                            args=(self.bus, self.stop_event) + self.args)
+        self.process.daemon = True
+        self.process.start()
+
+    def ensure_running(self):
+        """Restart the process if it exited; its pins are released first"""
+        if self.process.is_alive() or self.stop_event.is_set():
+            return
+        self.logger.warning(f"Detector process exited with code {self.process.exitcode}, restarting")
+        self.bus.release_reader(BUS_READER_DETECTOR)
+        self.restarts += 1
+        self.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.process:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(1.0)
+
+
+class BusStreamer:
+    """FRAME_BUS stage function: stream the newest bus frame with the newest detector result"""
+
+    def __init__(self, bus, server, clips=None):
+        self.bus = bus
+        self.server = server
+        self.clips = clips
+        self.sequence = 0
+        self.result_sequence = 0
+
+    def broadcast(self):
+        pinned = self.bus.pin_latest(BUS_READER_STREAM, self.sequence, timeout=0.1)
+        if pinned is None:
+            return None
+        slot, self.sequence, timestamp = pinned
+        try:
+            # Detection runs at its own rate, so its newest boxes go out with every
+            # frame streamed while they are recent
+            metadata = None
+            result = self.bus.latest_result()
+            if result:
+                result_sequence, _, result_timestamp, flags, payload = result
+                if timestamp - result_timestamp <= FRAME_BUS_RESULT_AGE * 1e9:
+                    metadata = payload
+                if result_sequence > self.result_sequence:
+                    self.result_sequence = result_sequence
+                    if self.clips and flags & RESULT_WRONG_WAY:
+                        self.clips.trigger(monotonic_to_wall_ns(result_timestamp / 1e9))
+            # JPEG encoding reads the pixels straight from shared memory
+            self.server.broadcast_frame(self.bus.frame(slot), None, monotonic_to_wall_ns(timestamp / 1e9),
+                                        metadata=metadata)
+        finally:
+            self.bus.unpin(BUS_READER_STREAM, slot)
+        return FramePacket(self.sequence, timestamp / 1e9, None)
+
+
+def build_bus_pipeline(streamer, metrics=None):
+    """Single streaming stage for FRAME_BUS; capture and detection run outside the pipeline"""
+    pipeline = Pipeline(queue_size=QUEUE_SIZE, metrics=metrics)
+    pipeline.add_stage("broadcast", streamer.broadcast)
+    return pipeline
+
+
+def build_pipeline(stages, metrics=None):
+    """Wire the stage functions into a pipeline according to the executor settings"""
+    pipeline = Pipeline(queue_size=QUEUE_SIZE, metrics=metrics)
+    pipeline.add_stage("capture", stages.capture)
+    if DETECT_EXECUTOR == "process" and isinstance(stages, ServerStages):
+        pipeline.add_stage("detect", detect_in_process, executor="process",
+                           initializer=init_process_detector)
+    else:
+        pipeline.add_stage("detect", stages.detect)
+    pipeline.add_stage("annotate", stages.annotate)
+    pipeline.add_stage("broadcast", stages.broadcast)
+    return pipeline
+
 
 def main():
     # הגדרת לוגר
@@ -14,57 +416,169 @@ def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     logger = logging.getLogger(__name__)
-    
+
+    camera = None
+    cameras = None
+    bus = None
+    bus_detector = None
+    server = None
+    pipeline = None
+    recorder = None
+    events = None
+    source_events = {}
+    clips = None
+    stats_server = None
     try:
         # אתחול המרכיבים
-        camera = CameraManager()
-        detector = ObjectDetector()
-        tracker = MovementTracker()
-        server = SecurityServer()
-        
+        metrics = Metrics(METRICS_ENABLED)
+        clip_trigger = WrongWayTrigger(CLIP_MIN_FRAMES, CLIP_PRE_SECONDS + CLIP_POST_SECONDS) if CLIPS_DIR else None
+        detector = None
+        if (DETECT_EXECUTOR == "thread" or CAMERA_SOURCES) and not FRAME_BUS:
+            detector = create_detector()
+        server = SecurityServer(identity_path=IDENTITY_PATH, metrics=metrics)
+
         # אתחול המצלמה
-        if not camera.initialize_camera():
-            logger.error("Failed to initialize camera")
-            return
-            
+        if FRAME_BUS:
+            bus = FrameBus((240, 320, 3), FRAME_BUS_SLOTS, create=True)
+            camera = FrameBusCapture(bus, source=CAMERA_SOURCE)
+            if not camera.start():
+                logger.error("Failed to initialize camera")
+                return
+            bus_detector = BusDetector(bus, detector_factory(), MOTION_AREA_THRESHOLD, MOTION_KEEP_ALIVE,
+                                       ROI_DETECTION, EVENTS_DIR, clip_trigger)
+            bus_detector.start()
+        elif CAMERA_SOURCES:
+            cameras = MultiCameraManager(CAMERA_SOURCES)
+            cameras.start()
+            camera = cameras.camera(next(iter(cameras.sources)))
+        else:
+            camera = CameraManager(source=CAMERA_SOURCE)
+            if not camera.initialize_camera():
+                logger.error("Failed to initialize camera")
+                return
+            if not camera.start_capture():
+                logger.error("Failed to start background capture")
+                return
+
         # הפעלת השרת
         server.start()
-        
+
+        # הקלטה לדיסק
+        if RECORDING_DIR:
+            recorder = Recorder(RECORDING_DIR, retention_bytes=RECORDING_RETENTION_BYTES)
+            recorder.start()
+            server.add_frame_listener(recorder.write, RECORDING_PROFILE)
+
+        # הפעלת הצינור
+        gate = None
+        gates = {}
+        if MOTION_AREA_THRESHOLD is not None and cameras:
+            gates = {name: MotionGate(area_threshold=MOTION_AREA_THRESHOLD, keep_alive=MOTION_KEEP_ALIVE)
+                     for name in cameras.sources}
+        elif MOTION_AREA_THRESHOLD is not None and not FRAME_BUS:
+            gate = MotionGate(area_threshold=MOTION_AREA_THRESHOLD, keep_alive=MOTION_KEEP_ALIVE)
+        if EVENTS_DIR and cameras:
+            # Track ids are per source, so each source gets its own store
+            source_events = {name: EventStore(os.path.join(EVENTS_DIR, name)) for name in cameras.sources}
+        elif EVENTS_DIR and not FRAME_BUS:
+            events = EventStore(EVENTS_DIR)
+        if CLIPS_DIR:
+            clips = ClipExporter(CLIPS_DIR, CLIP_PRE_SECONDS, CLIP_POST_SECONDS, ring_bytes=CLIP_RING_BYTES)
+            clips.start()
+            server.add_frame_listener(clips.write, RECORDING_PROFILE)
+        stages = None
+        if FRAME_BUS:
+            pipeline = build_bus_pipeline(BusStreamer(bus, server, clips), metrics)
+        elif cameras:
+            stages = MultiStreamStages(cameras, server, detector, camera.name, gates=gates, events=source_events,
+                                       clips=clips, metrics=metrics, clip_trigger=clip_trigger)
+            pipeline = build_pipeline(stages, metrics)
+        else:
+            stages = ServerStages(camera, server, detector, gate=gate, events=events, clips=clips, metrics=metrics,
+                                  clip_trigger=clip_trigger)
+            pipeline = build_pipeline(stages, metrics)
+        pipeline.start()
+
+        # נקודת קצה לסטטיסטיקות
+        if STATS_PORT:
+            # Cumulative counters and fps since start: scrapers take their own deltas and leave the
+            # log's rate window alone
+            stats_server = StatsServer(metrics, port=STATS_PORT, extra=lambda: {
+                'pipeline': pipeline.stats(),
+                'camera': {'captured': camera.frames_captured, 'dropped': camera.frames_dropped},
+                'cameras': cameras.health() if cameras else {},
+                'frame_bus': bus.stats() if bus else {},
+                'clients': server.client_stats(),
+            })
+            stats_server.start()
+
         # לולאה ראשית
-        prev_results = None
         while camera.is_running:
-            # קריאת פריים מהמצלמה
-            success, frame = camera.read_frame()
-            if not success:
-                continue
-                
-            # זיהוי אובייקטים
-            results = detector.detect_objects(frame)
-            if results:
-                # חילוץ תיבות של אנשים
-                person_boxes = detector.get_person_boxes(results)
-                
-                # מעקב אחר תנועה
-                tracker.track_movement(frame, person_boxes, prev_results)
-                
-                # שמירת התוצאות לפריים הבא
-                prev_results = results
-                
-            # שליחת הפריים לכל הלקוחות
-            server.broadcast_frame(frame)
-            
-            # בדיקה להפסקת התוכנית
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-                
+            time.sleep(STATS_INTERVAL)
+            if bus_detector:
+                bus_detector.ensure_running()
+                logger.info(f"Frame bus: {bus.stats()}, detector restarts {bus_detector.restarts}")
+            logger.info(f"Pipeline stats: {pipeline.format_stats()} | "
+                        f"camera dropped {camera.frames_dropped}/{camera.frames_captured}")
+            if cameras:
+                for name, health in cameras.health().items():
+                    logger.info(f"Camera {name}: {health}")
+            if METRICS_ENABLED:
+                logger.info(f"Latency: {metrics.format_stats(reset=True)}")
+            if gate:
+                logger.info(f"Motion gate skipped {gate.skip_ratio():.1%} of {gate.frames} frames")
+            for name, source_gate in gates.items():
+                logger.info(f"Motion gate {name} skipped {source_gate.skip_ratio():.1%} of "
+                            f"{source_gate.frames} frames")
+            if cameras:
+                logger.info(f"Mean detector batch {stages.collector.mean_batch_size():.2f} frames")
+            if stages:
+                logger.info(f"Track store: {stages.tracker.store.stats()}")
+            if detector and ROI_DETECTION:
+                logger.info(f"ROI detection used {detector.roi_pixel_ratio():.1%} of frame pixels")
+            for client in server.client_stats():
+                logger.info(f"Client stats: {client}")
+            logger.info(f"Delta stream: {server.tile_encoder.stats()}")
+            if recorder:
+                logger.info(f"Recorder: {recorder.stats()}")
+            if events:
+                logger.info(f"Event store: {events.events_written} events written")
+            for name, source_store in source_events.items():
+                logger.info(f"Event store {name}: {source_store.events_written} events written")
+            if clips:
+                logger.info(f"Clips: {clips.stats()}")
+
+    except KeyboardInterrupt:
+        logger.info("Interrupted by user")
     except Exception as e:
         logger.error(f"Error in main loop: {str(e)}")
     finally:
         # ניקוי משאבים
-        camera.release()
-        server.stop()
-        cv2.destroyAllWindows()
+        if stats_server:
+            stats_server.stop()
+        if pipeline:
+            pipeline.stop()
+        if bus_detector:
+            bus_detector.stop()
+        if cameras:
+            cameras.stop()
+        elif bus:
+            camera.stop()
+        elif camera:
+            camera.release()
+        if server:
+            server.stop()
+        if recorder:
+            recorder.stop()
+        if events:
+            events.close()
+        for source_store in source_events.values():
+            source_store.close()
+        if clips:
+            clips.stop()
+        if bus:
+            bus.close()
         logger.info("Server stopped")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,162 @@
+import logging
+import struct
+import cv2
+import numpy as np
+from protocol import MSG_FRAME, MSG_TILES, MSG_HEARTBEAT, pack_header
+
+# Payload of a MSG_TILES message:
+#   frame_width(H) frame_height(H) tile_width(H) tile_height(H) count(H)
+# followed by `count` entries of column(H) row(H) length(I) and `length` JPEG bytes
+TILES_HEADER = struct.Struct("!HHHHH")
+TILE_ENTRY = struct.Struct("!HHI")
+
+
+class TileEncoder:
+    """Turns a frame stream into keyframes, changed-tile updates and no-change heartbeats.
+
+    The encoder keeps the picture its delta clients are expected to hold, so
+    a tile is only resent when it differs from what was last sent for it.
+    """
+
+    def __init__(self, tile_width=64, tile_height=48, keyframe_interval=150,
+                 pixel_threshold=25, tile_threshold=0.01, quality=80):
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.keyframe_interval = keyframe_interval
+        self.pixel_threshold = pixel_threshold
+        self.tile_threshold = tile_threshold  # fraction of changed pixels that marks a tile dirty
+        self.quality = quality
+        self.logger = logging.getLogger(__name__)
+
+        self.reference_gray = None
+        self.frames_since_keyframe = 0
+        self._tile_areas = None
+        self._keyframe_cache = (None, None)
+
+        # Statistics
+        self.keyframes = 0
+        self.delta_frames = 0
+        self.heartbeats = 0
+        self.tiles_sent = 0
+        self.bytes_out = 0
+
+    def _grid(self, shape):
+        height, width = shape[:2]
+        return -(-height // self.tile_height), -(-width // self.tile_width)
+
+    def _encode_jpeg(self, image):
+        success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer if success else None
+
+    def keyframe_message(self, frame, sequence, timestamp_ns=None):
+        """Full-frame message for clients that need to (re)synchronize, encoded once per frame"""
+        cached_sequence, message = self._keyframe_cache
+        if cached_sequence == sequence:
+            return message
+        buffer = self._encode_jpeg(frame)
+        if buffer is None:
+            return None
+        payload = memoryview(buffer).cast('B')
+        message = (pack_header(MSG_FRAME, sequence, len(payload), timestamp_ns), payload)
+        self._keyframe_cache = (sequence, message)
+        return message
+
+    def _changed_tiles(self, gray):
+        """Boolean (rows, cols) grid of tiles that differ from the reference"""
+        rows, cols = self._grid(gray.shape)
+        height, width = gray.shape
+        changed = cv2.absdiff(gray, self.reference_gray) > self.pixel_threshold
+        padded = np.zeros((rows * self.tile_height, cols * self.tile_width), dtype=np.uint32)
+        padded[:height, :width] = changed
+        counts = padded.reshape(rows, self.tile_height, cols, self.tile_width).sum(axis=(1, 3))
+        if self._tile_areas is None or self._tile_areas.shape != counts.shape:
+            ones = np.zeros_like(padded)
+            ones[:height, :width] = 1
+            self._tile_areas = ones.reshape(rows, self.tile_height, cols, self.tile_width).sum(axis=(1, 3))
+        return counts > self.tile_threshold * self._tile_areas
+
+    def encode(self, frame, sequence, timestamp_ns=None):
+        """Return the (header, payload) message that brings a synchronized client to this frame"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        keyframe_due = (
+            self.reference_gray is None
+            or self.reference_gray.shape != gray.shape
+            or self.frames_since_keyframe >= self.keyframe_interval
+        )
+        if keyframe_due:
+            message = self.keyframe_message(frame, sequence, timestamp_ns)
+            if message is not None:
+                self.reference_gray = gray
+                self.frames_since_keyframe = 0
+                self.keyframes += 1
+                self.bytes_out += len(message[1])
+            return message
+
+        self.frames_since_keyframe += 1
+        changed = self._changed_tiles(gray)
+        if not changed.any():
+            self.heartbeats += 1
+            return pack_header(MSG_HEARTBEAT, sequence, 0, timestamp_ns), b''
+
+        height, width = gray.shape
+        parts = [TILES_HEADER.pack(width, height, self.tile_width, self.tile_height, 0)]
+        count = 0
+        for row, col in zip(*np.nonzero(changed)):
+            y, x = row * self.tile_height, col * self.tile_width
+            buffer = self._encode_jpeg(frame[y:y + self.tile_height, x:x + self.tile_width])
+            if buffer is None:
+                continue
+            parts.append(TILE_ENTRY.pack(col, row, len(buffer)))
+            parts.append(buffer.tobytes())
+            # The client now holds this tile, compare future frames against it
+            self.reference_gray[y:y + self.tile_height, x:x + self.tile_width] = \
+                gray[y:y + self.tile_height, x:x + self.tile_width]
+            count += 1
+        parts[0] = TILES_HEADER.pack(width, height, self.tile_width, self.tile_height, count)
+        payload = b''.join(parts)
+
+        self.delta_frames += 1
+        self.tiles_sent += count
+        self.bytes_out += len(payload)
+        return pack_header(MSG_TILES, sequence, len(payload), timestamp_ns), payload
+
+    def stats(self):
+        return {
+            'keyframes': self.keyframes,
+            'delta_frames': self.delta_frames,
+            'heartbeats': self.heartbeats,
+            'tiles_sent': self.tiles_sent,
+            'bytes_out': self.bytes_out,
+        }
+
+
+class TileDecoder:
+    """Rebuilds the picture from keyframes and tile updates into a persistent buffer"""
+
+    def __init__(self):
+        self.canvas = None
+
+    def apply_keyframe(self, frame):
+        """Replace the whole picture"""
+        if self.canvas is None or self.canvas.shape != frame.shape:
+            self.canvas = frame.copy()
+        else:
+            np.copyto(self.canvas, frame)
+        return self.canvas
+
+    def apply_tiles(self, payload):
+        """Paste the tiles of a MSG_TILES payload; returns the canvas or None if out of sync"""
+        width, height, tile_width, tile_height, count = TILES_HEADER.unpack_from(payload)
+        if self.canvas is None or self.canvas.shape[:2] != (height, width):
+            return None
+        offset = TILES_HEADER.size
+        for _ in range(count):
+            col, row, length = TILE_ENTRY.unpack_from(payload, offset)
+            offset += TILE_ENTRY.size
+            tile = cv2.imdecode(np.frombuffer(payload, np.uint8, length, offset), cv2.IMREAD_COLOR)
+            offset += length
+            if tile is None:
+                continue
+            y, x = row * tile_height, col * tile_width
+            self.canvas[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+        return self.canvas
@@ -0,0 +1,155 @@
+import logging
+import sys
+import numpy as np
+
+class TrackStore:
+    """Fixed-capacity, array-backed state for tracked people.
+
+    Each track occupies one slot holding its expected side (walking
+    direction), its last decided direction of movement, last center, the
+    frame it was last seen on and a short ring of recent centers. Tracks not seen for ttl_frames are evicted, and when
+    the store is full the least recently seen tracks make room, so memory
+    stays constant however long the system runs.
+    """
+
+    def __init__(self, max_tracks=4096, ttl_frames=300, history=8, sweep_interval=32):
+        self.max_tracks = max_tracks
+        self.ttl_frames = ttl_frames
+        self.history_length = history
+        self.sweep_interval = sweep_interval
+        self.logger = logging.getLogger(__name__)
+
+        self.ids = np.full(max_tracks, -1, dtype=np.int64)
+        self.side = np.zeros(max_tracks, dtype=np.int8)
+        self.direction = np.zeros(max_tracks, dtype=np.int8)
+        self.center = np.zeros((max_tracks, 2), dtype=np.float32)
+        self.last_seen = np.zeros(max_tracks, dtype=np.int64)
+        self.history = np.zeros((max_tracks, history, 2), dtype=np.float32)
+        self.history_count = np.zeros(max_tracks, dtype=np.int16)
+
+        self._index = {}  # track id -> slot
+        self._free = list(range(max_tracks - 1, -1, -1))
+        self.frame = 0
+        self.ttl_evictions = 0
+        self.lru_evictions = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, track_id):
+        return track_id in self._index
+
+    def tick(self):
+        """Advance the frame counter, sweeping expired tracks every few frames"""
+        self.frame += 1
+        if self.frame % self.sweep_interval == 0:
+            self.evict_expired()
+
+    def lookup(self, track_ids):
+        """Slots of the given IDs, -1 for unknown ones"""
+        index = self._index
+        return np.fromiter((index.get(i, -1) for i in track_ids), dtype=np.int64, count=len(track_ids))
+
+    def get_side(self, track_id):
+        """Expected side of one track, or 0 if it is not stored"""
+        slot = self._index.get(track_id)
+        return 0 if slot is None else int(self.side[slot])
+
+    def add(self, track_ids, sides, centers):
+        """Store new tracks and return their slots"""
+        track_ids = list(track_ids)
+        missing = len(track_ids) - len(self._free)
+        if missing > 0:
+            self._evict_least_recent(missing)
+        slots = np.array([self._free.pop() for _ in track_ids], dtype=np.int64)
+        for track_id, slot in zip(track_ids, slots.tolist()):
+            self._index[track_id] = slot
+        self.ids[slots] = track_ids
+        self.side[slots] = sides
+        self.direction[slots] = 0
+        self.history_count[slots] = 0
+        self.update(slots, centers)
+        return slots
+
+    def update(self, slots, centers):
+        """Record this frame's centers for existing slots"""
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        self.center[slots] = centers
+        self.last_seen[slots] = self.frame
+        position = self.history_count[slots] % self.history_length
+        self.history[slots, position] = centers
+        self.history_count[slots] += 1
+        # Keep the counter bounded while preserving the ring position
+        wrapped = self.history_count[slots] >= 2 * self.history_length
+        self.history_count[slots[wrapped]] -= self.history_length
+
+    def displacement(self, slots):
+        """Movement of each slot over its history ring, as (dx, dy).
+
+        The mean center of the newer half of the stored centers minus that of
+        the older half, so per-frame box jitter largely averages out. Zero
+        until a track has two centers.
+        """
+        length = self.history_length
+        count = self.history_count[slots].astype(np.int64)
+        stored = np.minimum(count, length)
+        start = np.where(count > length, count % length, 0)
+        age = np.arange(length)
+        # Ring positions oldest first
+        centers = self.history[np.asarray(slots)[:, None], (start[:, None] + age) % length]
+        half = (stored // 2)[:, None]
+        older = age < half
+        newer = (age >= stored[:, None] - half) & (age < stored[:, None])
+        moved = ((centers * newer[..., None]).sum(axis=1) - (centers * older[..., None]).sum(axis=1))
+        return moved / np.maximum(half, 1)
+
+    def get_history(self, track_id):
+        """Recent centers of a track, oldest first"""
+        slot = self._index.get(track_id)
+        if slot is None:
+            return np.zeros((0, 2), dtype=np.float32)
+        count = int(self.history_count[slot])
+        if count <= self.history_length:
+            return self.history[slot, :count].copy()
+        start = count % self.history_length
+        return np.roll(self.history[slot], -start, axis=0)
+
+    def evict_expired(self):
+        """Drop tracks that have not been seen for ttl_frames"""
+        used = self.ids >= 0
+        expired = np.flatnonzero(used & (self.last_seen < self.frame - self.ttl_frames))
+        if len(expired):
+            self._release(expired)
+            self.ttl_evictions += len(expired)
+        return len(expired)
+
+    def _evict_least_recent(self, count):
+        """Free `count` slots by dropping the tracks seen longest ago"""
+        used = np.flatnonzero(self.ids >= 0)
+        count = min(count, len(used))
+        oldest = used[np.argpartition(self.last_seen[used], count - 1)[:count]]
+        self._release(oldest)
+        self.lru_evictions += len(oldest)
+        self.logger.debug(f"Track store full, evicted {len(oldest)} least recently seen tracks")
+
+    def _release(self, slots):
+        for track_id in self.ids[slots].tolist():
+            del self._index[track_id]
+        self.ids[slots] = -1
+        self._free.extend(slots.tolist())
+
+    def memory_bytes(self):
+        """Approximate memory held by the store"""
+        arrays = (self.ids, self.side, self.direction, self.center, self.last_seen, self.history,
+                  self.history_count)
+        return (sum(a.nbytes for a in arrays)
+                + sys.getsizeof(self._index) + sys.getsizeof(self._free))
+
+    def stats(self):
+        return {
+            'tracks': len(self),
+            'capacity': self.max_tracks,
+            'memory_bytes': self.memory_bytes(),
+            'ttl_evictions': self.ttl_evictions,
+            'lru_evictions': self.lru_evictions,
+        }
@@ -0,0 +1,189 @@
+import numpy as np
+from detections import Detections
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def iou_matrix(a, b):
+    """(len(a), len(b)) IoU between two sets of xyxy boxes"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0).astype(np.float32)
+
+
+def centroid_score(a, b, gate):
+    """1 at equal centers falling to 0 at `gate` times the size of box a, as a (len(a), len(b)) matrix"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    center_a = (a[:, :2] + a[:, 2:]) / 2
+    center_b = (b[:, :2] + b[:, 2:]) / 2
+    distance = np.linalg.norm(center_a[:, None, :] - center_b[None, :, :], axis=2)
+    size = np.sqrt(np.clip((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]), 1, None))
+    return np.clip(1 - distance / (gate * size[:, None]), 0, None).astype(np.float32)
+
+
+def greedy_assignment(score, threshold):
+    """Match rows to columns by descending score; returns (rows, cols) of the pairs above threshold"""
+    rows, cols = np.nonzero(score >= threshold)
+    order = np.argsort(-score[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+def optimal_assignment(score, threshold):
+    """Hungarian matching maximizing the total score when scipy is available, greedy otherwise"""
+    if linear_sum_assignment is None or score.size == 0:
+        return greedy_assignment(score, threshold)
+    rows, cols = linear_sum_assignment(np.where(score >= threshold, score, 0), maximize=True)
+    keep = score[rows, cols] >= threshold
+    return rows[keep].astype(np.int64), cols[keep].astype(np.int64)
+
+
+class IoUTracker:
+    """Multi-object tracker with constant-velocity prediction, for use instead of model.track().
+
+    Tracks are matched to detections in two rounds: by IoU with their
+    predicted boxes, then the leftovers by center distance, which catches
+    people who moved further than their own width since the last detection.
+    Unmatched detections start tracks, and tracks unseen for max_age frames
+    are dropped.
+
+    When the detector only runs every k frames, call update() on detection
+    frames and predict() on the others; predict() moves every track along
+    its velocity so boxes keep following people at the full frame rate.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=30, centroid_gate=1.5, centroid_threshold=0.2,
+                 min_hits=1, velocity_smoothing=0.5, assignment="hungarian"):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.centroid_gate = centroid_gate
+        self.centroid_threshold = centroid_threshold
+        self.min_hits = min_hits
+        self.velocity_smoothing = velocity_smoothing
+        self.assignment = assignment
+        self._assign = optimal_assignment if assignment == "hungarian" else greedy_assignment
+
+        self.frame = 0
+        self._last_update = 0
+        self.next_id = 1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)     # last observed box
+        self.velocity = np.zeros((0, 4), dtype=np.float32)  # box change per frame
+        self.last_frame = np.zeros(0, dtype=np.int64)       # frame of the last observation
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.cls = np.zeros(0, dtype=np.int64)
+        self.conf = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predicted_boxes(self):
+        """Every track's box extrapolated to the current frame"""
+        elapsed = (self.frame - self.last_frame).astype(np.float32)[:, None]
+        return self.boxes + self.velocity * elapsed
+
+    def predict(self):
+        """Advance one frame without detections and return the predicted boxes of confirmed tracks.
+
+        Only tracks observed on the previous detection frame are reported, so
+        people who left the picture do not linger as predictions.
+        """
+        self.frame += 1
+        self._expire()
+        xyxy = self.predicted_boxes()
+        mask = (self.hits >= self.min_hits) & (self.last_frame == self._last_update)
+        return Detections(xyxy[mask], self.conf[mask], self.cls[mask], self.ids[mask])
+
+    def update(self, detections):
+        """Advance one frame with this frame's detections and return them with their ids filled in"""
+        self.frame += 1
+        self._last_update = self.frame
+        predicted = self.predicted_boxes()
+        same_class = self.cls[:, None] == detections.cls[None, :]
+
+        # Round one: overlap with the predicted boxes
+        score = iou_matrix(predicted, detections.xyxy)
+        score[~same_class] = 0
+        rows, cols = self._assign(score, self.iou_threshold)
+
+        # Round two: what is left, by center distance
+        free_rows = np.setdiff1d(np.arange(len(self.ids)), rows)
+        free_cols = np.setdiff1d(np.arange(len(detections)), cols)
+        if len(free_rows) and len(free_cols):
+            score = centroid_score(predicted[free_rows], detections.xyxy[free_cols], self.centroid_gate)
+            score[~same_class[np.ix_(free_rows, free_cols)]] = 0
+            extra_rows, extra_cols = self._assign(score, self.centroid_threshold)
+            rows = np.concatenate((rows, free_rows[extra_rows]))
+            cols = np.concatenate((cols, free_cols[extra_cols]))
+
+        # Matched tracks: blend the observed motion into the velocity
+        elapsed = (self.frame - self.last_frame[rows]).astype(np.float32)[:, None]
+        observed = (detections.xyxy[cols] - self.boxes[rows]) / np.maximum(elapsed, 1)
+        first_match = (self.hits[rows] == 1)[:, None]
+        alpha = self.velocity_smoothing
+        self.velocity[rows] = np.where(first_match, observed, alpha * observed + (1 - alpha) * self.velocity[rows])
+        self.boxes[rows] = detections.xyxy[cols]
+        self.last_frame[rows] = self.frame
+        self.hits[rows] += 1
+        self.conf[rows] = detections.conf[cols]
+
+        ids = np.full(len(detections), -1, dtype=np.int64)
+        ids[cols] = self.ids[rows]
+        # Tentative tracks (fewer than min_hits) are not reported yet
+        confirmed = np.zeros(len(detections), dtype=bool)
+        confirmed[cols] = self.hits[rows] >= self.min_hits
+        self._expire()
+
+        # Unmatched detections start new tracks
+        new = ids < 0
+        count = int(new.sum())
+        if count:
+            ids[new] = np.arange(self.next_id, self.next_id + count)
+            self.next_id += count
+            self.ids = np.concatenate((self.ids, ids[new]))
+            self.boxes = np.concatenate((self.boxes, detections.xyxy[new]))
+            self.velocity = np.concatenate((self.velocity, np.zeros((count, 4), dtype=np.float32)))
+            self.last_frame = np.concatenate((self.last_frame, np.full(count, self.frame, dtype=np.int64)))
+            self.hits = np.concatenate((self.hits, np.ones(count, dtype=np.int64)))
+            self.cls = np.concatenate((self.cls, detections.cls[new]))
+            self.conf = np.concatenate((self.conf, detections.conf[new]))
+            confirmed[new] = self.min_hits <= 1
+        ids[~confirmed] = -1
+        return Detections(detections.xyxy, detections.conf, detections.cls, ids)
+
+    def _expire(self):
+        """Drop tracks that have not been observed for max_age frames"""
+        alive = self.frame - self.last_frame <= self.max_age
+        if alive.all():
+            return
+        self.ids = self.ids[alive]
+        self.boxes = self.boxes[alive]
+        self.velocity = self.velocity[alive]
+        self.last_frame = self.last_frame[alive]
+        self.hits = self.hits[alive]
+        self.cls = self.cls[alive]
+        self.conf = self.conf[alive]
+
+    def reset(self):
+        self.__init__(self.iou_threshold, self.max_age, self.centroid_gate, self.centroid_threshold,
+                      self.min_hits, self.velocity_smoothing, self.assignment)
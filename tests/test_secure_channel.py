@@ -0,0 +1,156 @@
+import time
+import numpy as np
+import pytest
+from cryptography.exceptions import InvalidTag
+from metadata import METADATA_HEADER
+from protocol import MSG_COMMAND, MSG_FRAME, unpack_header
+from secure_channel import (
+    ClientHandshake, IdentityMismatch, KnownServers, StreamKeyring, StreamKeys, load_identity, public_bytes,
+    fingerprint, server_handshake
+)
+from security_client import SecurityClient
+from security_server import SecurityServer
+
+
+def handshake(identity, server_fingerprint=None):
+    """Run both sides of the key exchange; returns (client, server) cipher pairs"""
+    client = ClientHandshake(server_fingerprint)
+    reply, server_send, server_receive = server_handshake(identity, client.hello)
+    client_receive, client_send = client.finish(reply)
+    return (client_receive, client_send), (server_send, server_receive)
+
+
+def opened(cipher, message):
+    header, payload = message
+    return bytes(cipher.open(unpack_header(header), payload))
+
+
+@pytest.fixture
+def server():
+    server = SecurityServer(host="127.0.0.1", port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def connect(server, **kwargs):
+    client = SecurityClient(host="127.0.0.1", port=server.server_socket.getsockname()[1], video=True, **kwargs)
+    connected = client.connect()
+    return client, connected
+
+
+def test_changed_fingerprint_is_rejected():
+    identity = load_identity()
+    handshake(identity, fingerprint(public_bytes(identity)))
+    with pytest.raises(IdentityMismatch):
+        handshake(load_identity(), fingerprint(public_bytes(identity)))
+
+
+def test_first_server_is_pinned_and_a_changed_one_refused(server, tmp_path):
+    known_servers = str(tmp_path / "known_servers")
+    client, connected = connect(server, known_servers=known_servers)
+    client.stop()
+    assert connected
+    port = server.server_socket.getsockname()[1]
+    assert KnownServers(known_servers).lookup("127.0.0.1", port) == server.fingerprint
+
+    impostor = SecurityServer(host="127.0.0.1", port=0)
+    impostor.start()
+    try:
+        KnownServers(known_servers).remember("127.0.0.1", impostor.server_socket.getsockname()[1],
+                                             server.fingerprint)
+        client, connected = connect(impostor, known_servers=known_servers)
+        client.stop()
+        assert not connected
+    finally:
+        impostor.stop()
+
+
+def test_identity_survives_a_restart(tmp_path):
+    # A new identity per start would lock out every client that pinned the old one
+    path = str(tmp_path / "server_identity.pem")
+    first = SecurityServer(host="127.0.0.1", port=0, identity_path=path).fingerprint
+    restarted = SecurityServer(host="127.0.0.1", port=0, identity_path=path)
+    restarted.start()
+    try:
+        assert restarted.fingerprint == first
+        client, connected = connect(restarted, server_fingerprint=first, known_servers=None)
+        client.stop()
+        assert connected
+    finally:
+        restarted.stop()
+
+
+def test_replayed_command_is_refused():
+    (_, client_send), (_, server_receive) = handshake(load_identity())
+    command = client_send.seal_message(MSG_COMMAND, 1, b'{"action": "resync"}')
+    assert opened(server_receive, command) == b'{"action": "resync"}'
+    with pytest.raises(InvalidTag):
+        opened(server_receive, command)
+
+
+def test_tampered_header_fails_authentication():
+    (_, client_send), (_, server_receive) = handshake(load_identity())
+    header, payload = client_send.seal_message(MSG_COMMAND, 7, b"{}")
+    tampered = unpack_header(header)._replace(sequence=8)
+    with pytest.raises(InvalidTag):
+        server_receive.open(tampered, payload)
+
+
+def test_stream_messages_cannot_be_replayed_or_reordered():
+    keyring = StreamKeyring()
+    (client_receive, _), (server_send, _) = handshake(load_identity())
+    keys = StreamKeys()
+    keys.add(opened(client_receive, keyring.key_message(server_send)))
+    first = keyring.cipher.seal_message(MSG_FRAME, 1, b"first")
+    second = keyring.cipher.seal_message(MSG_FRAME, 2, b"second")
+    assert bytes(keys.open(unpack_header(second[0]), second[1])) == b"second"
+    for message in (first, second):
+        with pytest.raises(InvalidTag):
+            keys.open(unpack_header(message[0]), message[1])
+
+
+def test_stream_key_rotation():
+    keyring = StreamKeyring()
+    (client_receive, _), (server_send, _) = handshake(load_identity())
+    keys = StreamKeys()
+    keys.add(opened(client_receive, keyring.key_message(server_send)))
+    in_flight = keyring.cipher.seal_message(MSG_FRAME, 1, b"old")
+    replayable = keyring.cipher.seal_message(MSG_FRAME, 2, b"old again")
+
+    keyring.rotate()
+    keys.add(opened(client_receive, keyring.key_message(server_send)))
+    # Sealed before the rotation and still on its way: opens with the previous key
+    assert bytes(keys.open(unpack_header(in_flight[0]), in_flight[1])) == b"old"
+    fresh = keyring.cipher.seal_message(MSG_FRAME, 3, b"new")
+    assert bytes(keys.open(unpack_header(fresh[0]), fresh[1])) == b"new"
+    # Once the new key is in use the old one is gone
+    with pytest.raises(InvalidTag):
+        keys.open(unpack_header(replayable[0]), replayable[1])
+
+
+def test_stream_opens_in_send_order_across_rotations():
+    # Metadata is sent ahead of its frame, so it has to be sealed first for ordered stream keys
+    server = SecurityServer(host="127.0.0.1", port=0, stream_key_lifetime=0.2)
+    server.start()
+    client = None
+    try:
+        client, connected = connect(server, server_fingerprint=server.fingerprint, known_servers=None)
+        assert connected
+        frame = np.zeros((240, 320, 3), np.uint8)
+        metadata = METADATA_HEADER.pack(320, 240, 0)
+        frames = 30
+        for index in range(frames):
+            frame[:, index] = 255
+            server.broadcast_frame(frame, metadata=metadata)
+            time.sleep(0.03)
+        deadline = time.monotonic() + 5.0
+        while client.stats()["received"] < frames and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.keyring.rotations > 2
+        assert client.stats()["received"] == frames
+        assert client.last_metadata is not None and client.last_metadata[0] == frames
+    finally:
+        if client:
+            client.stop()
+        server.stop()